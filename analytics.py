@@ -0,0 +1,217 @@
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+import schedules_ai as sai
+
+NS_PER_HOUR = 3600 * 10**9
+INTERVAL_COLUMNS = ["start", "end", "hours"]
+
+
+def shift_bounds(df: pd.DataFrame):
+    starts = df["shift_start_datetime"].dt.as_unit("ns").astype("int64").to_numpy()
+    ends = df["shift_end_datetime"].dt.as_unit("ns").astype("int64").to_numpy()
+    return starts, ends
+
+
+def coverage_segments(
+    starts: np.ndarray,
+    ends: np.ndarray,
+    window_start: Optional[int] = None,
+    window_end: Optional[int] = None,
+):
+    # Split the timeline at every shift boundary and count the shifts covering
+    # each piece: +1 at every start, -1 at every end, then a cumulative sum.
+    # Returns the non-empty pieces as (start, end, depth) arrays.
+    if window_start is not None:
+        starts = np.maximum(starts, window_start)
+        ends = np.maximum(ends, window_start)
+    if window_end is not None:
+        starts = np.minimum(starts, window_end)
+        ends = np.minimum(ends, window_end)
+
+    times = np.concatenate([starts, ends])
+    deltas = np.concatenate(
+        [np.ones(len(starts), dtype=np.int64), -np.ones(len(ends), dtype=np.int64)]
+    )
+    # Edges of the analysed range, so leading and trailing gaps are counted
+    edges = [t for t in (window_start, window_end) if t is not None]
+    if edges:
+        times = np.concatenate([times, edges])
+        deltas = np.concatenate([deltas, np.zeros(len(edges), dtype=np.int64)])
+
+    # Ends sort before starts at the same instant
+    order = np.lexsort((deltas, times))
+    times = times[order]
+    depth = np.cumsum(deltas[order])
+
+    seg_start, seg_end, seg_depth = times[:-1], times[1:], depth[:-1]
+    nonempty = seg_end > seg_start
+    return seg_start[nonempty], seg_end[nonempty], seg_depth[nonempty]
+
+
+def merge_runs(seg_start, seg_end, selected) -> tuple:
+    # Join consecutive selected pieces; the pieces tile the timeline, so
+    # consecutive pieces always touch
+    if not selected.any():
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    edges = np.diff(np.concatenate([[False], selected, [False]]).astype(np.int8))
+    first = np.flatnonzero(edges == 1)
+    last = np.flatnonzero(edges == -1) - 1
+    return seg_start[first], seg_end[last]
+
+
+def intervals_frame(starts, ends, timezone) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "start": pd.to_datetime(starts, utc=True).tz_convert(timezone),
+            "end": pd.to_datetime(ends, utc=True).tz_convert(timezone),
+            "hours": (ends - starts) / NS_PER_HOUR,
+        },
+        columns=INTERVAL_COLUMNS,
+    )
+
+
+def frame_timezone(df: pd.DataFrame):
+    return df["shift_start_datetime"].dt.tz
+
+
+def coverage_gaps(
+    df: pd.DataFrame,
+    window_start: Optional[pd.Timestamp] = None,
+    window_end: Optional[pd.Timestamp] = None,
+) -> pd.DataFrame:
+    # Intervals nobody is on call, between the first and last shift or within
+    # the window when one is given
+    if df.empty:
+        return pd.DataFrame(columns=INTERVAL_COLUMNS)
+    starts, ends = shift_bounds(df)
+    seg_start, seg_end, depth = coverage_segments(
+        starts,
+        ends,
+        None if window_start is None else window_start.value,
+        None if window_end is None else window_end.value,
+    )
+    gap_start, gap_end = merge_runs(seg_start, seg_end, depth == 0)
+    return intervals_frame(gap_start, gap_end, frame_timezone(df))
+
+
+def double_coverage(df: pd.DataFrame) -> pd.DataFrame:
+    # Intervals where more than one shift is in progress, with the most
+    # shifts in progress at once during each
+    if df.empty:
+        return pd.DataFrame(columns=INTERVAL_COLUMNS + ["max_on_call"])
+    starts, ends = shift_bounds(df)
+    seg_start, seg_end, depth = coverage_segments(starts, ends)
+    overlapping = depth >= 2
+    run_start, run_end = merge_runs(seg_start, seg_end, overlapping)
+
+    overlaps = intervals_frame(run_start, run_end, frame_timezone(df))
+    # Each overlapping piece belongs to the run that starts at or before it
+    run = np.searchsorted(run_start, seg_start[overlapping], side="right") - 1
+    max_depth = np.zeros(len(run_start), dtype=np.int64)
+    np.maximum.at(max_depth, run, depth[overlapping])
+    overlaps["max_on_call"] = max_depth
+    return overlaps
+
+
+def week_bounds(first: int, last: int, timezone) -> tuple:
+    # Local Monday 00:00 boundaries (epoch ns) from the week containing
+    # `first` through the one after the week containing `last`, with the
+    # date of each Monday
+    local = pd.to_datetime([first, last], utc=True).tz_convert(timezone)
+    mondays = local.tz_localize(None).normalize() - pd.to_timedelta(
+        local.weekday, unit="D"
+    )
+    naive = pd.date_range(mondays[0], mondays[1] + pd.Timedelta(days=7), freq="7D")
+    seconds = sai.localize_wall_times(str(timezone), naive.values)
+    return seconds * 10**9, naive.date
+
+
+def split_by_week(starts, ends, bounds):
+    # Cut each non-empty interval at the week boundaries. Returns, per piece,
+    # the interval it came from, its week and its length in ns.
+    first = np.searchsorted(bounds, starts, side="right") - 1
+    last = np.searchsorted(bounds, ends, side="left") - 1
+    counts = last - first + 1
+    interval = np.repeat(np.arange(len(starts)), counts)
+    offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    week = first[interval] + offset
+    piece_start = np.maximum(starts[interval], bounds[week])
+    piece_end = np.minimum(ends[interval], bounds[week + 1])
+    return interval, week, piece_end - piece_start
+
+
+def weekly_load(
+    final_df: pd.DataFrame,
+    shifts_df: pd.DataFrame,
+    window_start: Optional[pd.Timestamp] = None,
+    window_end: Optional[pd.Timestamp] = None,
+) -> pd.DataFrame:
+    # Per user and week (from Monday 00:00 local time): hours actually on
+    # call in the final timeline, and shifts started in the layers' own
+    # schedules, before later layers override them. Intervals spanning weeks
+    # are split between them, and with a window only the part inside counts.
+    columns = ["week", "user", "hours", "shifts"]
+    if final_df.empty and shifts_df.empty:
+        return pd.DataFrame(columns=columns)
+    frame = final_df if not final_df.empty else shifts_df
+    timezone = frame_timezone(frame)
+
+    starts, ends = shift_bounds(final_df)
+    if window_start is not None:
+        starts = np.maximum(starts, window_start.value)
+        ends = np.maximum(ends, window_start.value)
+    if window_end is not None:
+        starts = np.minimum(starts, window_end.value)
+        ends = np.minimum(ends, window_end.value)
+    on_call = ends > starts
+    starts, ends = starts[on_call], ends[on_call]
+    on_call_users = final_df["user"].astype(str).to_numpy()[on_call]
+
+    shift_starts, _ = shift_bounds(shifts_df)
+    started = np.ones(len(shift_starts), dtype=bool)
+    if window_start is not None:
+        started &= shift_starts >= window_start.value
+    if window_end is not None:
+        started &= shift_starts < window_end.value
+    shift_starts = shift_starts[started]
+    shift_users = shifts_df["user"].astype(str).to_numpy()[started]
+
+    times = np.concatenate([starts, ends, shift_starts])
+    if not len(times):
+        return pd.DataFrame(columns=columns)
+    bounds, mondays = week_bounds(times.min(), times.max(), timezone)
+
+    interval, week, length = split_by_week(starts, ends, bounds)
+    hours = pd.DataFrame(
+        {
+            "week": mondays[week],
+            "user": on_call_users[interval],
+            "hours": length / NS_PER_HOUR,
+        }
+    )
+    shift_weeks = np.searchsorted(bounds, shift_starts, side="right") - 1
+    shifts = pd.DataFrame({"week": mondays[shift_weeks], "user": shift_users})
+
+    load = pd.merge(
+        hours.groupby(["week", "user"]).agg(hours=("hours", "sum")),
+        shifts.groupby(["week", "user"]).agg(shifts=("user", "size")),
+        how="outer",
+        left_index=True,
+        right_index=True,
+    )
+    load = load.fillna(0).astype({"shifts": np.int64}).sort_index()
+    return load.reset_index()[columns]
+
+
+def summarize(gaps: pd.DataFrame, overlaps: pd.DataFrame) -> dict:
+    return {
+        "gaps": len(gaps),
+        "gap_hours": float(gaps["hours"].sum()),
+        "longest_gap_hours": float(gaps["hours"].max()) if len(gaps) else 0.0,
+        "overlaps": len(overlaps),
+        "overlap_hours": float(overlaps["hours"].sum()),
+    }
@@ -1,131 +1,343 @@
-from datetime import timedelta
-from typing import List
+import asyncio
+import os
+import threading
+import uuid
+from typing import TYPE_CHECKING
 
-import pandas as pd
-import pytz
 import streamlit as st
 from dotenv import load_dotenv
-from langchain.output_parsers import OutputFixingParser, PydanticOutputParser
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.pydantic_v1 import BaseModel, Field
-from langchain_openai import ChatOpenAI
 
+import fast_parser
 import pd_timezones
 import schedules_ai as sai
-from calendar_1 import dataframe_to_html_calendar
-from system_prompts import SYSTEM_MESSAGE
+from history import compact_history, get_encoding
+from instrumentation import recorder, span, timed_import, trace
+from llm_chain import Response, ainvoke_llm
+from session_store import SessionStore
+from shifts import (
+    HORIZON_WEEKS,
+    columns_to_df,
+    expand_layers,
+    flatten_columns,
+    horizon_bounds,
+)
+from system_prompts import (
+    ADD_ANOTHER_MESSAGE,
+    CONFIRMATION_MESSAGE,
+    INITIAL_GREETING,
+    SYSTEM_MESSAGE,
+    VALIDATED_MESSAGE_PREFIX,
+)
+
+if TYPE_CHECKING:
+    import pagerduty
 
 load_dotenv()
-llm = ChatOpenAI(
-    model="gpt-3.5-turbo", model_kwargs={"response_format": {"type": "json_object"}}
+# Imported in the background after the first page is sent; pandas, LangChain
+# and the OpenAI client are only needed once a schedule is being built
+WARMUP_MODULES = (
+    "pandas",
+    "calendar_1",
+    "analytics",
+    "langchain_openai",
+    "langchain.output_parsers",
+    "langchain_core.prompts",
+    "response_repair",
+    "pagerduty",
 )
 
-
-class Response(BaseModel):
-    message: str = Field(description="The response message.")
-    schedule_layers: List[sai.ScheduleLayers] | None = Field(
-        default=[],
-        description="list of ScheduleLayer objects",
-    )
+# Session state kept in the session store between reruns rather than in
+# st.session_state
+SESSION_KEYS = (
+    "config",
+    "timezone",
+    "schedule_name",
+    "schedule_config",
+    "config_submitted",
+    "messages",
+    "schedule_layers",
+)
 
 
-def invoke_llm(user_input: str, message_history: list) -> Response:
-    parser = PydanticOutputParser(pydantic_object=Response)
-    fix_parser = OutputFixingParser.from_llm(parser=parser, llm=llm)  # type: ignore
-    format_instructions = f"Format instructions: {parser.get_format_instructions()}."
-    system_message = message_history[0].content + format_instructions.replace(
-        "{", "{{"
-    ).replace("}", "}}")
-    prompt_messages = (
-        [SystemMessage(content=system_message)]
-        + message_history[1:]
-        + [HumanMessage(content=user_input)]
+def stream_llm(user_input: str, message_history: list, placeholder) -> Response:
+    # A new submission makes Streamlit stop this run at the next placeholder
+    # update, which unwinds the event loop and closes the pending stream.
+    # ainvoke_llm updates the placeholder after every chunk, so the stream
+    # stops even while the schedule layers are still arriving.
+    return asyncio.run(
+        ainvoke_llm(user_input, message_history, on_message=placeholder.markdown)
     )
-    prompt = ChatPromptTemplate.from_messages(prompt_messages)
 
-    response = (prompt | llm | fix_parser).invoke({})
 
-    return response
+def transform_schedule_to_df(
+    layers, timezone, weeks=HORIZON_WEEKS, window=None, flatten=False
+):
+    # With a window, only the shifts overlapping it are expanded. With flatten,
+    # later layers override earlier ones, giving the final on-call timeline.
+    layers = [layer for layer in layers if isinstance(layer, sai.ScheduleLayers)]
+    with span("transform_schedule_to_df", layers=len(layers), weeks=weeks) as attrs:
+        columns = expand_layers(layers, weeks, window)
+        if flatten:
+            columns = flatten_columns(columns)
+        df = columns_to_df(columns, timezone)
+        attrs["shifts"] = len(df)
+    return df
+
+
+def calendar_months(layers, timezone, weeks=HORIZON_WEEKS) -> dict:
+    # First of every month the schedule reaches into, keyed by "YYYY-MM"
+    pd = timed_import("pandas")
+    calendar_1 = timed_import("calendar_1")
+    layers = [layer for layer in layers if isinstance(layer, sai.ScheduleLayers)]
+    bounds = horizon_bounds(layers, weeks)
+    if bounds is None:
+        return {}
+    first, last = (pd.Timestamp(t).tz_convert(timezone) for t in bounds)
+    return {f"{m:%Y-%m}": m for m in calendar_1.month_range(first.normalize(), last)}
+
+
+def render_calendar(shifts_df, timezone, months=None) -> str:
+    calendar_1 = timed_import("calendar_1")
+    with span("dataframe_to_html_calendar", shifts=len(shifts_df)) as attrs:
+        html_calendar = calendar_1.dataframe_to_html_calendar(
+            shifts_df, timezone, months
+        )
+        attrs["html_bytes"] = len(html_calendar)
+    return html_calendar
 
 
-def transform_schedule_to_df(layers, timezone):
-    data = []
-    for layer in layers:
-        if isinstance(layer, sai.ScheduleLayers):
-            user_sequence = [user.user_name for user in layer.users]
-            restrictions = layer.restrictions
+def render_calendar_page(schedule_layers, timezone):
+    # Only the months on screen are expanded and rendered, so the cost of a
+    # rerun doesn't grow with the horizon
+    pd = timed_import("pandas")
+    weeks = st.number_input(
+        "Horizon (weeks)", min_value=1, max_value=520, value=HORIZON_WEEKS
+    )
+    months = calendar_months(schedule_layers, timezone, weeks)
+    if not months:
+        return
 
-            current_date = layer.start
-            end_date = current_date + timedelta(weeks=52)
-            user_index = 0
+    month_col, count_col = st.columns([0.7, 0.3])
+    first_key = month_col.selectbox(
+        "Month", options=list(months), format_func=lambda k: f"{months[k]:%B %Y}"
+    )
+    num_months = count_col.number_input(
+        "Months shown", min_value=1, max_value=12, value=2
+    )
+    final = st.checkbox(
+        "Final schedule (later layers override earlier ones)", value=True
+    )
+    keys = list(months)
+    shown = [months[k] for k in keys[keys.index(first_key) :][:num_months]]
+    window = (shown[0], shown[-1] + pd.DateOffset(months=1))
+
+    calendar_tab, analytics_tab = st.tabs(["Calendar", "Coverage and load"])
+    with calendar_tab:
+        shifts_df = transform_schedule_to_df(
+            schedule_layers, timezone, weeks, window, flatten=final
+        )
+        if not shifts_df.empty:
+            # Convert to HTML
+            html_calendar = render_calendar(shifts_df, timezone, shown)
+            # Display the HTML calendar in Streamlit
+            st.markdown(html_calendar, unsafe_allow_html=True)
+    with analytics_tab:
+        whole_horizon = st.checkbox("Analyse the whole horizon", value=False)
+        render_analytics(
+            schedule_layers, timezone, weeks, None if whole_horizon else window
+        )
 
-            tz = pytz.timezone(timezone)
 
-            while current_date <= end_date:
-                for restriction in restrictions:
-                    if current_date.isoweekday() == restriction.start_day_of_week:
-                        shift_start_time = current_date
-                        shift_end_time = shift_start_time + timedelta(
-                            seconds=restriction.duration_seconds
-                        )
+def render_analytics(schedule_layers, timezone, weeks, window):
+    analytics = timed_import("analytics")
+    with span("analytics", weeks=weeks, windowed=window is not None) as attrs:
+        shifts_df = transform_schedule_to_df(schedule_layers, timezone, weeks, window)
+        if shifts_df.empty:
+            st.write("No shifts in this period.")
+            return
+        final_df = transform_schedule_to_df(
+            schedule_layers, timezone, weeks, window, flatten=True
+        )
+        window_start, window_end = window or (None, None)
+        gaps = analytics.coverage_gaps(shifts_df, window_start, window_end)
+        overlaps = analytics.double_coverage(shifts_df)
+        # Hours count who is actually paged, after layer precedence
+        load = analytics.weekly_load(final_df, shifts_df, window_start, window_end)
+        attrs["shifts"] = len(shifts_df)
+
+    summary = analytics.summarize(gaps, overlaps)
+    gap_col, overlap_col = st.columns(2)
+    gap_col.metric("Uncovered hours", f"{summary['gap_hours']:.1f}")
+    gap_col.caption(
+        f"{summary['gaps']} gaps, longest {summary['longest_gap_hours']:.1f} h"
+    )
+    overlap_col.metric("Double-covered hours", f"{summary['overlap_hours']:.1f}")
+    overlap_col.caption(f"{summary['overlaps']} overlapping intervals")
 
-                        data.append(
-                            {
-                                "user": user_sequence[user_index],
-                                "shift_start_datetime": shift_start_time.astimezone(tz),
-                                "shift_end_datetime": shift_end_time.astimezone(tz),
-                                "shift_duration": shift_end_time - shift_start_time,
-                            }
-                        )
+    st.write("**Hours on call per user per week**")
+    st.dataframe(
+        load.pivot_table(index="user", columns="week", values="hours", fill_value=0)
+    )
+    st.write("**Shifts per user per week**")
+    st.dataframe(
+        load.pivot_table(index="user", columns="week", values="shifts", fill_value=0)
+    )
+    st.write("**Uncovered intervals**")
+    st.dataframe(gaps)
+    st.write("**Double-covered intervals**")
+    st.dataframe(overlaps)
+
+
+def render_debug_panel():
+    st.subheader("Debug")
+    # Only this session's spans; the recorder is shared by every session
+    session_id = st.session_state.session_id
+    totals = recorder.totals(session_id)
+    if totals:
+        st.write("**Time per stage**")
+        st.dataframe([{"stage": name, **total} for name, total in totals.items()])
+    st.write("**Recent spans**")
+    spans = recorder.session_spans(session_id)
+    st.dataframe([recorded.as_dict() for recorded in reversed(spans)])
+    st.write("**Fast path**", fast_parser.stats.as_dict())
+    # Imported lazily like the rest of the parser, usually by the warm-up
+    response_repair = timed_import("response_repair")
+    st.write("**Response repair**", response_repair.stats.as_dict())
+    st.download_button(
+        "Download spans (JSON lines)",
+        data=recorder.to_jsonl(session_id),
+        file_name="spans.jsonl",
+        mime="application/x-ndjson",
+    )
+    if st.button("Clear spans"):
+        recorder.clear(session_id)
 
-                        if restriction.type == "daily_restriction":
-                            user_index = (user_index + 1) % len(user_sequence)
-                if (
-                    restriction.type == "weekly_restriction"
-                    and current_date.weekday() == 6
-                ):  # End of the week
-                    user_index = (user_index + 1) % len(user_sequence)
 
-                current_date += timedelta(days=1)
+async def submit_schedule(layers: list) -> "pagerduty.SubmitResult":
+    # PagerDuty wants user IDs, so the names are looked up first
+    pagerduty = timed_import("pagerduty")
+    async with pagerduty.PagerDutyClient.from_env() as client:
+        user_ids = await client.resolve_user_ids(pagerduty.layer_user_names(layers))
+        payload = pagerduty.build_schedule_payload(
+            st.session_state.schedule_config, layers, user_ids
+        )
+        return await client.submit(payload)
+
+
+def render_submit_button():
+    if not st.button("Create schedule in PagerDuty"):
+        return
+    layers = [
+        layer
+        for layer in st.session_state.schedule_layers
+        if isinstance(layer, sai.ScheduleLayers)
+    ]
+    with span("pagerduty.submit", layers=len(layers)) as attrs:
+        try:
+            result = asyncio.run(submit_schedule(layers))
+        except ValueError as e:
+            # No API key, or users PagerDuty doesn't know
+            attrs["status"] = "invalid"
+            st.error(f"The schedule can't be created in PagerDuty: {e}")
+            return
+        attrs["status"] = result.status
+    if result.ok:
+        st.success(f"Schedule {result.schedule_id} {result.status} in PagerDuty.")
+    else:
+        st.error(f"PagerDuty did not accept the schedule: {result.error}")
 
-    if not data:  # If no data was added, return an empty DataFrame
-        return pd.DataFrame()
 
-    df = pd.DataFrame(data)
-    df_sorted = df.sort_values(by=["shift_start_datetime"])
-    return df_sorted
+def process_user_input(user_input):
+    with trace():
+        handle_user_input(user_input)
 
 
-def process_user_input(user_input):
+def handle_user_input(user_input):
     st.session_state.messages.append(HumanMessage(content=user_input))
     st.chat_message("user").write(user_input)
-    confirmation = "One moment while I attempt to create the schedule layers please"
-    st.chat_message("assistant").write(confirmation)
-    st.session_state.messages.append(AIMessage(content=confirmation))
-    response = invoke_llm(user_input, st.session_state.messages)
+    st.chat_message("assistant").write(CONFIRMATION_MESSAGE)
+    st.session_state.messages.append(AIMessage(content=CONFIRMATION_MESSAGE))
+    history = compact_history(
+        st.session_state.messages,
+        st.session_state.schedule_layers,
+        pending_input=user_input,
+    )
+    placeholder = st.chat_message("assistant").empty()
+    response = stream_llm(user_input, history, placeholder)
 
     if "Success" in response.message:
         st.session_state.schedule_layers.extend(response.schedule_layers)
-        validated = (
-            "Here is the list of validated schedule layer objects: "
-            f"{st.session_state.schedule_layers}"
-        )
-        st.chat_message("assistant").write(validated)
+        validated = VALIDATED_MESSAGE_PREFIX + f"{st.session_state.schedule_layers}"
+        placeholder.write(validated)
         st.session_state.messages.append(AIMessage(content=validated))
-        add_another = (
-            "⏰ To add another group to the schedule, please tell me about "
-            "the group and describe their shifts below."
-        )
-        st.chat_message("assistant").write(add_another)
-        st.session_state.messages.append(AIMessage(content=add_another))
+        st.chat_message("assistant").write(ADD_ANOTHER_MESSAGE)
+        st.session_state.messages.append(AIMessage(content=ADD_ANOTHER_MESSAGE))
     else:
         st.session_state.messages.append(AIMessage(content=response.message))
-        st.chat_message("assistant").write(response.message)
+
+
+@st.cache_resource
+def get_session_store() -> SessionStore:
+    # Shared by every session and kept across reruns, which re-execute this
+    # script
+    return SessionStore.from_env()
+
+
+def restore_session():
+    # The session id is kept in the URL, so a reload or a server restart
+    # picks the conversation back up
+    session_store = get_session_store()
+    session_id = st.query_params.get("session")
+    if not session_store.valid_id(session_id):
+        session_id = uuid.uuid4().hex
+        st.query_params["session"] = session_id
+    st.session_state.session_id = session_id
+    for key, value in (session_store.load(session_id) or {}).items():
+        if key in SESSION_KEYS and key not in st.session_state:
+            st.session_state[key] = value
+
+
+def persist_session():
+    state = {
+        key: st.session_state[key] for key in SESSION_KEYS if key in st.session_state
+    }
+    get_session_store().save(st.session_state.session_id, state)
+    # Hot sessions stay cached in the store; idle ones are evicted from memory
+    for key in SESSION_KEYS:
+        st.session_state.pop(key, None)
+
+
+@st.cache_resource
+def start_warmup() -> threading.Thread:
+    # Once per process, so later tabs and the first LLM call rarely wait on
+    # imports. The import spans show up in the debug panel.
+    def warm_up():
+        for name in WARMUP_MODULES:
+            timed_import(name)
+        # tiktoken is optional, and its vocabulary may need downloading
+        with span("warmup.token_encoding"):
+            get_encoding()
+
+    thread = threading.Thread(target=warm_up, name="warmup", daemon=True)
+    thread.start()
+    return thread
 
 
 def main():
     st.set_page_config(page_title="Schedule Config", layout="wide")
+    restore_session()
+    try:
+        with recorder.session(st.session_state.session_id):
+            render_app()
+    finally:
+        persist_session()
+    # Started after the page has been sent, so it doesn't delay the first paint
+    if os.getenv("SCHEDULE_WARMUP", "1") != "0":
+        start_warmup()
+
+
+def render_app():
     st.title("Configure Your Schedule Rotation 🗓️")
 
     if "config" not in st.session_state:
@@ -143,6 +355,7 @@ def main():
         st.session_state.schedule_layers = []
 
     st.session_state.json_complete = False
+    show_debug = os.getenv("SCHEDULE_DEBUG") or st.sidebar.checkbox("Show debug panel")
     schedule_info, schedule_rotation = st.tabs(["Schedule Info", "Schedule Rotation"])
 
     with schedule_info:
@@ -167,6 +380,7 @@ def main():
                 "Otherwise, please proceed to the Schedule Rotation tab."
             )
             st.session_state.timezone = timezone
+            st.session_state.schedule_config = config_obj
             st.session_state.schedule_name = name
             st.session_state.config_submitted = True
 
@@ -183,13 +397,8 @@ def main():
 
                 # Initial greeting if no messages exist
                 if len(st.session_state.messages) == 1:  # Only system messages
-                    initial_greeting = (
-                        "Hello 👋, I am the PagerDuty schedule bot! "
-                        "Please tell me about the first group, "
-                        "and the shifts they work."
-                    )
                     st.session_state.messages.append(
-                        AIMessage(content=initial_greeting)
+                        AIMessage(content=INITIAL_GREETING)
                     )
 
                 with messages:
@@ -206,15 +415,16 @@ def main():
                 st.subheader("Schedule Information")
                 st.write(f"**Schedule Name:** {st.session_state.schedule_name}")
                 st.write(f"**Timezone:** {st.session_state.timezone}")
-                schedule_layers = st.session_state.schedule_layers
-                sch_timezone = st.session_state.timezone
-                shifts_df = transform_schedule_to_df(schedule_layers, sch_timezone)
-
-                if not shifts_df.empty:
-                    # Convert to HTML
-                    html_calendar = dataframe_to_html_calendar(shifts_df, sch_timezone)
-                    # Display the HTML calendar in Streamlit
-                    st.markdown(html_calendar, unsafe_allow_html=True)
+                render_calendar_page(
+                    st.session_state.schedule_layers, st.session_state.timezone
+                )
+                if st.session_state.schedule_layers and os.getenv("PAGERDUTY_API_KEY"):
+                    render_submit_button()
+
+    # Rendered last so it includes the spans recorded during this run
+    if show_debug:
+        with st.sidebar:
+            render_debug_panel()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,246 @@
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterator, NamedTuple, Optional, Tuple
+
+import openai
+from langchain_core.messages import SystemMessage
+
+import example_inputs
+from llm_chain import invoke_llm
+from system_prompts import SYSTEM_MESSAGE
+
+TEXT_FIELDS = ("description", "body", "input", "text")
+ID_FIELDS = ("id", "request_id", "name")
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+    openai.RateLimitError,
+)
+
+
+class RateLimiter:
+    # Token bucket shared by every worker: `rate` calls per second on average
+    # with bursts of up to `burst` calls.
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                elapsed = now - self.updated_at
+                self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_seconds = (1 - self.tokens) / self.rate
+            time.sleep(wait_seconds)
+
+
+class Description(NamedTuple):
+    record_id: str
+    text: Optional[str]
+    # Why the input line couldn't be read; such lines go to the failures
+    error: Optional[str] = None
+
+
+def parse_description(line_number: int, line: str) -> Description:
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError as e:
+        return Description(str(line_number), None, f"invalid JSON: {e}")
+    if isinstance(record, str):
+        return Description(str(line_number), record)
+    if not isinstance(record, dict):
+        return Description(str(line_number), None, "not a string or an object")
+    record_id = next((record[k] for k in ID_FIELDS if k in record), None)
+    record_id = str(record_id or line_number)
+    text = next((record[k] for k in TEXT_FIELDS if record.get(k)), None)
+    if not isinstance(text, str):
+        return Description(record_id, None, f"none of {TEXT_FIELDS} is a string")
+    return Description(record_id, text)
+
+
+def read_descriptions(path: str) -> Iterator[Description]:
+    with open(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            if line.strip():
+                yield parse_description(line_number, line)
+
+
+def example_descriptions() -> Iterator[Description]:
+    for name, value in vars(example_inputs).items():
+        if name.startswith("example_") and isinstance(value, str):
+            yield Description(name, value)
+
+
+def process_description(
+    record_id: str,
+    description: str,
+    limiter: RateLimiter,
+    retries: int,
+    backoff_seconds: float,
+) -> dict:
+    history = [SystemMessage(content=SYSTEM_MESSAGE)]
+    for attempt in range(retries + 1):
+        limiter.acquire()
+        try:
+            response = invoke_llm(description, history)
+        except RETRYABLE_ERRORS as e:
+            if attempt == retries:
+                return {"id": record_id, "ok": False, "error": repr(e)}
+            # Exponential backoff with jitter so workers don't retry in lockstep
+            time.sleep(backoff_seconds * 2**attempt * (1 + random.random()))
+        except Exception as e:
+            return {"id": record_id, "ok": False, "error": repr(e)}
+        else:
+            if "Success" not in response.message or not response.schedule_layers:
+                return {"id": record_id, "ok": False, "message": response.message}
+            return {
+                "id": record_id,
+                "ok": True,
+                "message": response.message,
+                "schedule_layers": [
+                    json.loads(layer.json()) for layer in response.schedule_layers
+                ],
+            }
+
+
+def run_batch(
+    descriptions: Iterator[Description],
+    results_file,
+    failures_file,
+    concurrency: int = 4,
+    rate: float = 2.0,
+    retries: int = 3,
+    backoff_seconds: float = 1.0,
+) -> Tuple[int, int]:
+    limiter = RateLimiter(rate, burst=concurrency)
+    succeeded = failed = 0
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = set()
+
+        def write(result):
+            nonlocal succeeded, failed
+            out = results_file if result["ok"] else failures_file
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            if result["ok"]:
+                succeeded += 1
+            else:
+                failed += 1
+
+        def drain(return_when):
+            nonlocal pending
+            done, pending = wait(pending, return_when=return_when)
+            for future in done:
+                write(future.result())
+
+        try:
+            for description in descriptions:
+                if description.error is not None:
+                    # An unreadable line fails on its own; the rest still run
+                    write(
+                        {
+                            "id": description.record_id,
+                            "ok": False,
+                            "error": description.error,
+                        }
+                    )
+                    continue
+                # Keep a bounded number of descriptions in flight
+                if len(pending) >= concurrency * 2:
+                    drain(FIRST_COMPLETED)
+                pending.add(
+                    executor.submit(
+                        process_description,
+                        description.record_id,
+                        description.text,
+                        limiter,
+                        retries,
+                        backoff_seconds,
+                    )
+                )
+        finally:
+            # Results already computed are written even if reading the input
+            # fails part way
+            while pending:
+                drain(FIRST_COMPLETED)
+
+    return succeeded, failed
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description="Turn rotation descriptions into validated schedule layers."
+    )
+    arg_parser.add_argument(
+        "input",
+        nargs="?",
+        help="JSONL file of descriptions (strings or objects with a "
+        f"{'/'.join(TEXT_FIELDS)} field)",
+    )
+    arg_parser.add_argument(
+        "--examples", action="store_true", help="run the inputs in example_inputs.py"
+    )
+    arg_parser.add_argument("--output", default="-", help="results JSONL, - for stdout")
+    arg_parser.add_argument("--failures", default="-", help="failures JSONL")
+    arg_parser.add_argument("--concurrency", type=int, default=4)
+    arg_parser.add_argument(
+        "--rate", type=float, default=2.0, help="max LLM calls per second"
+    )
+    arg_parser.add_argument("--retries", type=int, default=3)
+    arg_parser.add_argument("--backoff", type=float, default=1.0)
+    args = arg_parser.parse_args(argv)
+
+    if args.examples:
+        descriptions = example_descriptions()
+    elif args.input:
+        descriptions = read_descriptions(args.input)
+    else:
+        arg_parser.error("an input file or --examples is required")
+    # Opening the same file twice for writing would interleave and truncate
+    # the two streams; stdout is shared on purpose
+    if args.output != "-" and os.path.realpath(args.output) == os.path.realpath(
+        args.failures
+    ):
+        arg_parser.error("--output and --failures must be different files")
+
+    results_file = sys.stdout if args.output == "-" else open(args.output, "w")
+    failures_file = sys.stdout if args.failures == "-" else open(args.failures, "w")
+    try:
+        succeeded, failed = run_batch(
+            descriptions,
+            results_file,
+            failures_file,
+            concurrency=args.concurrency,
+            rate=args.rate,
+            retries=args.retries,
+            backoff_seconds=args.backoff,
+        )
+    finally:
+        for f in (results_file, failures_file):
+            if f is not sys.stdout:
+                f.close()
+
+    print(f"{succeeded} succeeded, {failed} failed", file=sys.stderr)
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+import argparse
+import gc
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime as dt
+from datetime import timedelta, timezone
+
+import calendar_1
+import pd_timezones
+import schedules_ai as sai
+from shifts import columns_to_df, expand_layers, flatten_columns
+
+SCENARIOS = {
+    "small": {"layers": 5, "users": 5, "weeks": 52},
+    "many_layers": {"layers": 100, "users": 8, "weeks": 52},
+    "large_teams": {"layers": 10, "users": 500, "weeks": 52},
+    "long_horizon": {"layers": 20, "users": 10, "weeks": 520},
+}
+# Modules whose import a new app worker pays before its first page
+COLD_START_MODULES = ("app",)
+
+# ScheduleLayers.timezone only accepts word characters and slashes
+LAYER_TIMEZONES = [tz for tz in pd_timezones.timezones if re.fullmatch(r"[\w/]+", tz)]
+
+
+def make_layer_values(rng: random.Random, users: int, index: int) -> dict:
+    tz_name = rng.choice(LAYER_TIMEZONES)
+    tz = pd_timezones.get_tz(tz_name)
+    start = dt.now(timezone.utc).astimezone(tz) + timedelta(days=rng.randint(2, 30))
+    everyday = index % 5 == 0
+    restriction_type = rng.choice(["daily_restriction", "weekly_restriction"])
+    days = [1] if everyday else sorted(rng.sample(range(1, 8), rng.randint(1, 5)))
+    hour = rng.randint(0, 23)
+    return {
+        "timezone": tz_name,
+        "num_shifts": rng.randint(1, 4),
+        "start": start.isoformat(),
+        "rotation_virtual_start": start.isoformat(),
+        "rotation_turn_length_seconds": (
+            86400 if restriction_type == "daily_restriction" else 604800
+        ),
+        "users": [
+            {"user_name": f"user-{index}-{i}", "type": "user_reference"}
+            for i in range(users)
+        ],
+        "restrictions": [
+            {
+                "type": restriction_type,
+                "start_time_of_day": f"{hour:02d}:00:00",
+                "duration_seconds": rng.choice([3600, 8 * 3600, 12 * 3600, 86400]),
+                "start_day_of_week": day,
+            }
+            for day in days
+        ],
+        "everyday": everyday,
+    }
+
+
+def make_schedule(layers: int, users: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    return [make_layer_values(rng, users, i) for i in range(layers)]
+
+
+def measure(fn, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": min(timings), "peak_bytes": peak}
+
+
+def run_scenario(name: str, layers: int, users: int, weeks: int, repeat: int):
+    values = make_schedule(layers, users)
+    schedule_layers = [sai.ScheduleLayers(**v) for v in values]
+    schedule_tz = "Etc/UTC"
+    columns = expand_layers(schedule_layers, weeks)
+    df = columns_to_df(columns, schedule_tz)
+    probe = schedule_layers[0].start + timedelta(weeks=weeks // 2)
+
+    def render_cold():
+        calendar_1._month_cache.clear()
+        calendar_1.dataframe_to_html_calendar(df.copy(), schedule_tz)
+
+    def render_warm():
+        calendar_1.dataframe_to_html_calendar(df.copy(), schedule_tz)
+
+    stages = {
+        "validation": lambda: [sai.ScheduleLayers(**v) for v in values],
+        "expansion": lambda: expand_layers(schedule_layers, weeks),
+        "dataframe": lambda: columns_to_df(columns, schedule_tz),
+        "flatten": lambda: flatten_columns(columns),
+        "render_cold": render_cold,
+        "render_warm": render_warm,
+        "on_call_lookup": lambda: [
+            layer.on_call_at(probe) for layer in schedule_layers
+        ],
+    }
+    results = {}
+    for stage, fn in stages.items():
+        results[stage] = measure(fn, repeat)
+        results[stage]["shifts"] = len(columns.start)
+    return results
+
+
+def import_seconds(module: str) -> dict:
+    # Import time of `module` in a fresh interpreter, from python -X importtime,
+    # with the most expensive modules it pulled in
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    cumulative = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, micros, name = line.split("|")
+        cumulative[name.strip()] = int(micros) / 1e6
+    heaviest = sorted(
+        (item for item in cumulative.items() if item[0] != module),
+        key=lambda item: -item[1],
+    )[:5]
+    return {"seconds": cumulative[module], "heaviest": heaviest}
+
+
+def run_cold_start(repeat: int) -> dict:
+    results = {}
+    for module in COLD_START_MODULES:
+        runs = [import_seconds(module) for _ in range(repeat)]
+        fastest = min(runs, key=lambda run: run["seconds"])
+        results[f"import_{module}"] = {
+            "seconds": fastest["seconds"],
+            "peak_bytes": 0,
+            "shifts": 0,
+            "heaviest": fastest["heaviest"],
+        }
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for scenario, stages in results.items():
+        for stage, current in stages.items():
+            previous = baseline.get(scenario, {}).get(stage)
+            if not previous:
+                continue
+            for metric in ("seconds", "peak_bytes"):
+                if previous[metric] and current[metric] > previous[metric] * tolerance:
+                    ratio = current[metric] / previous[metric]
+                    regressions.append(f"{scenario}/{stage} {metric} x{ratio:.2f}")
+    return regressions
+
+
+def print_results(name: str, stages: dict):
+    for stage, result in stages.items():
+        print(
+            f"{name:<14} {stage:<15} {result['seconds'] * 1000:10.2f} ms"
+            f" {result['peak_bytes'] / 2**20:9.2f} MiB"
+            f" {result['shifts']:>9} shifts"
+        )
+        for module, seconds in result.get("heaviest", []):
+            print(f"{'':<14} {'':<15} {seconds * 1000:10.2f} ms  {module}")
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description="Benchmark validation, shift expansion and calendar rendering."
+    )
+    arg_parser.add_argument("--scenario", choices=SCENARIOS, action="append")
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    arg_parser.add_argument(
+        "--cold-start",
+        action="store_true",
+        help="also time importing the app in a fresh interpreter",
+    )
+    arg_parser.add_argument("--save-baseline", metavar="PATH")
+    arg_parser.add_argument("--compare", metavar="PATH")
+    arg_parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.25,
+        help="ratio over the baseline reported as a regression",
+    )
+    args = arg_parser.parse_args(argv)
+
+    results = {}
+    if args.cold_start:
+        results["cold_start"] = run_cold_start(args.repeat)
+        print_results("cold_start", results["cold_start"])
+    for name in args.scenario or SCENARIOS:
+        results[name] = run_scenario(name, repeat=args.repeat, **SCENARIOS[name])
+        print_results(name, results[name])
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,41 +1,21 @@
 import calendar
-import random
+import hashlib
+import threading
+from collections import OrderedDict
 from datetime import timedelta
+from typing import Iterator, Optional
 
 import pandas as pd
 
+MONTH_CACHE_SIZE = 256
 
-def generate_random_colors(n):
-    colors = []
-    for _ in range(n):
-        r = random.randint(100, 255)
-        g = random.randint(100, 255)
-        b = random.randint(100, 255)
-        color = "#{:02x}{:02x}{:02x}".format(r, g, b)
-        colors.append(color)
-    return colors
+# Rendered month fragments, keyed by a hash of the shifts shown in the month.
+# Streamlit serves sessions from several threads, so every access holds the
+# lock.
+_month_cache: OrderedDict = OrderedDict()
+_month_cache_lock = threading.Lock()
 
-
-def generate_color_dict(df):
-    users = df["user"].unique()
-    colors = generate_random_colors(len(users))
-    return dict(zip(users, colors))
-
-
-def dataframe_to_html_calendar(df: pd.DataFrame, timezone: str) -> str:
-    user_colors = generate_color_dict(df)
-
-    df["shift_start_datetime"] = pd.to_datetime(
-        df["shift_start_datetime"]
-    ).dt.tz_convert(timezone)
-    df["shift_end_datetime"] = pd.to_datetime(df["shift_end_datetime"]).dt.tz_convert(
-        timezone
-    )
-
-    start_date = df["shift_start_datetime"].min()
-    end_date = df["shift_end_datetime"].max()
-
-    html_calendar = """
+CALENDAR_STYLE = """
     <style>
         table { border-collapse: separate; border-spacing: 1px; width: 100%; background-color: #000000; color: #ffffff; }
         th, td { padding: 8px; text-align: left; vertical-align: top; }
@@ -45,71 +25,192 @@ def dataframe_to_html_calendar(df: pd.DataFrame, timezone: str) -> str:
         .shift-container { position: absolute; top: 30px; left: 0; right: 0; height: 25px; display: flex; }
         .shift { flex: 1; margin: 0 1px; padding: 2px; color: black; overflow: hidden; position: relative; }
         .shift-text { position: absolute; top: 50%; left: 50%; transform: translate(-50%, -50%); white-space: nowrap; overflow: hidden; text-overflow: ellipsis; max-width: 100%; font-size: 0.8em; text-align: center; }
-    </style> 
-    """  # noqa E501
+        .shift.s { border-top-left-radius: 4px; border-bottom-left-radius: 4px; }
+        .shift.e { border-top-right-radius: 4px; border-bottom-right-radius: 4px; }
+"""  # noqa E501
+
+WEEKDAY_HEADER = "<tr><th>MONDAY</th><th>TUESDAY</th><th>WEDNESDAY</th><th>THURSDAY</th><th>FRIDAY</th><th>SATURDAY</th><th>SUNDAY</th></tr>"  # noqa E501
+
+
+def user_color(user) -> str:
+    # Derived from the name so a user keeps their color across reruns and
+    # processes
+    r, g, b = hashlib.sha256(str(user).encode()).digest()[:3]
+    return "#{:02x}{:02x}{:02x}".format(100 + r % 156, 100 + g % 156, 100 + b % 156)
 
-    current_date = start_date.replace(day=1)
 
+def user_class(user) -> str:
+    return "u" + hashlib.sha256(str(user).encode()).hexdigest()[:8]
+
+
+def generate_color_dict(df):
+    return {user: user_color(user) for user in df["user"].unique()}
+
+
+def build_day_index(start_dates: list, end_dates: list) -> dict:
+    # Map each calendar date to the positions of the shifts that appear on it.
+    # A shift appears on every date from its start date through its end date,
+    # including the next day for shifts that end exactly at midnight.
+    day_index = {}
+    for position, (shift_start, shift_end) in enumerate(zip(start_dates, end_dates)):
+        date = shift_start
+        while date <= shift_end:
+            day_index.setdefault(date, []).append(position)
+            date += timedelta(days=1)
+    return day_index
+
+
+def month_range(start_date, end_date) -> list:
+    months = []
+    current_date = start_date.replace(day=1)
     while current_date <= end_date:
-        cal = calendar.monthcalendar(current_date.year, current_date.month)
-        month_name = current_date.strftime("%B %Y")
-
-        html_calendar += f"<h3 style='color: #ffffff;'>{month_name}</h3>"
-        html_calendar += "<table>"
-        html_calendar += "<tr><th>MONDAY</th><th>TUESDAY</th><th>WEDNESDAY</th><th>THURSDAY</th><th>FRIDAY</th><th>SATURDAY</th><th>SUNDAY</th></tr>"  # noqa E501
-
-        for week in cal:
-            html_calendar += "<tr>"
-            for day in week:
-                if day == 0:
-                    html_calendar += "<td></td>"
-                else:
-                    date = current_date.replace(day=day)
-                    next_date = date + timedelta(days=1)
-                    day_shifts = df[
-                        (
-                            (df["shift_start_datetime"].dt.date <= date.date())
-                            & (df["shift_end_datetime"].dt.date >= date.date())
-                        )
-                        | (
-                            (df["shift_start_datetime"].dt.date <= date.date())
-                            & (df["shift_end_datetime"].dt.date == next_date.date())
-                            & (
-                                df["shift_end_datetime"].dt.time
-                                == pd.Timestamp("00:00:00").time()
-                            )
-                        )
-                    ]
-
-                    html_calendar += f"<td><div class='date'>{day}</div><div class='shift-container'>"  # noqa E501
-
-                    if not day_shifts.empty:
-                        for _, row in day_shifts.iterrows():
-                            bg_color = user_colors[row["user"]]
-                            shift_start = row["shift_start_datetime"].date()
-                            shift_end = row["shift_end_datetime"].date()
-
-                            style = f"background-color: {bg_color};"
-
-                            if date.date() == shift_start:
-                                style += "border-top-left-radius: 4px; border-bottom-left-radius: 4px;"  # noqa E501
-                            if date.date() == shift_end or (
-                                shift_end == next_date.date()
-                                and row["shift_end_datetime"].time()
-                                == pd.Timestamp("00:00:00").time()
-                            ):
-                                style += "border-top-right-radius: 4px; border-bottom-right-radius: 4px;"  # noqa E501
-
-                            html_calendar += f"<div class='shift' style='{style}'>"
-                            if date.date() == shift_start:
-                                shift_text = f"{row['user']}: {row['shift_start_datetime'].strftime('%I:%M %p')} - {row['shift_end_datetime'].strftime('%I:%M %p')}"  # noqa E501
-                                html_calendar += f"<span class='shift-text' title='{shift_text}'>{shift_text}</span>"  # noqa E501
-                            html_calendar += "</div>"
-
-                    html_calendar += "</div></td>"
-            html_calendar += "</tr>"
-
-        html_calendar += "</table><br>"
+        months.append(current_date)
         current_date = (current_date.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return months
+
+
+def dataframe_to_html_calendar(
+    df: pd.DataFrame, timezone: str, months: Optional[list] = None
+) -> str:
+    # Renders the given months (first-of-month timestamps), or every month the
+    # shifts reach into
+    return "".join(iter_calendar_html(df, timezone, months))
+
+
+def iter_calendar_html(
+    df: pd.DataFrame, timezone: str, months: Optional[list] = None
+) -> Iterator[str]:
+    user_colors = generate_color_dict(df)
+
+    # transform_schedule_to_df already converts to the schedule timezone
+    for column in ("shift_start_datetime", "shift_end_datetime"):
+        values = pd.to_datetime(df[column])
+        if str(values.dt.tz) != timezone:
+            df[column] = values.dt.tz_convert(timezone)
+
+    # One class per user carries the color, so shift cells don't repeat it
+    yield CALENDAR_STYLE
+    for user, color in user_colors.items():
+        yield f"        .{user_class(user)} {{ background-color: {color}; }}\n"
+    yield "    </style>\n"
+
+    users = df["user"].tolist()
+    classes = {user: user_class(user) for user in user_colors}
+    start_dates = df["shift_start_datetime"].dt.date.tolist()
+    end_dates = df["shift_end_datetime"].dt.date.tolist()
+    shifts = {
+        "user": users,
+        "class": [classes[user] for user in users],
+        "start_date": start_dates,
+        "end_date": end_dates,
+        "start_ns": df["shift_start_datetime"].dt.as_unit("ns").astype(int).tolist(),
+        "end_ns": df["shift_end_datetime"].dt.as_unit("ns").astype(int).tolist(),
+    }
+    day_index = build_day_index(start_dates, end_dates)
+
+    if months is None:
+        months = month_range(
+            df["shift_start_datetime"].min(), df["shift_end_datetime"].max()
+        )
+
+    keys = [
+        month_cache_key(month, day_index, shifts, timezone) for month in months
+    ]
+    for month, key in zip(months, keys):
+        html = cached_month(key)
+        if html is None:
+            # Only pay for the per-shift labels when a month has to be rendered
+            if "start_time" not in shifts:
+                add_shift_labels(df, shifts)
+            html = month_to_html(month, day_index, shifts)
+            store_month(key, html)
+        yield html
+
+
+def add_shift_labels(df: pd.DataFrame, shifts: dict) -> None:
+    shifts["ends_at_midnight"] = (
+        df["shift_end_datetime"] == df["shift_end_datetime"].dt.normalize()
+    ).tolist()
+    shifts["start_time"] = df["shift_start_datetime"].dt.strftime("%I:%M %p").tolist()
+    shifts["end_time"] = df["shift_end_datetime"].dt.strftime("%I:%M %p").tolist()
+
+
+def cached_month(key: str) -> Optional[str]:
+    with _month_cache_lock:
+        html = _month_cache.get(key)
+        if html is not None:
+            _month_cache.move_to_end(key)
+        return html
+
+
+def store_month(key: str, html: str) -> None:
+    with _month_cache_lock:
+        _month_cache[key] = html
+        _month_cache.move_to_end(key)
+        while len(_month_cache) > MONTH_CACHE_SIZE:
+            _month_cache.popitem(last=False)
+
+
+def month_cache_key(current_date, day_index, shifts, timezone) -> str:
+    # Hash everything that affects how the month renders: the timezone and
+    # the user and bounds of every shift overlapping the month
+    _, days_in_month = calendar.monthrange(current_date.year, current_date.month)
+    positions = set()
+    for day in range(1, days_in_month + 1):
+        positions.update(day_index.get(current_date.replace(day=day).date(), []))
+
+    digest = hashlib.sha256(f"{timezone}|{current_date:%Y-%m}".encode())
+    for i in sorted(positions):
+        row = f"|{shifts['user'][i]}|{shifts['start_ns'][i]}|{shifts['end_ns'][i]}"
+        digest.update(row.encode())
+    return digest.hexdigest()
+
+
+def month_to_html(current_date, day_index, shifts) -> str:
+    cal = calendar.monthcalendar(current_date.year, current_date.month)
+    month_name = current_date.strftime("%B %Y")
+
+    parts = [f"<h3 style='color: #ffffff;'>{month_name}</h3><table>{WEEKDAY_HEADER}"]
+    for week in cal:
+        parts.append("<tr>")
+        for day in week:
+            if day == 0:
+                parts.append("<td></td>")
+                continue
+
+            date = current_date.replace(day=day).date()
+            next_date = date + timedelta(days=1)
+            parts.append(
+                f"<td><div class='date'>{day}</div><div class='shift-container'>"
+            )
+
+            for i in day_index.get(date, []):
+                shift_start = shifts["start_date"][i]
+                shift_end = shifts["end_date"][i]
+
+                # "s" and "e" round the corners where a shift starts and ends
+                classes = f"shift {shifts['class'][i]}"
+                if date == shift_start:
+                    classes += " s"
+                if date == shift_end or (
+                    shift_end == next_date and shifts["ends_at_midnight"][i]
+                ):
+                    classes += " e"
+
+                if date == shift_start:
+                    shift_text = (
+                        f"{shifts['user'][i]}: {shifts['start_time'][i]}"
+                        f" - {shifts['end_time'][i]}"
+                    )
+                    parts.append(
+                        f"<div class='{classes}'><span class='shift-text'"
+                        f" title='{shift_text}'>{shift_text}</span></div>"
+                    )
+                else:
+                    parts.append(f"<div class='{classes}'></div>")
+
+            parts.append("</div></td>")
+        parts.append("</tr>")
 
-    return html_calendar
+    parts.append("</table><br>")
+    return "".join(parts)
@@ -0,0 +1,274 @@
+import argparse
+import hashlib
+import json
+import sys
+from datetime import datetime as dt
+from datetime import timedelta, timezone
+from typing import Iterator, List, NamedTuple
+
+import numpy as np
+
+import schedules_ai as sai
+from shifts import HORIZON_WEEKS, expand_layer, horizon_bounds
+
+CHUNK_DAYS = 28
+PARQUET_ROW_GROUP_ROWS = 64 * 1024
+ICS_PRODID = "-//schedules-ai//Rotation export//EN"
+
+
+class ShiftChunk(NamedTuple):
+    # Epoch seconds (UTC), as in shifts.ShiftColumns
+    start: np.ndarray
+    end: np.ndarray
+    # Index into the user_names shared by every chunk of an export
+    user_codes: np.ndarray
+    layer: np.ndarray
+
+
+def export_user_names(layers) -> List[str]:
+    names = (user.user_name for layer in layers for user in layer.users)
+    return list(dict.fromkeys(names))
+
+
+def iter_shift_chunks(
+    layers, weeks: int = HORIZON_WEEKS, chunk_days: int = CHUNK_DAYS
+) -> Iterator[ShiftChunk]:
+    # Expands one window at a time, so memory stays bounded by the chunk size
+    # rather than the horizon. Each shift is emitted in the chunk it starts in.
+    bounds = horizon_bounds(layers, weeks)
+    if bounds is None:
+        return
+    codes_by_name = {name: i for i, name in enumerate(export_user_names(layers))}
+    t0, last = bounds
+    while t0 < last:
+        t1 = t0 + timedelta(days=chunk_days)
+        starts, ends, user_codes, layer_ids = [], [], [], []
+        for i, layer in enumerate(layers):
+            columns = expand_layer(layer, weeks, (t0, t1))
+            first = columns.start >= t0.timestamp()
+            remap = np.array(
+                [codes_by_name[name] for name in columns.user_names], dtype=np.int32
+            )
+            starts.append(columns.start[first])
+            ends.append(columns.end[first])
+            user_codes.append(remap[columns.user_codes[first]])
+            layer_ids.append(np.full(first.sum(), i, dtype=np.int16))
+
+        start = np.concatenate(starts)
+        if len(start):
+            order = np.argsort(start, kind="stable")
+            yield ShiftChunk(
+                start=start[order],
+                end=np.concatenate(ends)[order],
+                user_codes=np.concatenate(user_codes)[order],
+                layer=np.concatenate(layer_ids)[order],
+            )
+        t0 = t1
+
+
+def ics_escape(text: str) -> str:
+    return (
+        text.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\n", "\\n")
+    )
+
+
+def ics_fold(line: str) -> str:
+    # RFC 5545 lines are at most 75 octets; continuations start with a space
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line + "\r\n"
+    parts = []
+    limit = 75
+    while encoded:
+        cut = min(limit, len(encoded))
+        # Don't split a multi-byte UTF-8 character
+        while cut < len(encoded) and encoded[cut] & 0xC0 == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode())
+        encoded = encoded[cut:]
+        limit = 74
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def ics_time(epoch_seconds: int) -> str:
+    return dt.fromtimestamp(int(epoch_seconds), timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def iter_ics(
+    layers,
+    weeks: int = HORIZON_WEEKS,
+    chunk_days: int = CHUNK_DAYS,
+    calendar_name: str = "On-call rotation",
+) -> Iterator[str]:
+    user_names = export_user_names(layers)
+    stamp = dt.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+    yield "BEGIN:VCALENDAR\r\n"
+    yield "VERSION:2.0\r\n"
+    yield f"PRODID:{ICS_PRODID}\r\n"
+    yield "CALSCALE:GREGORIAN\r\n"
+    yield ics_fold(f"X-WR-CALNAME:{ics_escape(calendar_name)}")
+    for chunk in iter_shift_chunks(layers, weeks, chunk_days):
+        lines = []
+        for start, end, code, layer in zip(
+            chunk.start.tolist(),
+            chunk.end.tolist(),
+            chunk.user_codes.tolist(),
+            chunk.layer.tolist(),
+        ):
+            user = user_names[code]
+            # Stable across exports so calendar clients update events in place
+            uid = hashlib.sha1(f"{layer}|{user}|{start}|{end}".encode()).hexdigest()
+            lines.append("BEGIN:VEVENT\r\n")
+            lines.append(f"UID:{uid}@schedules-ai\r\n")
+            lines.append(f"DTSTAMP:{stamp}\r\n")
+            lines.append(f"DTSTART:{ics_time(start)}\r\n")
+            lines.append(f"DTEND:{ics_time(end)}\r\n")
+            lines.append(ics_fold(f"SUMMARY:On call: {ics_escape(user)}"))
+            lines.append(f"CATEGORIES:Layer {layer + 1}\r\n")
+            lines.append("END:VEVENT\r\n")
+        yield "".join(lines)
+    yield "END:VCALENDAR\r\n"
+
+
+def write_ics(path: str, layers, **kwargs) -> None:
+    with open(path, "w", newline="") as f:
+        for part in iter_ics(layers, **kwargs):
+            f.write(part)
+
+
+def import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError(
+            "Parquet and Arrow export need pyarrow: pip install pyarrow"
+        ) from e
+    return pa, pq
+
+
+def arrow_schema(pa):
+    return pa.schema(
+        [
+            ("layer", pa.int16()),
+            ("user", pa.dictionary(pa.int32(), pa.string())),
+            ("shift_start", pa.timestamp("s", tz="UTC")),
+            ("shift_end", pa.timestamp("s", tz="UTC")),
+        ]
+    )
+
+
+def iter_record_batches(
+    layers, weeks: int = HORIZON_WEEKS, chunk_days: int = CHUNK_DAYS
+) -> Iterator:
+    pa, _ = import_pyarrow()
+    schema = arrow_schema(pa)
+    # One dictionary for every batch, so user names are stored once
+    dictionary = pa.array(export_user_names(layers), type=pa.string())
+    for chunk in iter_shift_chunks(layers, weeks, chunk_days):
+        yield pa.record_batch(
+            [
+                pa.array(chunk.layer, type=pa.int16()),
+                pa.DictionaryArray.from_arrays(
+                    pa.array(chunk.user_codes, type=pa.int32()), dictionary
+                ),
+                pa.array(chunk.start, type=pa.timestamp("s", tz="UTC")),
+                pa.array(chunk.end, type=pa.timestamp("s", tz="UTC")),
+            ],
+            schema=schema,
+        )
+
+
+def write_parquet(path: str, layers, **kwargs) -> int:
+    pa, pq = import_pyarrow()
+    rows = 0
+    # Parquet stores the timestamps as integer milliseconds; starts are sorted
+    # within each row group, so delta encoding shrinks them to a few bits
+    with pq.ParquetWriter(
+        path,
+        arrow_schema(pa),
+        compression="zstd",
+        use_dictionary=["user"],
+        column_encoding={
+            "shift_start": "DELTA_BINARY_PACKED",
+            "shift_end": "DELTA_BINARY_PACKED",
+        },
+    ) as writer:
+        # Buffer chunks into large row groups; each group carries its own
+        # metadata and statistics
+        pending, pending_rows = [], 0
+        for batch in iter_record_batches(layers, **kwargs):
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            if pending_rows >= PARQUET_ROW_GROUP_ROWS:
+                writer.write_table(pa.Table.from_batches(pending))
+                rows += pending_rows
+                pending, pending_rows = [], 0
+        if pending:
+            writer.write_table(pa.Table.from_batches(pending))
+            rows += pending_rows
+    return rows
+
+
+def write_arrow(path: str, layers, **kwargs) -> int:
+    pa, _ = import_pyarrow()
+    rows = 0
+    with pa.OSFile(path, "wb") as sink:
+        options = pa.ipc.IpcWriteOptions(compression="zstd")
+        with pa.ipc.new_file(sink, arrow_schema(pa), options=options) as writer:
+            for batch in iter_record_batches(layers, **kwargs):
+                writer.write_batch(batch)
+                rows += batch.num_rows
+    return rows
+
+
+def read_layers(path: str) -> List[sai.ScheduleLayers]:
+    # A list of layers, or an object with a schedule_layers field such as an
+    # app response or a line of batch.py output
+    with open(path) as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data["schedule_layers"]
+    return [sai.ScheduleLayers(**values) for values in data]
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description="Export the shifts of validated schedule layers."
+    )
+    arg_parser.add_argument("input", help="JSON file of schedule layers")
+    arg_parser.add_argument("--ics", metavar="PATH", help="iCalendar output")
+    arg_parser.add_argument("--parquet", metavar="PATH", help="Parquet output")
+    arg_parser.add_argument("--arrow", metavar="PATH", help="Arrow IPC file output")
+    arg_parser.add_argument("--weeks", type=int, default=HORIZON_WEEKS)
+    arg_parser.add_argument(
+        "--chunk-days",
+        type=int,
+        default=CHUNK_DAYS,
+        help="days of shifts expanded at a time",
+    )
+    arg_parser.add_argument("--name", default="On-call rotation")
+    args = arg_parser.parse_args(argv)
+
+    if not (args.ics or args.parquet or args.arrow):
+        arg_parser.error("at least one of --ics, --parquet or --arrow is required")
+
+    layers = read_layers(args.input)
+    options = {"weeks": args.weeks, "chunk_days": args.chunk_days}
+    if args.ics:
+        write_ics(args.ics, layers, calendar_name=args.name, **options)
+    if args.parquet:
+        rows = write_parquet(args.parquet, layers, **options)
+        print(f"{rows} shifts written to {args.parquet}", file=sys.stderr)
+    if args.arrow:
+        rows = write_arrow(args.arrow, layers, **options)
+        print(f"{rows} shifts written to {args.arrow}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+import re
+import time
+from datetime import datetime as dt
+from typing import List, Optional
+
+from langchain_core.pydantic_v1 import ValidationError
+
+import pd_timezones
+import schedules_ai as sai
+
+MONTHS = {
+    name: number
+    for number, name in enumerate(
+        ["jan", "feb", "mar", "apr", "may", "jun"]
+        + ["jul", "aug", "sep", "oct", "nov", "dec"],
+        start=1,
+    )
+}
+WEEKDAYS = {"mon": 1, "tue": 2, "wed": 3, "thu": 4, "fri": 5, "sat": 6, "sun": 7}
+NUMBER_WORDS = {
+    word: number
+    for number, word in enumerate(
+        ["one", "two", "three", "four", "five", "six", "seven", "eight"]
+        + ["nine", "ten", "eleven", "twelve"],
+        start=1,
+    )
+}
+DAY = r"(mon|tue|tues|wed|thu|thur|thurs|fri|sat|sun)(?:day|sday|nesday|rsday|urday)?"
+TIME = r"(\d{1,2})(?::(\d{2}))?\s*([ap])\.?m\.?"
+TIME_RANGE = rf"{TIME}\s*(?:-|–|to)\s*{TIME}"
+
+START_DATE_RE = re.compile(
+    r"\b(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?\s+"
+    r"(\d{1,2})(?:st|nd|rd|th)?,?\s+(\d{4})",
+    re.IGNORECASE,
+)
+DAY_RANGE_RE = re.compile(rf"\b{DAY}\.?\s+{TIME_RANGE}", re.IGNORECASE)
+DAY_MENTION_RE = re.compile(rf"\b{DAY}\b", re.IGNORECASE)
+TIME_RANGE_RE = re.compile(TIME_RANGE, re.IGNORECASE)
+EVERYDAY_RE = re.compile(rf"{TIME_RANGE}\s*(?:every\s?day|daily)", re.IGNORECASE)
+TIMEZONE_RE = re.compile(r"([A-Za-z][A-Za-z .'_/-]*?)\s+time\s?zone", re.IGNORECASE)
+ROTATION_RE = re.compile(
+    r"rotate\s+(?:each|every)\s+(?:(\d+|[a-z]+)\s+)?(day|week)s?", re.IGNORECASE
+)
+ORDER_RE = re.compile(r"following order:\s*([^.]+?)\.?\s*$", re.IGNORECASE)
+SUBJECT_RE = re.compile(r"^\s*([A-Z][\w'-]*(?:\s+[A-Z][\w'-]*)*)\s+starts?\b")
+# Wording the templates never use: end dates, exceptions and other conditions
+# the parser would silently drop
+UNSUPPORTED_RE = re.compile(
+    r"\b(?:end|ends|ending|ended|until|till|thru|through|except|excluding"
+    r"|exclude|but|not|skip|skipping|without|other than|holidays?)\b",
+    re.IGNORECASE,
+)
+
+
+class FastPathStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.parse_seconds = 0.0
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def record_llm(self, seconds: float):
+        self.llm_calls += 1
+        self.llm_seconds += seconds
+
+    def as_dict(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "avg_parse_ms": 1000 * self.parse_seconds / total if total else 0.0,
+            "llm_calls": self.llm_calls,
+            "avg_llm_ms": (
+                1000 * self.llm_seconds / self.llm_calls if self.llm_calls else 0.0
+            ),
+        }
+
+
+stats = FastPathStats()
+
+
+def find_timezone(text: str) -> Optional[str]:
+    match = TIMEZONE_RE.search(text)
+    if not match:
+        return None
+    # The capture may include leading words ("..., Los Angeles"), so try the
+    # longest trailing run of words that names a known zone
+    words = match.group(1).split()
+    for i in range(len(words)):
+        timezone = pd_timezones.normalize_timezone(" ".join(words[i:]))
+        if timezone:
+            return timezone
+    return None
+
+
+def to_seconds(hour: str, minute: Optional[str], meridiem: str) -> int:
+    hour_of_day = int(hour) % 12 + (12 if meridiem.lower() == "p" else 0)
+    return hour_of_day * 3600 + int(minute or 0) * 60
+
+
+def parse_time_range(groups) -> tuple:
+    start = to_seconds(*groups[:3])
+    end = to_seconds(*groups[3:6])
+    duration = end - start if end > start else end - start + 86400
+    hours, remainder = divmod(start, 3600)
+    start_time = f"{hours:02d}:{remainder // 60:02d}:00"
+    return start_time, duration
+
+
+def parse_rotation(text: str) -> Optional[tuple]:
+    match = ROTATION_RE.search(text)
+    if not match:
+        return None
+    count, unit = match.group(1), match.group(2).lower()
+    if count is None:
+        num_shifts = 1
+    elif count.isdigit():
+        num_shifts = int(count)
+    elif count.lower() in NUMBER_WORDS:
+        num_shifts = NUMBER_WORDS[count.lower()]
+    else:
+        return None
+    restriction_type = "daily_restriction" if unit == "day" else "weekly_restriction"
+    return num_shifts, restriction_type
+
+
+def parse_users(text: str) -> List[str]:
+    match = ORDER_RE.search(text)
+    if match:
+        names = re.split(r",|\band\b", match.group(1))
+    else:
+        # "Buzz Lightyear starts their on call rotation ..."
+        match = SUBJECT_RE.match(text)
+        names = [match.group(1)] if match else []
+    return [name.strip(" .") for name in names if name.strip(" .")]
+
+
+def parse_layer(text: str) -> Optional[dict]:
+    text = " ".join(text.split())
+    # Only the plain templates are parsed; anything else goes to the LLM
+    if UNSUPPORTED_RE.search(text) or len(START_DATE_RE.findall(text)) != 1:
+        return None
+
+    start_match = START_DATE_RE.search(text)
+    timezone = find_timezone(text)
+    users = parse_users(text)
+    if not (start_match and timezone and users):
+        return None
+
+    everyday_match = EVERYDAY_RE.search(text)
+    rotation = parse_rotation(text)
+    if rotation is None:
+        if not everyday_match:
+            return None
+        rotation = (1, "daily_restriction")
+    num_shifts, restriction_type = rotation
+
+    restrictions = []
+    if everyday_match:
+        # A weekday or a second time range would qualify "every day"
+        if DAY_MENTION_RE.search(text) or len(TIME_RANGE_RE.findall(text)) != 1:
+            return None
+        start_time, duration = parse_time_range(everyday_match.groups())
+        restrictions.append((1, start_time, duration))
+    else:
+        ranges = DAY_RANGE_RE.findall(text)
+        # Any weekday mentioned without a time range means we can't trust the
+        # parse, so leave it to the LLM
+        if not ranges or len(ranges) != len(DAY_MENTION_RE.findall(text)):
+            return None
+        for day, *times in ranges:
+            start_time, duration = parse_time_range(times)
+            restrictions.append((WEEKDAYS[day[:3].lower()], start_time, duration))
+
+    month, day, year = start_match.groups()
+    rotation_start = pd_timezones.get_tz(timezone).localize(
+        dt(int(year), MONTHS[month[:3].lower()], int(day))
+    )
+
+    return {
+        "timezone": timezone,
+        "num_shifts": num_shifts,
+        "start": rotation_start,
+        "rotation_virtual_start": rotation_start,
+        "rotation_turn_length_seconds": (
+            86400 if restriction_type == "daily_restriction" else 604800
+        ),
+        "users": [{"user_name": name, "type": "user_reference"} for name in users],
+        "restrictions": [
+            {
+                "type": restriction_type,
+                "start_time_of_day": start_time,
+                "duration_seconds": duration,
+                "start_day_of_week": weekday,
+            }
+            for weekday, start_time, duration in restrictions
+        ],
+        "everyday": bool(everyday_match),
+    }
+
+
+def try_parse(text: str) -> Optional[List[sai.ScheduleLayers]]:
+    started = time.perf_counter()
+    try:
+        values = parse_layer(text)
+        layers = [sai.ScheduleLayers(**values)] if values else None
+    except (ValidationError, ValueError, KeyError):
+        layers = None
+    finally:
+        stats.parse_seconds += time.perf_counter() - started
+
+    if layers is None:
+        stats.misses += 1
+    else:
+        stats.hits += 1
+    return layers
@@ -0,0 +1,116 @@
+import os
+from functools import lru_cache
+from typing import List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+from system_prompts import (
+    ADD_ANOTHER_MESSAGE,
+    CONFIRMATION_MESSAGE,
+    INITIAL_GREETING,
+    VALIDATED_MESSAGE_PREFIX,
+)
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", 3000))
+
+# Assistant messages that carry no information the model needs
+BOILERPLATE_MESSAGES = {ADD_ANOTHER_MESSAGE, CONFIRMATION_MESSAGE, INITIAL_GREETING}
+
+WEEKDAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+
+@lru_cache(maxsize=1)
+def get_encoding():
+    # Loaded on first use, or earlier by the app's warm-up thread; the
+    # vocabulary may have to be downloaded
+    try:
+        import tiktoken
+
+        return tiktoken.encoding_for_model("gpt-3.5-turbo")
+    except Exception:
+        # tiktoken missing or its vocabulary can't be fetched offline
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = get_encoding()
+    if encoding is None:
+        # Roughly four characters per token in English text
+        return len(text) // 4 + 1
+    return len(encoding.encode(text))
+
+
+def message_tokens(message: BaseMessage) -> int:
+    # Every chat message carries a few tokens of role/formatting overhead
+    return count_tokens(str(message.content)) + 4
+
+
+def summarize_layer(layer) -> str:
+    names = [user.user_name for user in layer.users]
+    restriction = layer.restrictions[0]
+    rotation = "daily" if restriction.type == "daily_restriction" else "weekly"
+    shifts = ", ".join(
+        f"{WEEKDAY_NAMES[r.start_day_of_week - 1]} {r.start_time_of_day}"
+        f" for {r.duration_seconds}s"
+        for r in layer.restrictions
+    )
+    return (
+        f"{layer.timezone}, starts {layer.start.isoformat()}, {rotation} rotation"
+        f" every {layer.num_shifts}, users in order: {', '.join(names)};"
+        f" shifts: {shifts}"
+    )
+
+
+def summarize_layers(schedule_layers: list) -> str:
+    lines = [
+        f"{i}. {summarize_layer(layer)}"
+        for i, layer in enumerate(schedule_layers, start=1)
+    ]
+    return "Validated schedule layers so far:\n" + "\n".join(lines)
+
+
+def compact_history(
+    messages: List[BaseMessage],
+    schedule_layers: list,
+    pending_input: Optional[str] = None,
+    budget: int = HISTORY_TOKEN_BUDGET,
+) -> List[BaseMessage]:
+    system, rest = messages[0], messages[1:]
+
+    # The pending input is sent separately, so don't send it twice
+    if pending_input is not None:
+        for i in range(len(rest) - 1, -1, -1):
+            if isinstance(rest[i], HumanMessage):
+                if rest[i].content == pending_input:
+                    rest = rest[:i] + rest[i + 1 :]
+                break
+
+    compacted = []
+    for message in rest:
+        if isinstance(message, AIMessage):
+            if message.content in BOILERPLATE_MESSAGES:
+                continue
+            # Every validated dump repeats all the layers, so only the last one
+            # matters and it is replaced by a summary below
+            if str(message.content).startswith(VALIDATED_MESSAGE_PREFIX):
+                continue
+        compacted.append(message)
+
+    head = [system]
+    if schedule_layers:
+        head.append(AIMessage(content=summarize_layers(schedule_layers)))
+
+    used = sum(message_tokens(message) for message in head)
+    if pending_input is not None:
+        used += count_tokens(pending_input) + 4
+    kept: List[BaseMessage] = []
+    # Keep the most recent messages that fit. The summary always stays, ahead
+    # of them, so the conversation still ends with the latest exchange.
+    for message in reversed(compacted):
+        tokens = message_tokens(message)
+        if kept and used + tokens > budget:
+            break
+        kept.append(message)
+        used += tokens
+
+    return head + kept[::-1]
@@ -0,0 +1,164 @@
+import atexit
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, NamedTuple, Optional
+
+MAX_SPANS = int(os.getenv("SPAN_MAX_SPANS", 1000))
+
+# Trace and parent of the span currently running, so nested spans can be
+# grouped per turn
+_current_trace: ContextVar[Optional[str]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[str]] = ContextVar("current_span", default=None)
+# The recorder is shared by every session, so each span remembers whose it is
+_current_session: ContextVar[Optional[str]] = ContextVar(
+    "current_session", default=None
+)
+
+
+class Span(NamedTuple):
+    span_id: str
+    session_id: Optional[str]
+    trace_id: Optional[str]
+    parent_id: Optional[str]
+    name: str
+    started_at: float
+    seconds: float
+    error: Optional[str]
+    attributes: dict
+
+    def as_dict(self) -> dict:
+        return {
+            "span_id": self.span_id,
+            "session_id": self.session_id,
+            "trace_id": self.trace_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "ms": round(self.seconds * 1000, 3),
+            "error": self.error,
+            **self.attributes,
+        }
+
+
+class SpanRecorder:
+    def __init__(self, max_spans: int = MAX_SPANS, log_path: Optional[str] = None):
+        self.spans: deque = deque(maxlen=max_spans)
+        self.log_path = log_path
+        # Opened on the first span and kept open
+        self._log_file = None
+        # Spans are recorded from every session's thread
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "SpanRecorder":
+        return cls(log_path=os.getenv("SPAN_LOG_PATH"))
+
+    @contextmanager
+    def session(self, session_id: str) -> Iterator[str]:
+        # Tags every span recorded inside with the session it ran for
+        token = _current_session.set(session_id)
+        try:
+            yield session_id
+        finally:
+            _current_session.reset(token)
+
+    @contextmanager
+    def trace(self) -> Iterator[str]:
+        # Groups every span recorded inside, e.g. one chat turn
+        trace_id = uuid.uuid4().hex[:16]
+        token = _current_trace.set(trace_id)
+        try:
+            yield trace_id
+        finally:
+            _current_trace.reset(token)
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[dict]:
+        # Yields the attributes so the caller can add counts known only at the end
+        span_id = uuid.uuid4().hex[:16]
+        parent_id = _current_span.get()
+        token = _current_span.set(span_id)
+        started_at = time.time()
+        started = time.perf_counter()
+        error = None
+        try:
+            yield attributes
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            _current_span.reset(token)
+            self.record(
+                Span(
+                    span_id=span_id,
+                    session_id=_current_session.get(),
+                    trace_id=_current_trace.get(),
+                    parent_id=parent_id,
+                    name=name,
+                    started_at=started_at,
+                    seconds=time.perf_counter() - started,
+                    error=error,
+                    attributes=attributes,
+                )
+            )
+
+    def record(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+            if self.log_path:
+                if self._log_file is None:
+                    self._log_file = open(self.log_path, "a")
+                self._log_file.write(json.dumps(span.as_dict(), default=str) + "\n")
+
+    def close(self):
+        with self._lock:
+            if self._log_file is not None:
+                self._log_file.close()
+                self._log_file = None
+
+    def session_spans(self, session_id: Optional[str]) -> List[Span]:
+        with self._lock:
+            return [span for span in self.spans if span.session_id == session_id]
+
+    def to_jsonl(self, session_id: Optional[str]) -> str:
+        return "".join(
+            json.dumps(span.as_dict(), default=str) + "\n"
+            for span in self.session_spans(session_id)
+        )
+
+    def totals(self, session_id: Optional[str]) -> dict:
+        totals: dict = {}
+        for span in self.session_spans(session_id):
+            total = totals.setdefault(span.name, {"count": 0, "ms": 0.0})
+            total["count"] += 1
+            total["ms"] += span.seconds * 1000
+        return totals
+
+    def clear(self, session_id: Optional[str]):
+        with self._lock:
+            kept = [span for span in self.spans if span.session_id != session_id]
+            self.spans = deque(kept, maxlen=self.spans.maxlen)
+
+
+recorder = SpanRecorder.from_env()
+atexit.register(recorder.close)
+span = recorder.span
+trace = recorder.trace
+
+
+def timed_import(name: str):
+    # Imports a module on first use and records how long that took, so
+    # deferred imports show up next to the work that triggered them
+    if name in sys.modules:
+        # Waits if another thread is still importing it
+        return importlib.import_module(name)
+    with span("import", module=name):
+        return importlib.import_module(name)
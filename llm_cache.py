@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from langchain_core.messages import BaseMessage, SystemMessage
+
+LLM_CACHE_MODES = ("on", "off", "replay")
+# Part of every key. Bump it when the cached payload or the models that
+# parse it change, so older entries are never read.
+CACHE_SCHEMA_VERSION = 2
+
+# The system prompt embeds the current timestamp; only the date matters
+TIMESTAMP_PATTERN = re.compile(r"(\d{4}-\d{2}-\d{2})[ T][\d:.]+(?:[+-]\d{2}:\d{2})?")
+
+
+class CacheMissError(LookupError):
+    pass
+
+
+def normalize_content(message: BaseMessage) -> str:
+    content = " ".join(str(message.content).split())
+    if isinstance(message, SystemMessage):
+        content = TIMESTAMP_PATTERN.sub(r"\1", content)
+    return content
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        path: str,
+        mode: str = "on",
+        ttl_seconds: int = 7 * 24 * 60 * 60,
+        max_entries: int = 1000,
+    ):
+        if mode not in LLM_CACHE_MODES:
+            raise ValueError(f"{mode} is not a valid cache mode {LLM_CACHE_MODES}")
+        self.path = path
+        self.mode = mode
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        if mode != "off":
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    " key TEXT PRIMARY KEY,"
+                    " payload TEXT NOT NULL,"
+                    " created_at REAL NOT NULL,"
+                    " last_used_at REAL NOT NULL)"
+                )
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        return cls(
+            path=os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite3"),
+            mode=os.getenv("LLM_CACHE_MODE", "on"),
+            ttl_seconds=int(os.getenv("LLM_CACHE_TTL_SECONDS", 7 * 24 * 60 * 60)),
+            max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", 1000)),
+        )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def key(self, model: str, messages: list) -> str:
+        normalized = [(msg.type, normalize_content(msg)) for msg in messages]
+        payload = json.dumps(
+            [CACHE_SCHEMA_VERSION, model, normalized], ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        if self.mode == "off":
+            return None
+
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT payload FROM responses WHERE key = ? AND created_at >= ?",
+                (key, now - self.ttl_seconds),
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE responses SET last_used_at = ? WHERE key = ?", (now, key)
+                )
+
+        if row is None and self.mode == "replay":
+            raise CacheMissError(f"No cached LLM response for {key} in replay mode")
+        return row[0] if row else None
+
+    def put(self, key: str, payload: str):
+        if self.mode != "on":
+            return
+
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, payload, now, now),
+            )
+            conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)
+            )
+            # Evict the least recently used entries beyond max_entries
+            conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY last_used_at DESC"
+                " LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def discard(self, key: str):
+        if self.mode == "off":
+            return
+        with self._connect() as conn:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
@@ -0,0 +1,229 @@
+import json
+import time
+from functools import lru_cache
+from typing import TYPE_CHECKING, Callable, List, NamedTuple
+
+from dotenv import load_dotenv
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.pydantic_v1 import BaseModel, Field
+from langchain_core.utils.json import parse_partial_json
+
+import fast_parser
+import schedules_ai as sai
+from history import count_tokens, message_tokens
+from instrumentation import span, timed_import
+from llm_cache import CacheMissError, ResponseCache
+
+if TYPE_CHECKING:
+    from langchain_core.runnables import Runnable
+
+    from response_repair import RepairingOutputParser
+
+# The LLM call and its response cache, shared by the Streamlit app and the
+# batch CLI. Kept free of UI code so batch runs don't import Streamlit.
+
+load_dotenv()
+LLM_MODEL = "gpt-3.5-turbo"
+response_cache = ResponseCache.from_env()
+
+
+class Response(BaseModel):
+    message: str = Field(description="The response message.")
+    schedule_layers: List[sai.ScheduleLayers] | None = Field(
+        default=[],
+        description="list of ScheduleLayer objects",
+    )
+
+
+def fast_path_response(user_input: str) -> Response | None:
+    layers = fast_parser.try_parse(user_input)
+    if layers is None:
+        return None
+    return Response(
+        message="Success! I created the schedule layers from your description.",
+        schedule_layers=layers,
+    )
+
+
+def cached_response(cache_key: str) -> Response | None:
+    # The cache holds the model's raw output, validated again on every hit.
+    # Parsed without the LLM client, so replay works offline.
+    cached = response_cache.get(cache_key)
+    if cached is None:
+        return None
+    response = get_parser().parse_locally(cached)
+    if response is None:
+        # e.g. a cached start date that is no longer in the future
+        if response_cache.mode == "replay":
+            raise CacheMissError(f"Cached LLM response for {cache_key} is invalid")
+        response_cache.discard(cache_key)
+    return response
+
+
+def parse_and_cache(chain: "ResponseChain", cache_key: str, text: str) -> Response:
+    response = chain.parser.parse_locally(text)
+    if response is None:
+        # Output only the fixing parser's extra LLM call could repair isn't
+        # cached, so a hit never needs another call
+        return chain.parser.fix(text)
+    response_cache.put(cache_key, text)
+    return response
+
+
+async def aparse_and_cache(
+    chain: "ResponseChain", cache_key: str, text: str
+) -> Response:
+    response = chain.parser.parse_locally(text)
+    if response is None:
+        return await chain.parser.afix(text)
+    response_cache.put(cache_key, text)
+    return response
+
+
+class ResponseChain(NamedTuple):
+    # The prompt piped into the model, returning its raw message
+    model: "Runnable"
+    parser: "RepairingOutputParser"
+
+
+@lru_cache(maxsize=1)
+def get_llm():
+    # Built on first use and shared by every session and rerun; constructing
+    # the client takes a noticeable fraction of a second
+    langchain_openai = timed_import("langchain_openai")
+    return langchain_openai.ChatOpenAI(
+        model=LLM_MODEL, model_kwargs={"response_format": {"type": "json_object"}}
+    )
+
+
+@lru_cache(maxsize=1)
+def get_parser() -> "RepairingOutputParser":
+    # Strict parse plus local repair, with no fixing parser and so no client
+    output_parsers = timed_import("langchain.output_parsers")
+    response_repair = timed_import("response_repair")
+    parser = output_parsers.PydanticOutputParser(pydantic_object=Response)
+    return response_repair.RepairingOutputParser(parser=parser)
+
+
+@lru_cache(maxsize=4)
+def get_chain(system_content: str) -> ResponseChain:
+    # Built once per system message; each turn only fills in the history and
+    # input, so the system message and format instructions form a stable
+    # prompt prefix.
+    output_parsers = timed_import("langchain.output_parsers")
+    prompts = timed_import("langchain_core.prompts")
+    response_repair = timed_import("response_repair")
+    llm = get_llm()
+    parser = get_parser().parser
+    fix_parser = output_parsers.OutputFixingParser.from_llm(
+        parser=parser, llm=llm  # type: ignore
+    )
+    format_instructions = f"Format instructions: {parser.get_format_instructions()}."
+    system_message = system_content + format_instructions.replace(
+        "{", "{{"
+    ).replace("}", "}}")
+    repairing_parser = response_repair.RepairingOutputParser(
+        parser=parser, fix_parser=fix_parser
+    )
+    prompt = prompts.ChatPromptTemplate.from_messages(
+        [
+            SystemMessage(content=system_message),
+            prompts.MessagesPlaceholder("history"),
+            ("human", "{input}"),
+        ]
+    )
+    return ResponseChain(model=prompt | llm, parser=repairing_parser)
+
+
+def chain_inputs(user_input: str, message_history: list) -> dict:
+    return {"history": message_history[1:], "input": user_input}
+
+
+def prompt_tokens(user_input: str, message_history: list) -> int:
+    # Excludes the format instructions, which are the same on every call
+    return sum(message_tokens(m) for m in message_history) + count_tokens(user_input)
+
+
+def invoke_llm(user_input: str, message_history: list) -> Response:
+    with span("invoke_llm", input_bytes=len(user_input)) as attrs:
+        response = fast_path_response(user_input)
+        if response is not None:
+            attrs["source"] = "fast_path"
+            return response
+
+        cache_key = response_cache.key(
+            LLM_MODEL, message_history + [HumanMessage(content=user_input)]
+        )
+        response = cached_response(cache_key)
+        if response is not None:
+            attrs["source"] = "cache"
+            return response
+
+        attrs["source"] = "llm"
+        chain = get_chain(message_history[0].content)
+        started = time.perf_counter()
+        with span(
+            "llm.invoke", prompt_tokens=prompt_tokens(user_input, message_history)
+        ) as llm_attrs:
+            text = chain.model.invoke(chain_inputs(user_input, message_history)).content
+            llm_attrs["response_bytes"] = len(text)
+            llm_attrs["completion_tokens"] = count_tokens(text)
+        response = parse_and_cache(chain, cache_key, text)
+        fast_parser.stats.record_llm(time.perf_counter() - started)
+
+        return response
+
+
+async def ainvoke_llm(
+    user_input: str,
+    message_history: list,
+    on_message: Callable[[str], None],
+) -> Response:
+    with span("invoke_llm", input_bytes=len(user_input)) as attrs:
+        attrs["source"] = "fast_path"
+        response = fast_path_response(user_input)
+        if response is None:
+            attrs["source"] = "cache"
+            cache_key = response_cache.key(
+                LLM_MODEL, message_history + [HumanMessage(content=user_input)]
+            )
+            response = cached_response(cache_key)
+        if response is not None:
+            on_message(response.message)
+            return response
+
+        attrs["source"] = "llm"
+        chain = get_chain(message_history[0].content)
+        started = time.perf_counter()
+        text = ""
+        message = ""
+        with span(
+            "llm.stream", prompt_tokens=prompt_tokens(user_input, message_history)
+        ) as llm_attrs:
+            inputs = chain_inputs(user_input, message_history)
+            async for chunk in chain.model.astream(inputs):
+                if not text:
+                    llm_attrs["first_chunk_ms"] = round(
+                        (time.perf_counter() - started) * 1000, 3
+                    )
+                text += chunk.content
+                # Surface the "message" field as soon as it starts arriving
+                try:
+                    partial = parse_partial_json(text)
+                except json.JSONDecodeError:
+                    partial = None
+                if isinstance(partial, dict) and isinstance(
+                    partial.get("message"), str
+                ):
+                    message = partial["message"]
+                # Called for every chunk, even once the message is complete,
+                # so a Streamlit caller can stop the stream on a resubmit
+                on_message(message)
+            llm_attrs["response_bytes"] = len(text)
+            llm_attrs["completion_tokens"] = count_tokens(text)
+
+        response = await aparse_and_cache(chain, cache_key, text)
+        fast_parser.stats.record_llm(time.perf_counter() - started)
+        on_message(response.message)
+
+        return response
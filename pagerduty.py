@@ -0,0 +1,579 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime as dt
+from datetime import timedelta
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+import httpx
+
+import pd_timezones
+import schedules_ai as sai
+
+PAGERDUTY_API_URL = os.getenv("PAGERDUTY_API_URL", "https://api.pagerduty.com")
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# Transport errors raised before the request was sent. After any other
+# transport error the request may have reached PagerDuty.
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+# Appended to the description of every schedule the client creates, so a
+# schedule from an earlier attempt can be told apart from an unrelated one
+# with the same name
+MARKER_PREFIX = "schedules-ai:"
+
+
+def local_midnight(layer: sai.ScheduleLayers, day: int) -> dt:
+    # 00:00 in the layer's timezone, `day` days after the layer's start date
+    tz = pd_timezones.get_tz(layer.timezone)
+    local = layer.start.astimezone(tz).replace(tzinfo=None)
+    midnight = local.replace(hour=0, minute=0, second=0, microsecond=0)
+    return sai.localize_wall_time(layer.timezone, midnight + timedelta(days=day))
+
+
+def restriction_payload(restriction, weekly: bool = True) -> dict:
+    payload = {
+        "type": "weekly_restriction" if weekly else "daily_restriction",
+        "start_time_of_day": restriction.start_time_of_day,
+        "duration_seconds": restriction.duration_seconds,
+    }
+    if weekly:
+        payload["start_day_of_week"] = restriction.start_day_of_week
+    return payload
+
+
+def layer_rotations(layer: sai.ScheduleLayers) -> List[tuple]:
+    # PagerDuty hands the layer to the next user every
+    # rotation_turn_length_seconds of calendar time, counted from
+    # rotation_virtual_start. The preview advances the rotation after every
+    # daily shift and at the end of every Sunday for weekly restrictions.
+    # Returns (restrictions, daily, virtual start, turn length, user names)
+    # for each PagerDuty layer that reproduces the preview.
+    names = [user.user_name for user in layer.users]
+    table = layer.weekday_table
+    turns_per_shift = layer.num_shifts
+    if len(set(names)) == 1:
+        return [(layer.restrictions, layer.everyday, layer.start, 86400, names)]
+
+    if not table.weekly and table.daily_counts == (1,) * 7:
+        # One shift a day: a turn per calendar day is a turn per shift
+        daily = layer.everyday
+        turn_length = 86400 * turns_per_shift
+        return [(layer.restrictions, daily, layer.start, turn_length, names)]
+
+    sunday_slot = table.slots[6]
+    crosses_midnight = any(r.start_offset + r.duration > 86400 for r in sunday_slot)
+    if table.weekly and not any(table.daily_counts) and not crosses_midnight:
+        # Turns change at Monday 00:00, counted from the week of the start
+        monday = local_midnight(layer, -(layer.start.isoweekday() - 1))
+        turn_length = 604800 * turns_per_shift
+        return [(layer.restrictions, False, monday, turn_length, names)]
+
+    # Otherwise each on-call slot of the week gets its own layer handing over
+    # weekly at 00:00 on that day. Slot j's m-th occurrence is `per_week`
+    # turns after its first, so its users repeat with period `period`.
+    per_week = sum(table.daily_counts) + table.weekly
+    cycle = len(names) * turns_per_shift
+    period = cycle // math.gcd(per_week, cycle)
+    rotations = []
+    for day in range(7):
+        weekday = layer._weekday(day)
+        turns = layer._turns_before(day)
+        for restriction, compiled in zip(
+            [r for r in layer.restrictions if r.start_day_of_week == weekday],
+            table.slots[weekday - 1],
+        ):
+            users = [
+                names[(turns + m * per_week) // turns_per_shift % len(names)]
+                for m in range(period)
+            ]
+            virtual_start = local_midnight(layer, day)
+            rotations.append(([restriction], False, virtual_start, 604800, users))
+            turns += compiled.daily
+    return rotations
+
+
+def build_layer_payloads(
+    layer: sai.ScheduleLayers, index: int, user_ids: Dict[str, str]
+) -> List[dict]:
+    # PagerDuty applies a daily_restriction to every day, so only everyday
+    # layers use one; other layers list each on-call day as a weekly
+    # restriction. Our restriction type only sets the rotation length.
+    rotations = layer_rotations(layer)
+    payloads = []
+    for part, (restrictions, daily, virtual_start, turn_length, names) in enumerate(
+        rotations
+    ):
+        if daily:
+            restrictions = [restrictions[0]]
+        name = f"Layer {index + 1}"
+        if len(rotations) > 1:
+            name += f".{part + 1}"
+        payload = {
+            "name": name,
+            "start": layer.start.isoformat(),
+            "rotation_virtual_start": virtual_start.isoformat(),
+            "rotation_turn_length_seconds": turn_length,
+            "users": [
+                {"user": {"id": user_ids[user_name], "type": "user_reference"}}
+                for user_name in names
+            ],
+            "restrictions": [
+                restriction_payload(r, weekly=not daily) for r in restrictions
+            ],
+        }
+        if layer.end:
+            payload["end"] = layer.end.isoformat()
+        payloads.append(payload)
+    return payloads
+
+
+def layer_user_names(layers: List[sai.ScheduleLayers]) -> List[str]:
+    return sorted({user.user_name for layer in layers for user in layer.users})
+
+
+def build_schedule_payload(
+    config: sai.Config,
+    layers: List[sai.ScheduleLayers],
+    user_ids: Dict[str, str],
+) -> dict:
+    # Request body for POST /schedules. Layers later in the list take
+    # precedence, as in PagerDuty. user_ids maps user names to PagerDuty user
+    # IDs, which PagerDuty requires in place of names.
+    missing = [name for name in layer_user_names(layers) if name not in user_ids]
+    if missing:
+        raise ValueError(f"No PagerDuty user ID for {', '.join(missing)}")
+
+    schedule = {
+        "type": "schedule",
+        "name": config.name,
+        "time_zone": config.timezone,
+        "schedule_layers": [
+            payload
+            for i, layer in enumerate(layers)
+            for payload in build_layer_payloads(layer, i, user_ids)
+        ],
+    }
+    if config.description:
+        schedule["description"] = config.description
+    return {"schedule": schedule}
+
+
+def idempotency_key(payload: dict) -> str:
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def schedule_marker(key: str) -> str:
+    return f"[{MARKER_PREFIX}{key[:32]}]"
+
+
+def with_marker(payload: dict, key: str) -> dict:
+    schedule = dict(payload["schedule"])
+    description = schedule.get("description")
+    marker = schedule_marker(key)
+    schedule["description"] = f"{description} {marker}" if description else marker
+    return {**payload, "schedule": schedule}
+
+
+def retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    if value is None:
+        # PagerDuty's rate limit headers give the seconds until the window resets
+        value = response.headers.get("ratelimit-reset")
+        if value is None:
+            return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class UserLookupError(ValueError):
+    pass
+
+
+class SubmitResult(NamedTuple):
+    key: str
+    name: Optional[str]
+    ok: bool
+    status: str
+    schedule_id: Optional[str] = None
+    error: Optional[str] = None
+    attempts: int = 0
+
+    def as_dict(self) -> dict:
+        return self._asdict()
+
+
+class PagerDutyClient:
+    # Submits schedules over one pooled connection set, with at most
+    # `concurrency` requests in flight. The PagerDuty REST API has no
+    # idempotency keys, so each payload is keyed by a hash of its body
+    # instead. Successes are journaled so a rerun skips them, and the key is
+    # written into the schedule's description so that a request which may
+    # have reached PagerDuty can be found before it is retried.
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = PAGERDUTY_API_URL,
+        concurrency: int = 8,
+        retries: int = 5,
+        backoff_seconds: float = 1.0,
+        max_backoff_seconds: float = 60.0,
+        timeout_seconds: float = 30.0,
+        journal_path: Optional[str] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.journal_path = journal_path
+        self.journal = self._load_journal()
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={
+                "Authorization": f"Token token={api_key}",
+                "Accept": "application/vnd.pagerduty+json;version=2",
+                "Content-Type": "application/json",
+            },
+            timeout=timeout_seconds,
+            limits=httpx.Limits(
+                max_connections=concurrency, max_keepalive_connections=concurrency
+            ),
+            transport=transport,
+        )
+
+    @classmethod
+    def from_env(cls, **kwargs) -> "PagerDutyClient":
+        api_key = os.getenv("PAGERDUTY_API_KEY")
+        if not api_key:
+            raise ValueError("PAGERDUTY_API_KEY is not set")
+        return cls(api_key=api_key, **kwargs)
+
+    async def __aenter__(self) -> "PagerDutyClient":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    def _load_journal(self) -> Dict[str, str]:
+        journal = {}
+        if self.journal_path and os.path.exists(self.journal_path):
+            with open(self.journal_path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        journal[entry["key"]] = entry["schedule_id"]
+        return journal
+
+    def _record(self, key: str, name: Optional[str], schedule_id: str):
+        self.journal[key] = schedule_id
+        if self.journal_path:
+            with open(self.journal_path, "a") as f:
+                entry = {"key": key, "name": name, "schedule_id": schedule_id}
+                f.write(json.dumps(entry) + "\n")
+
+    def _backoff(self, attempt: int, response: Optional[httpx.Response] = None):
+        if response is not None:
+            retry_after = retry_after_seconds(response)
+            if retry_after is not None:
+                return min(retry_after, self.max_backoff_seconds)
+        # Exponential backoff with jitter so workers don't retry in lockstep
+        delay = self.backoff_seconds * 2**attempt * (1 + random.random())
+        return min(delay, self.max_backoff_seconds)
+
+    async def _get(self, path: str, params: dict) -> dict:
+        # GETs are safe to repeat, so every transport error is retried
+        for attempt in range(self.retries + 1):
+            response = None
+            try:
+                response = await self._client.get(path, params=params)
+            except httpx.TransportError:
+                if attempt == self.retries:
+                    raise
+            else:
+                if response.status_code not in RETRYABLE_STATUS:
+                    response.raise_for_status()
+                    return response.json()
+                if attempt == self.retries:
+                    response.raise_for_status()
+            await asyncio.sleep(self._backoff(attempt, response))
+
+    async def find_user(self, name: str) -> List[str]:
+        # IDs of the users whose name or email is exactly `name`, ignoring case
+        body = await self._get("/users", {"query": name})
+        wanted = name.strip().casefold()
+        matches = []
+        for user in body.get("users", []):
+            fields = (user.get("name"), user.get("email"))
+            if wanted in (str(field or "").casefold() for field in fields):
+                matches.append(user["id"])
+        return matches
+
+    async def resolve_user_ids(self, names) -> Dict[str, str]:
+        # PagerDuty user ID for each user name; raises UserLookupError naming
+        # every user that matches no one or several people
+        names = sorted(set(names))
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bounded(name):
+            async with semaphore:
+                return await self.find_user(name)
+
+        try:
+            matches = await asyncio.gather(*(bounded(name) for name in names))
+        except (httpx.HTTPError, ValueError) as e:
+            raise UserLookupError(f"Could not look up PagerDuty users: {e!r}") from e
+        unknown = [name for name, ids in zip(names, matches) if not ids]
+        ambiguous = [name for name, ids in zip(names, matches) if len(ids) > 1]
+        problems = []
+        if unknown:
+            problems.append(f"no PagerDuty user matches {', '.join(unknown)}")
+        if ambiguous:
+            problems.append(f"several PagerDuty users match {', '.join(ambiguous)}")
+        if problems:
+            message = "; ".join(problems)
+            raise UserLookupError(message[:1].upper() + message[1:])
+        return {name: ids[0] for name, ids in zip(names, matches)}
+
+    async def find_schedule(self, name: str, key: str) -> Optional[str]:
+        # A schedule this client created from the payload with this key
+        body = await self._get("/schedules", {"query": name})
+        marker = schedule_marker(key)
+        for schedule in body.get("schedules", []):
+            if schedule.get("name") == name and marker in (
+                schedule.get("description") or ""
+            ):
+                return schedule["id"]
+        return None
+
+    async def _lookup(self, name: Optional[str], key: str) -> Optional[str]:
+        if not name:
+            return None
+        try:
+            return await self.find_schedule(name, key)
+        except (httpx.HTTPError, ValueError, KeyError, TypeError, AttributeError):
+            return None
+
+    async def submit(self, payload: dict) -> SubmitResult:
+        key = idempotency_key(payload)
+        name = payload["schedule"].get("name")
+        if key in self.journal:
+            return SubmitResult(key, name, True, "skipped", self.journal[key])
+        body = with_marker(payload, key)
+
+        error = None
+        maybe_sent = False
+        for attempt in range(self.retries + 1):
+            if maybe_sent:
+                # An earlier attempt may have created the schedule
+                schedule_id = await self._lookup(name, key)
+                if schedule_id:
+                    self._record(key, name, schedule_id)
+                    return SubmitResult(
+                        key, name, True, "exists", schedule_id, attempts=attempt
+                    )
+
+            response = None
+            try:
+                response = await self._client.post("/schedules", json=body)
+            except httpx.TransportError as e:
+                error = repr(e)
+                maybe_sent = maybe_sent or not isinstance(e, UNSENT_ERRORS)
+            else:
+                if response.status_code in (200, 201):
+                    return await self._created(key, name, response, attempt + 1)
+                error = f"HTTP {response.status_code}: {response.text[:500]}"
+                if response.status_code not in RETRYABLE_STATUS:
+                    return SubmitResult(
+                        key, name, False, "rejected", error=error, attempts=attempt + 1
+                    )
+                # A rate-limited request was not processed; a server error may
+                # have been
+                maybe_sent = maybe_sent or response.status_code != 429
+
+            if attempt < self.retries:
+                await asyncio.sleep(self._backoff(attempt, response))
+
+        return SubmitResult(
+            key, name, False, "failed", error=error, attempts=self.retries + 1
+        )
+
+    async def _created(
+        self, key: str, name: Optional[str], response: httpx.Response, attempts: int
+    ) -> SubmitResult:
+        try:
+            schedule_id = response.json()["schedule"]["id"]
+        except (ValueError, KeyError, TypeError):
+            # Created, but the body doesn't say as what
+            schedule_id = await self._lookup(name, key)
+            if schedule_id is None:
+                return SubmitResult(
+                    key,
+                    name,
+                    False,
+                    "malformed",
+                    error=f"No schedule id in the response: {response.text[:500]}",
+                    attempts=attempts,
+                )
+        self._record(key, name, schedule_id)
+        return SubmitResult(key, name, True, "created", schedule_id, attempts=attempts)
+
+    async def submit_many(self, payloads) -> List[SubmitResult]:
+        payloads = list(payloads)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bounded(payload):
+            async with semaphore:
+                return await self.submit(payload)
+
+        # One payload failing unexpectedly doesn't discard the other results
+        results = await asyncio.gather(
+            *(bounded(payload) for payload in payloads), return_exceptions=True
+        )
+        return [
+            result
+            if isinstance(result, SubmitResult)
+            else SubmitResult(
+                idempotency_key(payload),
+                payload.get("schedule", {}).get("name"),
+                False,
+                "failed",
+                error=repr(result),
+            )
+            for payload, result in zip(payloads, results)
+        ]
+
+
+class ScheduleRecord(NamedTuple):
+    config: sai.Config
+    layers: List[sai.ScheduleLayers]
+    # User name -> PagerDuty user ID, for the users given in the record
+    user_ids: Dict[str, str]
+
+
+def read_schedules(path: str) -> Iterator[ScheduleRecord]:
+    # JSONL of {"name", "description", "timezone", "schedule_layers"} records,
+    # optionally with a "user_ids" name -> PagerDuty ID mapping
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            config = sai.Config(
+                name=record["name"],
+                description=record.get("description"),
+                timezone=record["timezone"],
+            )
+            layers = [sai.ScheduleLayers(**v) for v in record["schedule_layers"]]
+            yield ScheduleRecord(config, layers, record.get("user_ids") or {})
+
+
+def unmapped_user_names(records: List[ScheduleRecord]) -> List[str]:
+    return sorted(
+        {
+            name
+            for record in records
+            for name in layer_user_names(record.layers)
+            if name not in record.user_ids
+        }
+    )
+
+
+async def build_payloads(
+    records: List[ScheduleRecord], client: Optional["PagerDutyClient"] = None
+) -> List[dict]:
+    # Users without an ID in their record are looked up in PagerDuty, once
+    # across all the records
+    missing = unmapped_user_names(records)
+    found = {}
+    if missing:
+        if client is None:
+            raise UserLookupError(
+                f"No PagerDuty user ID for {', '.join(missing)}; add them to"
+                " user_ids or set PAGERDUTY_API_KEY to look them up"
+            )
+        found = await client.resolve_user_ids(missing)
+    return [
+        build_schedule_payload(
+            record.config, record.layers, {**found, **record.user_ids}
+        )
+        for record in records
+    ]
+
+
+async def submit_file(path: str, **client_options) -> List[SubmitResult]:
+    records = list(read_schedules(path))
+    async with PagerDutyClient.from_env(**client_options) as client:
+        payloads = await build_payloads(records, client)
+        return await client.submit_many(payloads)
+
+
+async def dry_run(path: str, **client_options) -> List[dict]:
+    # Users are looked up only when some record doesn't map them
+    records = list(read_schedules(path))
+    if not unmapped_user_names(records):
+        return await build_payloads(records)
+    async with PagerDutyClient.from_env(**client_options) as client:
+        return await build_payloads(records, client)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description="Create PagerDuty schedules from validated schedule layers."
+    )
+    arg_parser.add_argument("input", help="JSONL file of schedules")
+    arg_parser.add_argument("--base-url", default=PAGERDUTY_API_URL)
+    arg_parser.add_argument("--concurrency", type=int, default=8)
+    arg_parser.add_argument("--retries", type=int, default=5)
+    arg_parser.add_argument("--backoff", type=float, default=1.0)
+    arg_parser.add_argument(
+        "--journal",
+        default=".pagerduty_journal.jsonl",
+        help="created schedules, skipped when the same payload is submitted again",
+    )
+    arg_parser.add_argument(
+        "--dry-run", action="store_true", help="print the request bodies only"
+    )
+    args = arg_parser.parse_args(argv)
+
+    if args.dry_run:
+        payloads = asyncio.run(dry_run(args.input, base_url=args.base_url))
+        for payload in payloads:
+            print(json.dumps(payload))
+        return 0
+
+    results = asyncio.run(
+        submit_file(
+            args.input,
+            base_url=args.base_url,
+            concurrency=args.concurrency,
+            retries=args.retries,
+            backoff_seconds=args.backoff,
+            journal_path=args.journal,
+        )
+    )
+    for result in results:
+        print(json.dumps(result.as_dict()))
+    failed = sum(not result.ok for result in results)
+    print(f"{len(results) - failed} submitted, {failed} failed", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
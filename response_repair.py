@@ -0,0 +1,225 @@
+import json
+import re
+from typing import Any, Optional
+
+from langchain_core.exceptions import OutputParserException
+from langchain_core.output_parsers import BaseOutputParser
+
+from instrumentation import span
+
+TIME_RE = re.compile(
+    r"^\s*(\d{1,2})(?::(\d{1,2}))?(?::(\d{1,2}))?\s*([ap])?\.?m?\.?\s*$", re.IGNORECASE
+)
+INT_FIELDS = ("num_shifts", "rotation_turn_length_seconds")
+RESTRICTION_INT_FIELDS = ("duration_seconds", "start_day_of_week")
+# Pre validators in schedules_ai index into the raw dicts, so a missing field
+# can surface as a KeyError or TypeError rather than a validation error
+PARSE_ERRORS = (OutputParserException, KeyError, TypeError)
+
+
+class RepairStats:
+    def __init__(self):
+        self.parsed = 0
+        self.repaired = 0
+        self.llm_fixes = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "parsed": self.parsed,
+            "repaired": self.repaired,
+            "llm_fixes": self.llm_fixes,
+        }
+
+
+stats = RepairStats()
+
+
+def repair_json(text: str) -> str:
+    # Drop markdown fences and anything before the first object
+    text = re.sub(r"```(?:json)?", "", text).strip()
+    start = text.find("{")
+    if start == -1:
+        raise ValueError("no JSON object found")
+    text = text[start:]
+
+    # Close a truncated string and any brackets left open
+    stack = []
+    in_string = escaped = False
+    end = len(text)
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                end = i + 1
+                break
+
+    text = text[:end]
+    if in_string:
+        text += '"'
+    text = text.rstrip()
+    if stack and stack[-1] == "}":
+        # A key cut off before its value
+        text = re.sub(r'([{,])\s*"(?:[^"\\]|\\.)*"\s*:?$', r"\1", text)
+    text = re.sub(r"[,:]\s*$", "", text)
+    text += "".join(reversed(stack))
+    # Trailing commas before a closing bracket
+    return re.sub(r",\s*([}\]])", r"\1", text)
+
+
+def normalize_time(value: Any) -> Any:
+    match = TIME_RE.match(str(value))
+    if not match:
+        return value
+    hour, minute, second, meridiem = match.groups()
+    hour = int(hour)
+    if meridiem:
+        hour = hour % 12 + (12 if meridiem.lower() == "p" else 0)
+    return f"{hour:02d}:{int(minute or 0):02d}:{int(second or 0):02d}"
+
+
+def coerce_int(value: Any) -> Any:
+    if isinstance(value, str) and re.fullmatch(r"\s*\d+(\.0+)?\s*", value):
+        return int(float(value))
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def coerce_bool(value: Any) -> Any:
+    if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+        return value.strip().lower() == "true"
+    return value
+
+
+def coerce_user(user: Any) -> Any:
+    if isinstance(user, str):
+        return {"user_name": user, "type": "user_reference"}
+    if isinstance(user, dict):
+        # PagerDuty's {"user": {"id": ..., "type": ...}} shape
+        if "user_name" not in user and isinstance(user.get("user"), dict):
+            user = {"user_name": user["user"].get("id")}
+        user = {**user, "type": "user_reference"}
+    return user
+
+
+def coerce_layer(layer: Any) -> Any:
+    if not isinstance(layer, dict):
+        return layer
+    layer = dict(layer)
+    for field in INT_FIELDS:
+        if field in layer:
+            layer[field] = coerce_int(layer[field])
+    layer["everyday"] = coerce_bool(layer.get("everyday", False))
+    if isinstance(layer.get("users"), list):
+        layer["users"] = [coerce_user(user) for user in layer["users"]]
+
+    default_type = (
+        "weekly_restriction"
+        if layer.get("rotation_turn_length_seconds") == 604800
+        else "daily_restriction"
+    )
+    restrictions = []
+    for restriction in layer.get("restrictions") or []:
+        if isinstance(restriction, dict):
+            restriction = dict(restriction)
+            for field in RESTRICTION_INT_FIELDS:
+                if field in restriction:
+                    restriction[field] = coerce_int(restriction[field])
+            if "start_time_of_day" in restriction:
+                restriction["start_time_of_day"] = normalize_time(
+                    restriction["start_time_of_day"]
+                )
+            restriction.setdefault("type", default_type)
+        restrictions.append(restriction)
+    if "restrictions" in layer:
+        layer["restrictions"] = restrictions
+    return layer
+
+
+def coerce_response(data: Any) -> Any:
+    if not isinstance(data, dict):
+        return data
+    data = dict(data)
+    if isinstance(data.get("schedule_layers"), list):
+        data["schedule_layers"] = [
+            coerce_layer(layer) for layer in data["schedule_layers"]
+        ]
+    return data
+
+
+class RepairingOutputParser(BaseOutputParser):
+    # Tries the strict parser, then a local repair, and only then the fixing
+    # parser's extra LLM round trip. Without a fixing parser it only parses
+    # locally, which needs no LLM client.
+    parser: BaseOutputParser
+    fix_parser: Optional[BaseOutputParser] = None
+
+    def _parse_locally(self, text: str):
+        try:
+            result = self.parser.parse(text)
+        except PARSE_ERRORS:
+            pass
+        else:
+            stats.parsed += 1
+            return result
+
+        try:
+            repaired = coerce_response(json.loads(repair_json(text)))
+            result = self.parser.parse(json.dumps(repaired))
+        except (*PARSE_ERRORS, ValueError):
+            return None
+        stats.repaired += 1
+        return result
+
+    def parse_locally(self, text: str) -> Any:
+        # The strict parser, then the local repair; None if both fail
+        with span("parser.parse", payload_bytes=len(text)) as attrs:
+            result = self._parse_locally(text)
+            attrs["fixed_by_llm"] = result is None
+        return result
+
+    def _check_fix_parser(self, text: str):
+        if self.fix_parser is None:
+            raise OutputParserException(
+                "Could not parse the output and no fixing parser is set",
+                llm_output=text,
+            )
+
+    def fix(self, text: str) -> Any:
+        self._check_fix_parser(text)
+        stats.llm_fixes += 1
+        with span("parser.fix", payload_bytes=len(text)):
+            return self.fix_parser.parse(text)
+
+    async def afix(self, text: str) -> Any:
+        self._check_fix_parser(text)
+        stats.llm_fixes += 1
+        with span("parser.fix", payload_bytes=len(text)):
+            return await self.fix_parser.aparse(text)
+
+    def parse(self, text: str) -> Any:
+        result = self.parse_locally(text)
+        return self.fix(text) if result is None else result
+
+    async def aparse(self, text: str) -> Any:
+        result = self.parse_locally(text)
+        return await self.afix(text) if result is None else result
+
+    def get_format_instructions(self) -> str:
+        return self.parser.get_format_instructions()
+
+    @property
+    def _type(self) -> str:
+        return "repairing_output_parser"
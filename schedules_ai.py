@@ -1,49 +1,140 @@
 from datetime import datetime as dt
 from datetime import timedelta, timezone, tzinfo
-from typing import List, Literal, Optional
+from functools import lru_cache
+from typing import Iterator, List, Literal, NamedTuple, Optional
 
+import numpy as np
 import pytz
 from langchain_core.pydantic_v1 import (
     BaseModel,
     Field,
+    PrivateAttr,
     conint,
     root_validator,
     validator,
 )
 
 import pd_timezones
+from instrumentation import span
 
 
 def is_valid_timezone(tz_identifier):
-    pd_tz = pd_timezones.timezones
-    # Check if the provided tz_identifier is in the list of valid timezones
-    return tz_identifier in pd_tz
+    # Check if the provided tz_identifier is in the set of valid timezones
+    return pd_timezones.is_supported(tz_identifier)
 
 
 def is_timezone_aware(date_time):
     return tzinfo is not None
 
 
-def get_matching_restriction(restrictions, start_day_of_week):
-    for restriction in restrictions:
-        if restriction.start_day_of_week == start_day_of_week:
-            return restriction
+@lru_cache(maxsize=1024)
+def parse_time_of_day(value) -> int:
+    # "HH:MM:SS" (single digits allowed, like strptime) to seconds after midnight.
+    # Cached, since every layer repeats a handful of start times.
+    parts = str(value).split(":")
+    if len(parts) != 3 or not all(p.isdigit() and len(p) <= 2 for p in parts):
+        raise ValueError(f"{value} is not a valid time")
+    hour, minute, second = (int(p) for p in parts)
+    if hour > 23 or minute > 59 or second > 61:
+        raise ValueError(f"{value} is not a valid time")
+    return hour * 3600 + minute * 60 + second
+
+
+def localize_wall_times(timezone_name: str, naive: np.ndarray) -> np.ndarray:
+    # Epoch seconds of local wall-clock times (datetime64[s]) in one pass.
+    # A time repeated when clocks go back resolves to its first occurrence,
+    # and a time skipped when clocks go forward moves to the end of the gap.
+    # pandas is imported here so that importing the models stays cheap.
+    import pandas as pd
+
+    index = pd.DatetimeIndex(naive).tz_localize(
+        timezone_name,
+        ambiguous=np.ones(len(naive), dtype=bool),
+        nonexistent="shift_forward",
+    )
+    return index.as_unit("s").asi8
+
+
+def localize_wall_time(timezone_name: str, naive: dt) -> dt:
+    # Same rules as localize_wall_times, without pandas' per-call overhead
+    tz = pd_timezones.get_tz(timezone_name)
+    try:
+        return tz.localize(naive, is_dst=None)
+    except pytz.AmbiguousTimeError:
+        return tz.localize(naive, is_dst=True)
+    except pytz.NonExistentTimeError:
+        naive_array = np.array([naive], "datetime64[s]")
+        seconds = localize_wall_times(timezone_name, naive_array)
+        return dt.fromtimestamp(int(seconds[0]), tz)
+
+
+def get_start_time(rotation, values, table=None):
+    tz = pd_timezones.get_tz(values["timezone"])
+    if table is None:
+        table = WeekdayTable.from_restrictions(values["restrictions"])
+
+    restriction = table.first(rotation.isoweekday())
+    hours, remainder = divmod(restriction.start_offset, 3600)
+    minutes, seconds = divmod(remainder, 60)
+
+    # Set the time on the local date, then find its offset on that date. Whole
+    # seconds, like the expanded shifts.
+    rotation = rotation.astimezone(tz).replace(tzinfo=None)
+    rotation = rotation.replace(
+        hour=hours, minute=minutes, second=seconds, microsecond=0
+    )
 
+    return localize_wall_time(values["timezone"], rotation)
 
-def get_start_time(rotation, values):
-    tz = pytz.timezone(values["timezone"])
 
-    day_of_week = rotation.isoweekday()
-    restriction = get_matching_restriction(values["restrictions"], day_of_week)
+class CompiledRestriction:
+    __slots__ = ("start_offset", "duration", "daily")
 
-    start_time = dt.strptime(restriction.start_time_of_day, "%H:%M:%S").time()
+    def __init__(self, start_offset: int, duration: int, daily: bool):
+        self.start_offset = start_offset
+        self.duration = duration
+        self.daily = daily
 
-    rotation = rotation.astimezone(tz)
-    rotation = rotation.replace(
-        hour=start_time.hour, minute=start_time.minute, second=start_time.second
-    )
 
-    return rotation
+class WeekdayTable:
+    # Restrictions grouped by ISO weekday, with start times parsed to seconds.
+    # slots[weekday - 1] holds that day's restrictions in their original order.
+    __slots__ = ("slots", "mask", "daily_counts", "weekly", "longest")
+
+    def __init__(self, slots: tuple, weekly: bool):
+        self.slots = slots
+        self.mask = sum(1 << i for i, slot in enumerate(slots) if slot)
+        self.daily_counts = tuple(sum(r.daily for r in slot) for slot in slots)
+        self.weekly = weekly
+        self.longest = max((r.duration for slot in slots for r in slot), default=0)
+
+    @classmethod
+    def from_restrictions(cls, restrictions) -> "WeekdayTable":
+        slots = [[] for _ in range(7)]
+        for restriction in restrictions:
+            slots[restriction.start_day_of_week - 1].append(
+                CompiledRestriction(
+                    start_offset=restriction.start_offset_seconds,
+                    duration=restriction.duration_seconds,
+                    daily=restriction.type == "daily_restriction",
+                )
+            )
+        # The last restriction decides whether turns advance each week
+        weekly = bool(restrictions) and restrictions[-1].type == "weekly_restriction"
+        return cls(tuple(tuple(slot) for slot in slots), weekly)
+
+    def matches(self, isoweekday: int) -> bool:
+        return bool(self.mask >> (isoweekday - 1) & 1)
+
+    def first(self, isoweekday: int) -> Optional[CompiledRestriction]:
+        slot = self.slots[isoweekday - 1]
+        return slot[0] if slot else None
+
+
+class Shift(NamedTuple):
+    user_name: str
+    start: dt
+    end: dt
 
 
 class User(BaseModel):
@@ -81,14 +172,13 @@ class Restriction(BaseModel):
         )
     )
 
+    @property
+    def start_offset_seconds(self) -> int:
+        return parse_time_of_day(self.start_time_of_day)
+
     @validator("start_time_of_day", pre=True)
     def validate_start_time(cls, v: str):
-        # Attempt to parse the string into a datetime object then convert to time
-        try:
-            dt.strptime(v, "%H:%M:%S").time()
-        except ValueError:
-            raise ValueError(f"{v} is not a valid time")
-        # Since the field expects a string, convert the time object back to string
+        parse_time_of_day(v)
         return v
 
     @validator("start_day_of_week", pre=True)
@@ -152,15 +242,116 @@ class ScheduleLayers(BaseModel):
         description=("True if the shift occurs every day, False otherwise.")
     )
 
-    @root_validator(pre=True)
-    def generate_user_list(cls, values):
-        num_shifts = values.get("num_shifts", 1)
-        expanded_users = []
-        for user in values["users"]:
-            for _ in range(num_shifts):
-                expanded_users.append(user)
-        values["users"] = expanded_users
-        return values
+    # The restrictions list the table was built from, and the table
+    _weekday_table: Optional[tuple] = PrivateAttr(default=None)
+
+    def __init__(self, **data):
+        users = data.get("users")
+        num_users = len(users) if isinstance(users, list) else 0
+        with span("schedule_layers.validate", users=num_users):
+            super().__init__(**data)
+
+    @property
+    def rotation_length(self) -> int:
+        # Shifts in one full pass through the users
+        return len(self.users) * self.num_shifts
+
+    @property
+    def expanded_users(self) -> List[User]:
+        # Each user repeated num_shifts times, for code that indexes shifts
+        return [user for user in self.users for _ in range(self.num_shifts)]
+
+    def user_at(self, shift_index: int) -> User:
+        # Users are stored once; each covers num_shifts consecutive shifts
+        return self.users[(shift_index // self.num_shifts) % len(self.users)]
+
+    @property
+    def weekday_table(self) -> WeekdayTable:
+        # Rebuilt when restrictions is reassigned
+        cached = self._weekday_table
+        if cached is None or cached[0] is not self.restrictions:
+            table = WeekdayTable.from_restrictions(self.restrictions)
+            cached = self._weekday_table = (self.restrictions, table)
+        return cached[1]
+
+    def day_start_seconds(self, days: np.ndarray) -> np.ndarray:
+        # Epoch seconds at which each day's shifts start: the wall-clock time
+        # of `start` on that day in the layer's timezone, so shifts keep their
+        # local time across DST changes
+        tz = pd_timezones.get_tz(self.timezone)
+        local_start = self.start.astimezone(tz).replace(tzinfo=None)
+        naive = np.datetime64(local_start, "s") + days.astype("timedelta64[D]")
+        return localize_wall_times(self.timezone, naive)
+
+    def _iter_day_starts(self, day: int) -> Iterator[dt]:
+        # One day at a time, as day_start_seconds does for whole arrays
+        tz = pd_timezones.get_tz(self.timezone)
+        local_start = self.start.astimezone(tz).replace(tzinfo=None)
+        while True:
+            yield localize_wall_time(self.timezone, local_start + timedelta(days=day))
+            day += 1
+
+    def _weekday(self, day: int) -> int:
+        return (self.start.isoweekday() - 1 + day) % 7 + 1
+
+    def _turns_before(self, day: int) -> int:
+        # Number of rotation turns taken before the first shift of `day`,
+        # counted in whole weeks plus the remaining partial week
+        table = self.weekday_table
+        weeks, remainder = divmod(day, 7)
+        partial_days = [self._weekday(weeks * 7 + d) for d in range(remainder)]
+
+        turns = weeks * sum(table.daily_counts)
+        turns += sum(table.daily_counts[weekday - 1] for weekday in partial_days)
+
+        if table.weekly:
+            turns += weeks + partial_days.count(7)
+        return turns
+
+    def iter_shifts(self, t0: dt, t1: dt) -> Iterator[Shift]:
+        """Lazily yield every shift overlapping the window [t0, t1)."""
+        if not self.users or not self.restrictions:
+            return
+
+        table = self.weekday_table
+        # A day's shifts start within a DST change of start + day * 24h
+        first_day = (t0 - self.start).total_seconds() - table.longest - 86400
+        day = max(0, int(first_day // 86400))
+        turns = self._turns_before(day)
+
+        for day, day_start in enumerate(self._iter_day_starts(day), start=day):
+            if day_start >= t1 or (self.end and day_start >= self.end):
+                return
+
+            weekday = self._weekday(day)
+            for restriction in table.slots[weekday - 1]:
+                shift_end = day_start + timedelta(seconds=restriction.duration)
+                if self.end:
+                    shift_end = min(shift_end, self.end)
+                if shift_end > t0:
+                    yield Shift(self.user_at(turns).user_name, day_start, shift_end)
+                if restriction.daily:
+                    turns += 1
+
+            if table.weekly and weekday == 7:
+                turns += 1
+
+    def on_call_at(self, when: dt) -> Optional[Shift]:
+        """Return the shift covering `when`, or None if nobody is on call."""
+        on_call = None
+        for shift in self.iter_shifts(when, when + timedelta(microseconds=1)):
+            on_call = shift
+        return on_call
+
+    @validator("timezone", pre=True)
+    def normalize_timezone(cls, v):
+        return pd_timezones.normalize_timezone(v) or v
+
+    @validator("num_shifts")
+    def validate_num_shifts(cls, v):
+        if v < 1:
+            raise ValueError(f"{v} is not a valid number of shifts per user")
+        return v
 
     @root_validator(pre=True)
     def everyday_restriction(cls, values):
@@ -192,19 +383,19 @@ class ScheduleLayers(BaseModel):
         if not values["restrictions"]:
             return
 
-        days_of_week = [r.start_day_of_week for r in values["restrictions"]]
+        table = WeekdayTable.from_restrictions(values["restrictions"])
 
         # If rotation_virtual_start is already on the correct day, use it
-        if values["rotation_virtual_start"].isoweekday() in days_of_week:
+        if table.matches(values["rotation_virtual_start"].isoweekday()):
             values["rotation_virtual_start"] = get_start_time(
-                values["rotation_virtual_start"], values
+                values["rotation_virtual_start"], values, table
             )
             values["start"] = values["rotation_virtual_start"]
         else:
             current = values["rotation_virtual_start"]
-            while current.isoweekday() not in days_of_week:
+            while not table.matches(current.isoweekday()):
                 current += timedelta(days=1)
-            values["start"] = get_start_time(current, values)
+            values["start"] = get_start_time(current, values, table)
         return values
 
     @root_validator
@@ -216,11 +407,11 @@ class ScheduleLayers(BaseModel):
         timezone_str = values.get("timezone")
 
         if isinstance(start, dt) and start.tzinfo is None:
-            tz = pytz.timezone(timezone_str)
+            tz = pd_timezones.get_tz(timezone_str)
             start = tz.localize(start)
 
         if isinstance(end, dt) and end.tzinfo is None:
-            tz = pytz.timezone(timezone_str)
+            tz = pd_timezones.get_tz(timezone_str)
             end = tz.localize(end)
 
         if start < now:
@@ -273,12 +464,17 @@ class Config(BaseModel):
 
     @validator("timezone", pre=True)
     def validate_timezone(cls, v):
+        # Accept aliases and city names such as "Pacific" or "Kolkata"
+        normalized = pd_timezones.normalize_timezone(v)
+        if normalized:
+            return normalized
+
         # Replace spaces with underscores
         v = "/".join(substring.title() for substring in v.split("/"))
         v = v.replace(" ", "_")
 
         try:
-            pytz.timezone(v)
+            pd_timezones.get_tz(v)
             if not is_valid_timezone(v):
                 raise ValueError(f"{v} is not a valid timezone supported by PagerDuty.")
         except pytz.UnknownTimeZoneError:
@@ -0,0 +1,326 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime as dt
+from typing import Iterator, Optional, Tuple
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+import schedules_ai as sai
+
+SESSION_STORE_KINDS = ("sqlite", "files")
+# Session ids come from the URL, so they are also used as file names
+SESSION_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+MESSAGE_TYPES = {"s": SystemMessage, "h": HumanMessage, "a": AIMessage}
+MESSAGE_CODES = {cls: code for code, cls in MESSAGE_TYPES.items()}
+
+
+def encode_layer(layer) -> list:
+    # Users are stored by name; their type is always user_reference
+    if not isinstance(layer, sai.ScheduleLayers):
+        return ["raw", layer]
+    fields = json.loads(layer.json(exclude={"users"}))
+    fields["users"] = [user.user_name for user in layer.users]
+    return ["layer", fields]
+
+
+def decode_layer(entry: list):
+    kind, fields = entry
+    if kind == "raw":
+        return fields
+    # Rebuilt without validation: these layers were validated when they were
+    # created, and their start may no longer be in the future
+    return sai.ScheduleLayers.construct(
+        **{
+            **fields,
+            "start": dt.fromisoformat(fields["start"]),
+            "rotation_virtual_start": dt.fromisoformat(
+                fields["rotation_virtual_start"]
+            ),
+            "end": dt.fromisoformat(fields["end"]) if fields["end"] else None,
+            "users": [
+                sai.User.construct(user_name=name, type="user_reference")
+                for name in fields["users"]
+            ],
+            "restrictions": [
+                sai.Restriction.construct(**r) for r in fields["restrictions"]
+            ],
+        }
+    )
+
+
+def serialize_session(state: dict) -> bytes:
+    # Messages and layers in a compact form, everything else as plain JSON
+    encoded = dict(state)
+    if "messages" in state:
+        encoded["messages"] = [
+            [MESSAGE_CODES[type(message)], message.content]
+            for message in state["messages"]
+        ]
+    if "schedule_layers" in state:
+        encoded["schedule_layers"] = [
+            encode_layer(layer) for layer in state["schedule_layers"]
+        ]
+    if state.get("schedule_config") is not None:
+        encoded["schedule_config"] = state["schedule_config"].dict()
+    payload = json.dumps(encoded, ensure_ascii=False, separators=(",", ":"))
+    return zlib.compress(payload.encode())
+
+
+def deserialize_session(data: bytes) -> dict:
+    state = json.loads(zlib.decompress(data))
+    if "messages" in state:
+        state["messages"] = [
+            MESSAGE_TYPES[code](content=content) for code, content in state["messages"]
+        ]
+    if "schedule_layers" in state:
+        state["schedule_layers"] = [
+            decode_layer(entry) for entry in state["schedule_layers"]
+        ]
+    if state.get("schedule_config") is not None:
+        state["schedule_config"] = sai.Config.construct(**state["schedule_config"])
+    return state
+
+
+class SQLiteSessionBackend:
+    def __init__(
+        self,
+        path: str,
+        ttl_seconds: int = 7 * 24 * 60 * 60,
+        max_sessions: int = 10000,
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " id TEXT PRIMARY KEY,"
+                " payload BLOB NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, session_id: str) -> Optional[Tuple[bytes, float]]:
+        # The payload and when it was saved
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT payload, updated_at FROM sessions"
+                " WHERE id = ? AND updated_at >= ?",
+                (session_id, time.time() - self.ttl_seconds),
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def put(self, session_id: str, payload: bytes):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)",
+                (session_id, payload, now),
+            )
+            conn.execute(
+                "DELETE FROM sessions WHERE updated_at < ?", (now - self.ttl_seconds,)
+            )
+            # Drop the least recently saved sessions beyond max_sessions
+            conn.execute(
+                "DELETE FROM sessions WHERE id IN ("
+                " SELECT id FROM sessions ORDER BY updated_at DESC"
+                " LIMIT -1 OFFSET ?)",
+                (self.max_sessions,),
+            )
+
+    def delete(self, session_id: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+
+class FileSessionBackend:
+    # One compressed file per session, replaced atomically on every save.
+    # Saves also sweep the directory, at most once per sweep interval, for
+    # expired sessions and the least recently saved ones beyond max_sessions.
+    def __init__(
+        self,
+        directory: str,
+        ttl_seconds: int = 7 * 24 * 60 * 60,
+        max_sessions: int = 10000,
+        sweep_interval_seconds: int = 60,
+    ):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.sweep_interval_seconds = sweep_interval_seconds
+        self._last_sweep = 0.0
+        self._sweep_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, session_id: str) -> str:
+        return os.path.join(self.directory, f"{session_id}.session")
+
+    def get(self, session_id: str) -> Optional[Tuple[bytes, float]]:
+        # The payload and when it was saved
+        path = self._path(session_id)
+        try:
+            saved_at = os.path.getmtime(path)
+            if saved_at < time.time() - self.ttl_seconds:
+                return None
+            with open(path, "rb") as f:
+                return f.read(), saved_at
+        except FileNotFoundError:
+            return None
+
+    def put(self, session_id: str, payload: bytes):
+        path = self._path(session_id)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+        self.sweep()
+
+    def sweep(self, force: bool = False):
+        now = time.time()
+        with self._sweep_lock:
+            if not force and now - self._last_sweep < self.sweep_interval_seconds:
+                return
+            self._last_sweep = now
+
+        sessions = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    saved_at = entry.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                if entry.name.endswith(".session"):
+                    sessions.append((saved_at, entry.path))
+                elif entry.name.endswith(".tmp") and saved_at < now - 3600:
+                    # Left behind by a process that died mid-write
+                    sessions.append((0.0, entry.path))
+        sessions.sort(reverse=True)
+        expired = [
+            path
+            for rank, (saved_at, path) in enumerate(sessions)
+            if rank >= self.max_sessions or saved_at < now - self.ttl_seconds
+        ]
+        for path in expired:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def delete(self, session_id: str):
+        try:
+            os.remove(self._path(session_id))
+        except FileNotFoundError:
+            pass
+
+
+class SessionStore:
+    # Keeps the serialized form of the most recently used sessions in memory
+    # and the rest only in the backend. Every load deserializes a fresh copy,
+    # so callers can't change what the store holds. A session is written back
+    # only when its serialized form changed since it was loaded or last saved.
+    def __init__(self, backend, max_hot_sessions: int = 64):
+        self.backend = backend
+        self.max_hot_sessions = max_hot_sessions
+        # Session id -> (payload, digest, saved at)
+        self._hot: "OrderedDict[str, Tuple[bytes, str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "SessionStore":
+        kind = os.getenv("SESSION_STORE", "sqlite")
+        if kind not in SESSION_STORE_KINDS:
+            raise ValueError(
+                f"{kind} is not a valid session store {SESSION_STORE_KINDS}"
+            )
+        ttl_seconds = int(os.getenv("SESSION_TTL_SECONDS", 7 * 24 * 60 * 60))
+        max_sessions = int(os.getenv("SESSION_MAX_SESSIONS", 10000))
+        if kind == "files":
+            backend = FileSessionBackend(
+                os.getenv("SESSION_STORE_PATH", ".sessions"),
+                ttl_seconds=ttl_seconds,
+                max_sessions=max_sessions,
+            )
+        else:
+            backend = SQLiteSessionBackend(
+                os.getenv("SESSION_STORE_PATH", ".sessions.sqlite3"),
+                ttl_seconds=ttl_seconds,
+                max_sessions=max_sessions,
+            )
+        return cls(backend, int(os.getenv("SESSION_MAX_HOT", 64)))
+
+    @staticmethod
+    def valid_id(session_id) -> bool:
+        return bool(session_id) and SESSION_ID_PATTERN.fullmatch(session_id) is not None
+
+    def _remember(
+        self, session_id: str, payload: bytes, digest: str, saved_at: float
+    ):
+        with self._lock:
+            self._hot[session_id] = (payload, digest, saved_at)
+            self._hot.move_to_end(session_id)
+            while len(self._hot) > self.max_hot_sessions:
+                self._hot.popitem(last=False)
+
+    def load(self, session_id: str) -> Optional[dict]:
+        if not self.valid_id(session_id):
+            raise ValueError(f"{session_id!r} is not a valid session id")
+        expired_before = time.time() - self.backend.ttl_seconds
+        with self._lock:
+            hot = self._hot.get(session_id)
+            if hot is not None and hot[2] < expired_before:
+                del self._hot[session_id]
+                hot = None
+            if hot is not None:
+                self._hot.move_to_end(session_id)
+        if hot is not None:
+            return deserialize_session(hot[0])
+
+        stored = self.backend.get(session_id)
+        if stored is None:
+            return None
+        payload, saved_at = stored
+        try:
+            state = deserialize_session(payload)
+        except (ValueError, KeyError, TypeError, zlib.error):
+            # Written by an incompatible version; start the session over
+            self.backend.delete(session_id)
+            return None
+        digest = hashlib.sha256(payload).hexdigest()
+        self._remember(session_id, payload, digest, saved_at)
+        return state
+
+    def save(self, session_id: str, state: dict):
+        if not self.valid_id(session_id):
+            raise ValueError(f"{session_id!r} is not a valid session id")
+        payload = serialize_session(state)
+        digest = hashlib.sha256(payload).hexdigest()
+        with self._lock:
+            hot = self._hot.get(session_id)
+        if hot is None or hot[1] != digest:
+            self.backend.put(session_id, payload)
+            saved_at = time.time()
+        else:
+            saved_at = hot[2]
+        self._remember(session_id, payload, digest, saved_at)
+
+    def discard(self, session_id: str):
+        with self._lock:
+            self._hot.pop(session_id, None)
+        self.backend.delete(session_id)
@@ -0,0 +1,270 @@
+import heapq
+import os
+from datetime import datetime as dt
+from datetime import timedelta
+from typing import TYPE_CHECKING, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+SECONDS_PER_DAY = 86400
+HORIZON_WEEKS = int(os.getenv("SCHEDULE_HORIZON_WEEKS", 52))
+
+
+class ShiftColumns(NamedTuple):
+    # Epoch seconds (UTC) for the start and end of every shift
+    start: np.ndarray
+    end: np.ndarray
+    # Index of each shift's user into user_names
+    user_codes: np.ndarray
+    user_names: List[str]
+    # Index of each shift's layer, when the shifts come from several layers
+    layer: Optional[np.ndarray] = None
+
+
+def empty_columns() -> ShiftColumns:
+    return ShiftColumns(
+        start=np.empty(0, dtype=np.int64),
+        end=np.empty(0, dtype=np.int64),
+        user_codes=np.empty(0, dtype=np.int32),
+        user_names=[],
+        layer=np.empty(0, dtype=np.int32),
+    )
+
+
+def window_days(layer, weeks: int, window: Optional[Tuple[dt, dt]]) -> range:
+    # Days (offsets from layer.start) whose shifts can overlap the window
+    last_day = weeks * 7
+    if window is None:
+        return range(last_day + 1)
+    t0, t1 = window
+    # Days start within a DST change of start + day * 24h, so allow a day's
+    # slack on each side; shifts outside the window are dropped afterwards
+    first = (t0 - layer.start).total_seconds() - layer.weekday_table.longest
+    first = first // SECONDS_PER_DAY - 1
+    last = -((layer.start - t1).total_seconds() // SECONDS_PER_DAY)
+    return range(max(0, int(first)), min(last_day, int(last)) + 1)
+
+
+def expand_layer(
+    layer, weeks: int = HORIZON_WEEKS, window: Optional[Tuple[dt, dt]] = None
+) -> ShiftColumns:
+    user_sequence = [user.user_name for user in layer.users]
+    if not user_sequence or not layer.restrictions:
+        return empty_columns()
+
+    # Every day from start up to and including start + weeks, or only the days
+    # that can reach into the window
+    day_range = window_days(layer, weeks, window)
+    if not day_range:
+        return empty_columns()
+    days = np.arange(day_range.start, day_range.stop, dtype=np.int64)
+    weekdays = (layer.start.isoweekday() - 1 + days) % 7 + 1
+
+    # Flatten the weekday table so slot w covers flat[slot_start[w]:][:counts[w]]
+    table = layer.weekday_table
+    flat = [r for slot in table.slots for r in slot]
+    counts = np.array([len(slot) for slot in table.slots], dtype=np.int64)
+    slot_start = np.cumsum(counts) - counts
+    durations = np.array([r.duration for r in flat], dtype=np.int64)
+    is_daily = np.array([r.daily for r in flat], dtype=np.int64)
+
+    # One entry per shift, in (day, restriction) order like the original loop
+    shifts_per_day = counts[weekdays - 1]
+    day_idx = np.repeat(np.arange(len(days)), shifts_per_day)
+    first_of_day = np.cumsum(shifts_per_day) - shifts_per_day
+    position = np.arange(len(day_idx)) - np.repeat(first_of_day, shifts_per_day)
+    restriction_idx = slot_start[weekdays[day_idx] - 1] + position
+
+    # Daily restrictions advance the rotation after every shift they produce
+    daily = is_daily[restriction_idx]
+    turns = np.cumsum(daily) - daily + layer._turns_before(day_range.start)
+
+    # Weekly restrictions advance the rotation at the end of every Sunday
+    if table.weekly:
+        sundays = (weekdays == 7).astype(np.int64)
+        turns += (np.cumsum(sundays) - sundays)[day_idx]
+
+    # Each user covers num_shifts consecutive shifts
+    user_index = (turns // layer.num_shifts) % len(user_sequence)
+
+    codes_by_name = {name: i for i, name in enumerate(dict.fromkeys(user_sequence))}
+    sequence_codes = np.array(
+        [codes_by_name[name] for name in user_sequence], dtype=np.int32
+    )
+
+    # Localized in one pass per layer, keeping each day's wall-clock time
+    start = layer.day_start_seconds(days)[day_idx]
+    end = start + durations[restriction_idx]
+    user_codes = sequence_codes[user_index]
+    if layer.end is not None:
+        # No shifts start after the layer ends, and the last one is cut short
+        layer_end = int(layer.end.timestamp())
+        before_end = start < layer_end
+        start, user_codes = start[before_end], user_codes[before_end]
+        end = np.minimum(end[before_end], layer_end)
+    if window is not None:
+        # Drop the shifts on the edge days that miss the window
+        t0, t1 = window
+        inside = (end > t0.timestamp()) & (start < t1.timestamp())
+        start, end, user_codes = start[inside], end[inside], user_codes[inside]
+
+    return ShiftColumns(
+        start=start,
+        end=end,
+        user_codes=user_codes,
+        user_names=list(codes_by_name),
+    )
+
+
+def expand_layers(
+    layers, weeks: int = HORIZON_WEEKS, window: Optional[Tuple[dt, dt]] = None
+) -> ShiftColumns:
+    names: List[str] = []
+    codes_by_name = {}
+    starts, ends, user_codes, layer_ids = [], [], [], []
+
+    for layer_id, layer in enumerate(layers):
+        columns = expand_layer(layer, weeks, window)
+        # Remap each layer's user codes onto the shared list of names
+        remap = np.empty(len(columns.user_names), dtype=np.int32)
+        for i, name in enumerate(columns.user_names):
+            if name not in codes_by_name:
+                codes_by_name[name] = len(names)
+                names.append(name)
+            remap[i] = codes_by_name[name]
+        starts.append(columns.start)
+        ends.append(columns.end)
+        user_codes.append(remap[columns.user_codes])
+        layer_ids.append(np.full(len(columns.start), layer_id, dtype=np.int32))
+
+    if not starts:
+        return empty_columns()
+
+    return ShiftColumns(
+        start=np.concatenate(starts),
+        end=np.concatenate(ends),
+        user_codes=np.concatenate(user_codes),
+        user_names=names,
+        layer=np.concatenate(layer_ids),
+    )
+
+
+def flatten_columns(columns: ShiftColumns) -> ShiftColumns:
+    # The final on-call timeline: at any moment the shift from the latest
+    # layer wins, as in PagerDuty, and within a layer the latest-starting
+    # shift. One sweep over the sorted shift boundaries with a heap of the
+    # shifts in progress, O(n log n). Adjacent pieces with the same user and
+    # layer are merged.
+    if not len(columns.start):
+        return columns
+
+    starts = columns.start.tolist()
+    ends = columns.end.tolist()
+    codes = columns.user_codes.tolist()
+    layers = (
+        columns.layer.tolist() if columns.layer is not None else [0] * len(starts)
+    )
+    order = np.argsort(columns.start, kind="stable").tolist()
+    boundaries = np.unique(np.concatenate([columns.start, columns.end])).tolist()
+
+    in_progress: list = []
+    next_shift = 0
+    out_start: List[int] = []
+    out_end: List[int] = []
+    out_codes: List[int] = []
+    out_layers: List[int] = []
+    for t, t_next in zip(boundaries, boundaries[1:]):
+        while next_shift < len(order) and starts[order[next_shift]] <= t:
+            i = order[next_shift]
+            heapq.heappush(in_progress, (-layers[i], -starts[i], ends[i], i))
+            next_shift += 1
+        # Shifts that ended are only removed once they reach the top
+        while in_progress and in_progress[0][2] <= t:
+            heapq.heappop(in_progress)
+        if not in_progress:
+            continue
+
+        i = in_progress[0][3]
+        if (
+            out_end
+            and out_end[-1] == t
+            and out_codes[-1] == codes[i]
+            and out_layers[-1] == layers[i]
+        ):
+            out_end[-1] = t_next
+        else:
+            out_start.append(t)
+            out_end.append(t_next)
+            out_codes.append(codes[i])
+            out_layers.append(layers[i])
+
+    return ShiftColumns(
+        start=np.array(out_start, dtype=np.int64),
+        end=np.array(out_end, dtype=np.int64),
+        user_codes=np.array(out_codes, dtype=np.int32),
+        user_names=columns.user_names,
+        layer=np.array(out_layers, dtype=np.int32),
+    )
+
+
+def on_call_index(timeline: ShiftColumns, when: dt) -> Optional[int]:
+    # Row of a flattened timeline covering `when`, found by binary search
+    t = when.timestamp()
+    i = int(np.searchsorted(timeline.start, t, side="right")) - 1
+    if i >= 0 and timeline.end[i] > t:
+        return i
+    return None
+
+
+def final_on_call(layers, when: dt, weeks: int = HORIZON_WEEKS) -> Optional[str]:
+    # Who is actually paged at `when` once layer precedence is applied
+    window = (when, when + timedelta(seconds=1))
+    timeline = flatten_columns(expand_layers(layers, weeks, window))
+    i = on_call_index(timeline, when)
+    return None if i is None else timeline.user_names[timeline.user_codes[i]]
+
+
+def horizon_bounds(layers, weeks: int = HORIZON_WEEKS) -> Optional[Tuple[dt, dt]]:
+    # From the first shift to the end of the last shift any layer can produce
+    layers = [layer for layer in layers if layer.users and layer.restrictions]
+    if not layers:
+        return None
+    first = min(layer.start for layer in layers)
+    # Wall-clock days can run up to a DST change past start + weeks
+    last = max(
+        layer.start
+        + timedelta(days=weeks * 7, seconds=layer.weekday_table.longest, hours=2)
+        for layer in layers
+    )
+    return first, last
+
+
+def columns_to_df(columns: ShiftColumns, timezone: str) -> "pd.DataFrame":
+    # pandas is only needed here, so importing this module stays cheap
+    import pandas as pd
+
+    if not len(columns.start):
+        return pd.DataFrame()
+
+    shift_start = pd.to_datetime(columns.start, unit="s", utc=True)
+    shift_end = pd.to_datetime(columns.end, unit="s", utc=True)
+    df = pd.DataFrame(
+        {
+            "user": pd.Categorical.from_codes(
+                columns.user_codes, categories=columns.user_names
+            ),
+            "shift_start_datetime": shift_start.tz_convert(timezone),
+            "shift_end_datetime": shift_end.tz_convert(timezone),
+            "shift_duration": pd.to_timedelta(
+                columns.end - columns.start, unit="s"
+            ),
+        }
+    )
+    if columns.layer is not None:
+        df["layer"] = columns.layer
+    # Stable, so simultaneous shifts keep layer order and a month renders the
+    # same whichever window it was expanded in
+    return df.sort_values(by=["shift_start_datetime"], kind="stable")
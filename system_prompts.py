@@ -8,6 +8,21 @@ timezone. Users will rotate each day in the following order: Ron Swanson, Leslie
 Knope, Ron Swanson, Ann Perkins.
 """
 
+INITIAL_GREETING = (
+    "Hello 👋, I am the PagerDuty schedule bot! "
+    "Please tell me about the first group, "
+    "and the shifts they work."
+)
+
+CONFIRMATION_MESSAGE = "One moment while I attempt to create the schedule layers please"
+
+VALIDATED_MESSAGE_PREFIX = "Here is the list of validated schedule layer objects: "
+
+ADD_ANOTHER_MESSAGE = (
+    "⏰ To add another group to the schedule, please tell me about "
+    "the group and describe their shifts below."
+)
+
 EXAMPLE_MISSING_INPUT = "The DevOps team is on call Monday, Tuesday, and Wednesday."
 
 EXAMPLE_SCHEDULE_LAYER = {
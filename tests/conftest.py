@@ -0,0 +1,46 @@
+import os
+import sys
+from datetime import datetime as dt
+
+import pytest
+
+# The modules live at the repository root rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pd_timezones  # noqa: E402
+import schedules_ai as sai  # noqa: E402
+
+
+def build_layer(
+    timezone: str,
+    first_day: dt,
+    time_of_day: str,
+    duration_seconds: int = 8 * 3600,
+    users=("Ann", "Bob"),
+) -> sai.ScheduleLayers:
+    # An everyday daily rotation starting at time_of_day on first_day
+    tz = pd_timezones.get_tz(timezone)
+    hour, minute, second = (int(p) for p in time_of_day.split(":"))
+    start = tz.localize(first_day.replace(hour=hour, minute=minute, second=second))
+    return sai.ScheduleLayers(
+        timezone=timezone,
+        num_shifts=1,
+        start=start.isoformat(),
+        rotation_virtual_start=start.isoformat(),
+        rotation_turn_length_seconds=86400,
+        users=[{"user_name": name, "type": "user_reference"} for name in users],
+        restrictions=[
+            {
+                "type": "daily_restriction",
+                "start_time_of_day": time_of_day,
+                "duration_seconds": duration_seconds,
+                "start_day_of_week": 1,
+            }
+        ],
+        everyday=True,
+    )
+
+
+@pytest.fixture
+def make_layer():
+    return build_layer
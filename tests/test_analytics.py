@@ -0,0 +1,79 @@
+import pandas as pd
+
+import analytics
+
+TZ = "America/New_York"
+
+
+def frame(*shifts) -> pd.DataFrame:
+    # (user, local start, local end) triples
+    users, starts, ends = zip(*shifts)
+    return pd.DataFrame(
+        {
+            "user": list(users),
+            "shift_start_datetime": pd.DatetimeIndex(starts).tz_localize(TZ),
+            "shift_end_datetime": pd.DatetimeIndex(ends).tz_localize(TZ),
+        }
+    )
+
+
+def rows(load: pd.DataFrame) -> list:
+    return [
+        (str(week), user, round(hours, 6), shifts)
+        for week, user, hours, shifts in load.itertuples(index=False)
+    ]
+
+
+def test_hours_are_split_at_local_monday_midnight():
+    # Sunday 18:00 to Monday 06:00, the week the clocks go forward
+    shifts = frame(("Ann", "2027-03-07 18:00", "2027-03-08 06:00"))
+    load = analytics.weekly_load(shifts, shifts)
+
+    assert rows(load) == [("2027-03-01", "Ann", 6.0, 1), ("2027-03-08", "Ann", 6.0, 0)]
+
+
+def test_merged_timeline_pieces_count_as_one_shift():
+    shifts = frame(("Ann", "2027-03-09 09:00", "2027-03-09 17:00"))
+    # A later layer overrides the middle of the shift
+    final = frame(
+        ("Ann", "2027-03-09 09:00", "2027-03-09 12:00"),
+        ("Bob", "2027-03-09 12:00", "2027-03-09 13:00"),
+        ("Ann", "2027-03-09 13:00", "2027-03-09 17:00"),
+    )
+    load = analytics.weekly_load(final, shifts)
+
+    assert rows(load) == [("2027-03-08", "Ann", 7.0, 1), ("2027-03-08", "Bob", 1.0, 0)]
+
+
+def test_multi_week_interval_across_dst():
+    # Two full weeks on call; the first week is an hour short
+    shifts = frame(("Ann", "2027-03-08 00:00", "2027-03-22 00:00"))
+    load = analytics.weekly_load(shifts, shifts)
+
+    assert rows(load) == [
+        ("2027-03-08", "Ann", 167.0, 1),
+        ("2027-03-15", "Ann", 168.0, 0),
+    ]
+
+
+def test_window_clips_hours_and_shifts():
+    shifts = frame(
+        ("Ann", "2027-03-08 00:00", "2027-03-10 00:00"),
+        ("Bob", "2027-03-10 00:00", "2027-03-12 00:00"),
+    )
+    start = pd.Timestamp("2027-03-09 12:00", tz=TZ)
+    end = pd.Timestamp("2027-03-11 00:00", tz=TZ)
+    load = analytics.weekly_load(shifts, shifts, start, end)
+
+    assert rows(load) == [
+        ("2027-03-08", "Ann", 12.0, 0),
+        ("2027-03-08", "Bob", 24.0, 1),
+    ]
+
+
+def test_empty():
+    empty = frame(("Ann", "2027-03-08", "2027-03-09")).iloc[:0]
+    load = analytics.weekly_load(empty, empty)
+
+    assert load.empty
+    assert list(load.columns) == ["week", "user", "hours", "shifts"]
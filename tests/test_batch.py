@@ -0,0 +1,75 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import batch
+
+
+def test_output_and_failures_must_differ(tmp_path, capsys):
+    path = tmp_path / "results.jsonl"
+    same = os.path.join(str(tmp_path), ".", "results.jsonl")
+    with pytest.raises(SystemExit):
+        batch.main(["--examples", "--output", str(path), "--failures", same])
+
+    assert "must be different files" in capsys.readouterr().err
+    assert not path.exists()
+
+
+def test_batch_does_not_import_streamlit():
+    code = "import sys, batch; sys.exit('streamlit' in sys.modules)"
+    repo = os.path.dirname(os.path.abspath(batch.__file__))
+    assert subprocess.run([sys.executable, "-c", code], cwd=repo).returncode == 0
+
+
+class FakeResponse:
+    def __init__(self, description):
+        self.message = "Success"
+        self.schedule_layers = [FakeLayer(description)]
+
+
+class FakeLayer:
+    def __init__(self, description):
+        self.description = description
+
+    def json(self):
+        return json.dumps({"description": self.description})
+
+
+def read_jsonl(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_malformed_lines_become_failures(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, "invoke_llm", lambda text, history: FakeResponse(text))
+    source = tmp_path / "in.jsonl"
+    source.write_text('"a"\n{bad\n{"id": "x", "other": 1}\n[1]\n"c"\n')
+    output, failures = tmp_path / "ok.jsonl", tmp_path / "fail.jsonl"
+
+    batch.main(
+        [str(source), "--output", str(output)]
+        + ["--failures", str(failures), "--rate", "0"]
+    )
+
+    assert sorted(r["id"] for r in read_jsonl(output)) == ["1", "5"]
+    failed = read_jsonl(failures)
+    assert [r["id"] for r in failed] == ["2", "x", "4"]
+    assert not any(r["ok"] for r in failed)
+    assert failed[0]["error"].startswith("invalid JSON")
+
+
+def test_results_are_written_when_reading_fails(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, "invoke_llm", lambda text, history: FakeResponse(text))
+
+    def descriptions():
+        yield batch.Description("a", "first")
+        raise OSError("disk gone")
+
+    output, failures = tmp_path / "ok.jsonl", tmp_path / "fail.jsonl"
+    with open(output, "w") as out, open(failures, "w") as fail:
+        with pytest.raises(OSError):
+            batch.run_batch(descriptions(), out, fail, rate=0)
+
+    assert [r["id"] for r in read_jsonl(output)] == ["a"]
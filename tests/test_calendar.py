@@ -0,0 +1,56 @@
+import threading
+
+import pandas as pd
+
+import calendar_1
+
+TZ = "America/New_York"
+
+
+def shifts_frame() -> pd.DataFrame:
+    starts = pd.date_range("2027-01-25 09:00", periods=14, freq="D", tz=TZ)
+    return pd.DataFrame(
+        {
+            "user": ["Ann", "Bob"] * 7,
+            "shift_start_datetime": starts,
+            "shift_end_datetime": starts + pd.Timedelta(hours=8),
+        }
+    )
+
+
+def test_month_evicted_while_rendering(monkeypatch):
+    monkeypatch.setattr(calendar_1, "_month_cache", calendar_1.OrderedDict())
+    expected = calendar_1.dataframe_to_html_calendar(shifts_frame(), TZ)
+
+    # Another session empties the cache after January was served from it
+    months = calendar_1.iter_calendar_html(shifts_frame(), TZ)
+    parts = [next(months) for _ in range(5)]
+    calendar_1._month_cache.clear()
+    parts.extend(months)
+
+    assert "".join(parts) == expected
+
+
+def test_concurrent_renders(monkeypatch):
+    monkeypatch.setattr(calendar_1, "_month_cache", calendar_1.OrderedDict())
+    monkeypatch.setattr(calendar_1, "MONTH_CACHE_SIZE", 1)
+    expected = calendar_1.dataframe_to_html_calendar(shifts_frame(), TZ)
+    results, errors = [], []
+
+    def render():
+        try:
+            for _ in range(20):
+                results.append(
+                    calendar_1.dataframe_to_html_calendar(shifts_frame(), TZ)
+                )
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=render) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert set(results) == {expected}
@@ -0,0 +1,99 @@
+from datetime import datetime as dt
+from datetime import timedelta
+
+import pytest
+
+import pd_timezones
+import schedules_ai as sai
+from shifts import expand_layer
+
+# 2027 transitions: clocks go forward at 02:00 on March 14 and back at 02:00
+# on November 7 in the US zones. Brazil dropped DST in 2019, so Sao Paulo
+# only has to keep its wall-clock times.
+SPRING_FORWARD = dt(2027, 3, 14)
+FALL_BACK = dt(2027, 11, 7)
+DST_ZONES = [
+    "America/Los_Angeles",
+    "America/New_York",
+    "America/Denver",
+    "America/Sao_Paulo",
+]
+US_ZONES = DST_ZONES[:3]
+# Zones from example_inputs.py without DST
+FIXED_ZONES = ["Africa/Nairobi", "Asia/Kolkata", "Asia/Tokyo"]
+
+DURATION = 8 * 3600
+
+
+def local_starts(layer: sai.ScheduleLayers, weeks: int = 2) -> list:
+    tz = pd_timezones.get_tz(layer.timezone)
+    columns = expand_layer(layer, weeks)
+    assert (columns.end - columns.start == DURATION).all()
+    return [dt.fromtimestamp(int(start), tz) for start in columns.start]
+
+
+def iter_starts(layer: sai.ScheduleLayers, weeks: int = 2) -> list:
+    end = layer.start + timedelta(weeks=weeks, days=1)
+    return [shift.start for shift in layer.iter_shifts(layer.start, end)]
+
+
+@pytest.mark.parametrize("timezone", DST_ZONES)
+@pytest.mark.parametrize("transition", [SPRING_FORWARD, FALL_BACK])
+def test_wall_clock_time_kept_across_transition(timezone, transition, make_layer):
+    layer = make_layer(timezone, transition - timedelta(days=7), "09:00:00")
+    starts = local_starts(layer)
+
+    assert len(starts) == 15
+    assert {(s.hour, s.minute, s.second) for s in starts} == {(9, 0, 0)}
+    dates = [s.date() for s in starts]
+    assert dates == [dates[0] + timedelta(days=i) for i in range(len(dates))]
+    assert [int(s.timestamp()) for s in iter_starts(layer)][: len(starts)] == [
+        int(s.timestamp()) for s in starts
+    ]
+
+
+@pytest.mark.parametrize("timezone", US_ZONES)
+def test_skipped_start_moves_to_end_of_gap(timezone, make_layer):
+    layer = make_layer(timezone, SPRING_FORWARD - timedelta(days=3), "02:30:00")
+    by_date = {s.date(): s for s in local_starts(layer, weeks=1)}
+
+    skipped = by_date[SPRING_FORWARD.date()]
+    assert (skipped.hour, skipped.minute) == (3, 0)
+    for date, start in by_date.items():
+        if date != SPRING_FORWARD.date():
+            assert (start.hour, start.minute) == (2, 30)
+
+    iterated = {s.date(): s for s in iter_starts(layer, weeks=1)}
+    assert iterated[SPRING_FORWARD.date()].timestamp() == skipped.timestamp()
+
+
+@pytest.mark.parametrize("timezone", US_ZONES)
+def test_repeated_start_uses_first_occurrence(timezone, make_layer):
+    layer = make_layer(timezone, FALL_BACK - timedelta(days=3), "01:30:00")
+    by_date = {s.date(): s for s in local_starts(layer, weeks=1)}
+
+    repeated = by_date[FALL_BACK.date()]
+    assert (repeated.hour, repeated.minute) == (1, 30)
+    # Still on summer time, i.e. before the clocks went back
+    assert repeated.dst() != timedelta(0)
+
+
+@pytest.mark.parametrize("timezone", FIXED_ZONES)
+@pytest.mark.parametrize("transition", [SPRING_FORWARD, FALL_BACK])
+def test_zones_without_dst_are_24_hours_apart(timezone, transition, make_layer):
+    layer = make_layer(timezone, transition - timedelta(days=7), "09:00:00")
+    starts = [int(s.timestamp()) for s in local_starts(layer)]
+
+    assert len(starts) == 15
+    assert {b - a for a, b in zip(starts, starts[1:])} == {86400}
+
+
+def test_start_has_whole_seconds(make_layer):
+    tz = pd_timezones.get_tz("America/New_York")
+    start = tz.localize(dt(2027, 3, 10, 9, 0, 0, 123456))
+    layer = make_layer("America/New_York", dt(2027, 3, 10), "09:00:00")
+    values = {**layer.dict(), "rotation_virtual_start": start, "start": start}
+
+    layer = sai.ScheduleLayers(**values)
+    assert layer.start.microsecond == 0
+    assert int(layer.start.timestamp()) == local_starts(layer)[0].timestamp()
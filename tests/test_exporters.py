@@ -0,0 +1,175 @@
+from collections import Counter
+from datetime import datetime as dt
+
+import numpy as np
+import pytest
+
+import exporters
+from exporters import ics_escape, ics_fold, iter_ics, iter_shift_chunks
+from shifts import expand_layers
+
+WEEKS = 6
+
+
+@pytest.fixture
+def layers(make_layer):
+    return [
+        make_layer("America/New_York", dt(2030, 3, 1), "09:00:00"),
+        # Longer than a day, so shifts straddle chunk boundaries
+        make_layer(
+            "America/New_York",
+            dt(2030, 3, 4),
+            "21:30:00",
+            duration_seconds=30 * 3600,
+            users=("Cid", "Ann, Jr.", "Dee; on call"),
+        ),
+        make_layer("Asia/Kolkata", dt(2030, 3, 2), "00:00:00", users=("Émile",)),
+    ]
+
+
+def unfold(text: str) -> list:
+    return text.replace("\r\n ", "").split("\r\n")[:-1]
+
+
+def expected_rows(layers) -> Counter:
+    columns = expand_layers(layers, WEEKS)
+    return Counter(
+        zip(
+            columns.layer.tolist(),
+            [columns.user_names[c] for c in columns.user_codes],
+            columns.start.tolist(),
+            columns.end.tolist(),
+        )
+    )
+
+
+def test_ics_escape():
+    assert ics_escape("a\\b;c,d\ne") == "a\\\\b\\;c\\,d\\ne"
+
+
+def test_ics_fold_short_line():
+    assert ics_fold("SUMMARY:On call: Ann") == "SUMMARY:On call: Ann\r\n"
+
+
+@pytest.mark.parametrize("text", ["x" * 200, "é" * 100, "a" + "€" * 60 + "b" * 30])
+def test_ics_fold_long_line(text):
+    folded = ics_fold(f"SUMMARY:{text}")
+    lines = folded.split("\r\n")
+
+    assert folded.endswith("\r\n") and lines[-1] == ""
+    assert all(len(line.encode()) <= 75 for line in lines)
+    assert all(line.startswith(" ") for line in lines[1:-1])
+    # Every piece is valid UTF-8 and unfolding gives the line back
+    assert unfold(folded) == [f"SUMMARY:{text}"]
+
+
+def test_ics_document(layers):
+    text = "".join(iter_ics(layers, weeks=WEEKS, calendar_name="Ops, nights"))
+    physical = text.split("\r\n")
+
+    assert text.startswith("BEGIN:VCALENDAR\r\n")
+    assert text.endswith("END:VCALENDAR\r\n")
+    assert "\n" not in text.replace("\r\n", "")
+    assert all(len(line.encode()) <= 75 for line in physical)
+
+    lines = unfold(text)
+    assert "X-WR-CALNAME:Ops\\, nights" in lines
+    assert lines.count("BEGIN:VEVENT") == sum(expected_rows(layers).values())
+    summaries = {line for line in lines if line.startswith("SUMMARY:")}
+    assert summaries == {
+        "SUMMARY:On call: Ann",
+        "SUMMARY:On call: Bob",
+        "SUMMARY:On call: Cid",
+        "SUMMARY:On call: Ann\\, Jr.",
+        "SUMMARY:On call: Dee\\; on call",
+        "SUMMARY:On call: Émile",
+    }
+
+
+def event_uids(text: str) -> list:
+    return [line for line in unfold(text) if line.startswith("UID:")]
+
+
+def test_ics_uids_are_unique_and_stable(layers):
+    first = event_uids("".join(iter_ics(layers, weeks=WEEKS)))
+    again = event_uids("".join(iter_ics(layers, weeks=WEEKS, chunk_days=5)))
+
+    assert len(set(first)) == len(first)
+    # Same events, whatever the chunking, so clients update them in place
+    assert sorted(first) == sorted(again)
+    assert all(uid.endswith("@schedules-ai") for uid in first)
+
+
+@pytest.mark.parametrize("chunk_days", [1, 2, 5, 7, 28, 400])
+def test_chunks_emit_each_shift_once(layers, chunk_days):
+    names = exporters.export_user_names(layers)
+    rows = Counter()
+    previous_start = None
+    for chunk in iter_shift_chunks(layers, WEEKS, chunk_days):
+        assert len(chunk.start)
+        assert (np.diff(chunk.start) >= 0).all()
+        # Chunks follow each other in time
+        assert previous_start is None or chunk.start[0] >= previous_start
+        previous_start = chunk.start[-1]
+        rows.update(
+            zip(
+                chunk.layer.tolist(),
+                [names[c] for c in chunk.user_codes],
+                chunk.start.tolist(),
+                chunk.end.tolist(),
+            )
+        )
+
+    assert rows == expected_rows(layers)
+    assert max(rows.values()) == 1
+
+
+def test_no_chunks_without_restrictions(make_layer):
+    layer = make_layer("UTC", dt(2030, 3, 1), "09:00:00")
+    layer = layer.copy(update={"restrictions": []})
+
+    assert list(iter_shift_chunks([layer], WEEKS)) == []
+
+
+def assert_table_rows(pa, table, rows: int, layers):
+    assert table.num_rows == rows == sum(expected_rows(layers).values())
+    columns = table.to_pydict()
+    starts = table.column("shift_start").cast(pa.timestamp("s", tz="UTC"))
+    ends = table.column("shift_end").cast(pa.timestamp("s", tz="UTC"))
+    assert Counter(
+        zip(
+            columns["layer"],
+            columns["user"],
+            starts.cast(pa.int64()).to_pylist(),
+            ends.cast(pa.int64()).to_pylist(),
+        )
+    ) == expected_rows(layers)
+
+
+def test_arrow_schema(layers, tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    path = str(tmp_path / "shifts.arrow")
+    rows = exporters.write_arrow(path, layers, weeks=WEEKS, chunk_days=7)
+    with pa.memory_map(path) as source:
+        table = pa.ipc.open_file(source).read_all()
+
+    assert table.schema == exporters.arrow_schema(pa)
+    assert_table_rows(pa, table, rows, layers)
+
+
+def test_parquet_schema(layers, tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = str(tmp_path / "shifts.parquet")
+    rows = exporters.write_parquet(path, layers, weeks=WEEKS, chunk_days=7)
+    table = pq.read_table(path)
+
+    # Parquet has no second resolution, so the timestamps come back in ms
+    expected = exporters.arrow_schema(pa)
+    for name in ("shift_start", "shift_end"):
+        i = expected.get_field_index(name)
+        expected = expected.set(i, pa.field(name, pa.timestamp("ms", tz="UTC")))
+    assert table.schema == expected
+    assert_table_rows(pa, table, rows, layers)
+    metadata = pq.ParquetFile(path).metadata
+    assert metadata.num_rows == rows
@@ -0,0 +1,108 @@
+import pytest
+
+import example_inputs
+import fast_parser
+
+DAILY, WEEKLY = "daily_restriction", "weekly_restriction"
+EVERY_DAY = list(range(1, 8))
+
+# Name -> (timezone, num_shifts, type, weekdays, start time, hours, everyday)
+EXPECTED = {
+    "example_1": ("Africa/Nairobi", 1, DAILY, [4, 5], "09:00:00", 3, False),
+    "example_2": ("Africa/Nairobi", 1, DAILY, [1, 2, 3], "12:00:00", 5, False),
+    "example_3": ("Asia/Kolkata", 1, WEEKLY, [4, 5], "09:00:00", 3, False),
+    "example_4": ("Asia/Kolkata", 1, WEEKLY, [1, 2, 3], "12:00:00", 5, False),
+    "example_5": ("Asia/Tokyo", 1, WEEKLY, [4, 5], "09:00:00", 3, False),
+    "example_6": ("Asia/Tokyo", 1, WEEKLY, [4, 5], "12:00:00", 5, False),
+    "example_7": ("America/Los_Angeles", 1, DAILY, [1, 6, 7], "12:00:00", 5, False),
+    "example_8": ("America/Los_Angeles", 1, DAILY, [5, 6, 7], "09:00:00", 8, False),
+    "example_9": ("America/New_York", 3, DAILY, [2, 3, 4], "09:00:00", 8, False),
+    "example_10": ("America/New_York", 4, DAILY, [5, 6, 7], "09:00:00", 8, False),
+    "example_11": ("America/Denver", 2, WEEKLY, [6, 7, 1], "09:00:00", 8, False),
+    "example_12": ("America/Denver", 3, WEEKLY, [2, 3, 4], "09:00:00", 8, False),
+    "example_13": ("America/Sao_Paulo", 1, DAILY, EVERY_DAY, "09:00:00", 3, True),
+    "example_14": ("America/Sao_Paulo", 1, DAILY, EVERY_DAY, "12:00:00", 5, True),
+}
+USERS = {
+    "example_1": ["Pam Beesly", "Dwight Shrute", "Dwight Shrute", "Pam Beesly"]
+    + ["Creed Braton", "Creed Braton"],
+    "example_2": ["Saul Goodman", "Jesse Pinkman", "Kim Wexler"],
+    "example_3": ["Kelly Kapoor", "Bob Vance", "Bob Vance", "Kelly Kapoor"]
+    + ["Toby Flenderson", "Toby Flenderson"],
+    "example_4": ["Wendy Byrde", "Darlene Snell", "Ruth Langmore"],
+    "example_5": ["Gus Fring", "Tuco Salamanca"],
+    "example_6": ["Anakin", "Grogu", "Chewbacca"],
+    "example_7": ["Saul Goodman", "Jesse Pinkman", "Kim Wexler"],
+    "example_8": ["Green Lantern", "The Flash"],
+    "example_9": ["Gandalf", "Frodo", "Bilbo", "Gimli"],
+    "example_10": ["Nemo", "Dori"],
+    "example_11": ["Sailor Mercury", "Sailor Mars", "Sailor Jupiter"],
+    "example_12": ["Sailor Moon", "Sailor Venus"],
+    "example_13": ["Buzz Lightyear"],
+    "example_14": ["Mulan"],
+}
+
+
+def future(text: str) -> str:
+    # The templates start in 2025, and layers must start in the future
+    return text.replace("2025", "2030")
+
+
+def test_every_template_is_covered():
+    names = {name for name in vars(example_inputs) if name.startswith("example_")}
+    assert names == set(EXPECTED)
+
+
+@pytest.mark.parametrize("name", sorted(EXPECTED))
+def test_templates(name):
+    timezone, num_shifts, kind, weekdays, start_time, hours, everyday = EXPECTED[name]
+    [layer] = fast_parser.try_parse(future(getattr(example_inputs, name)))
+
+    assert layer.timezone == timezone
+    assert layer.num_shifts == num_shifts
+    assert layer.everyday is everyday
+    assert [u.user_name for u in layer.users] == USERS[name]
+    assert [r.start_day_of_week for r in layer.restrictions] == weekdays
+    assert {r.type for r in layer.restrictions} == {kind}
+    assert {r.start_time_of_day for r in layer.restrictions} == {start_time}
+    assert {r.duration_seconds for r in layer.restrictions} == {hours * 3600}
+    assert layer.start.isoweekday() in weekdays
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        # An end date would be dropped
+        "The ops team will start their on call rotation on Mar 2, 2030 and end"
+        " on Jun 1, 2030. This group is on call Mon 9am-5pm, New York timezone."
+        " Users will rotate each week in the following order: Ann, Bob.",
+        "The ops team will start their on call rotation on Mar 2, 2030. This"
+        " group is on call Mon 9am-5pm until Jun 1, 2030, New York timezone."
+        " Users will rotate each week in the following order: Ann, Bob.",
+        # An exception would be dropped
+        "Mulan starts their on call rotation on Jan 2, 2030. They are on call"
+        " 9am-5pm every day, Los Angeles timezone, except Sundays.",
+        "Mulan starts their on call rotation on Jan 2, 2030. They are on call"
+        " 9am-5pm every day, Los Angeles timezone, but not on Sundays.",
+        # A second time range or a weekday qualifies "every day"
+        "Mulan starts their on call rotation on Jan 2, 2030. They are on call"
+        " 9am-5pm every day and 8pm-10pm on Sat, Los Angeles timezone.",
+        # No time for Wednesday
+        "The ops team will start their on call rotation on Mar 4, 2030. This"
+        " group is on call Mon 9am-5pm and Wed, New York timezone. Users will"
+        " rotate each day in the following order: Ann, Bob.",
+    ],
+)
+def test_unsupported_text_falls_back_to_the_llm(text):
+    assert fast_parser.parse_layer(text) is None
+    assert fast_parser.try_parse(text) is None
+
+
+def test_stats_count_hits_and_misses(monkeypatch):
+    monkeypatch.setattr(fast_parser, "stats", fast_parser.FastPathStats())
+    fast_parser.try_parse(future(example_inputs.example_13))
+    fast_parser.try_parse("Make me a schedule")
+
+    assert fast_parser.stats.hits == 1
+    assert fast_parser.stats.misses == 1
+    assert fast_parser.stats.hit_rate == 0.5
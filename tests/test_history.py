@@ -0,0 +1,46 @@
+from datetime import datetime as dt
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+import history
+
+SYSTEM = SystemMessage(content="You build schedule layers.")
+
+
+def conversation(turns: int) -> list:
+    messages = [SYSTEM]
+    for i in range(turns):
+        messages.append(HumanMessage(content=f"request {i} " + "word " * 20))
+        messages.append(AIMessage(content=f"answer {i} " + "word " * 20))
+    return messages
+
+
+def test_summary_comes_before_the_retained_messages(make_layer):
+    layer = make_layer("America/New_York", dt(2030, 3, 14), "09:00:00")
+    compacted = history.compact_history(conversation(3), [layer])
+
+    assert compacted[0] is SYSTEM
+    assert compacted[1].content.startswith("Validated schedule layers so far:")
+    assert [m.content.split()[:2] for m in compacted[2:]] == [
+        [kind, str(i)] for i in range(3) for kind in ("request", "answer")
+    ]
+
+
+def test_oldest_messages_dropped_first():
+    messages = conversation(10)
+    budget = sum(history.message_tokens(m) for m in [SYSTEM] + messages[-4:])
+    compacted = history.compact_history(messages, [], budget=budget)
+
+    assert compacted == [SYSTEM] + messages[-4:]
+
+
+def test_pending_input_is_not_repeated():
+    messages = conversation(2) + [HumanMessage(content="new request")]
+    compacted = history.compact_history(messages, [], pending_input="new request")
+
+    assert compacted == messages[:-1]
+
+
+def test_token_estimate_without_tiktoken(monkeypatch):
+    monkeypatch.setattr(history, "get_encoding", lambda: None)
+    assert history.count_tokens("x" * 40) == 11
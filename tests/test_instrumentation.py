@@ -0,0 +1,49 @@
+import json
+import threading
+
+from instrumentation import SpanRecorder
+
+
+def test_spans_are_scoped_to_their_session():
+    recorder = SpanRecorder()
+
+    def run(session_id):
+        with recorder.session(session_id):
+            with recorder.span("render"):
+                pass
+
+    threads = [threading.Thread(target=run, args=(s,)) for s in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with recorder.span("import"):
+        pass
+
+    assert [s.name for s in recorder.session_spans("a")] == ["render"]
+    assert recorder.totals("b")["render"]["count"] == 1
+    assert "import" not in recorder.totals("a")
+    assert json.loads(recorder.to_jsonl("a"))["session_id"] == "a"
+
+    recorder.clear("a")
+    assert recorder.session_spans("a") == []
+    assert len(recorder.session_spans("b")) == 1
+
+
+def test_log_file_is_opened_once(tmp_path, monkeypatch):
+    log_path = tmp_path / "spans.jsonl"
+    recorder = SpanRecorder(log_path=str(log_path))
+    opened = []
+    real_open = open
+    monkeypatch.setattr(
+        "builtins.open", lambda *args: opened.append(args) or real_open(*args)
+    )
+    with recorder.session("a"):
+        for _ in range(3):
+            with recorder.span("render"):
+                pass
+    recorder.close()
+
+    assert len(opened) == 1
+    lines = log_path.read_text().splitlines()
+    assert [json.loads(line)["session_id"] for line in lines] == ["a"] * 3
@@ -0,0 +1,158 @@
+import asyncio
+import json
+
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import HumanMessage, SystemMessage
+
+import llm_cache
+import llm_chain
+from llm_cache import CacheMissError, ResponseCache
+
+SYSTEM = SystemMessage(content="You build schedule layers.")
+USER_INPUT = "Ann and Bob rotate every three days, 9am-5pm Tokyo time"
+
+
+def model_output(start: str = "2030-01-07T09:00:00+09:00") -> str:
+    return json.dumps(
+        {
+            "message": "Success! Here are the layers.",
+            "schedule_layers": [
+                {
+                    "timezone": "Asia/Tokyo",
+                    "num_shifts": 3,
+                    "start": start,
+                    "rotation_virtual_start": start,
+                    "rotation_turn_length_seconds": 86400,
+                    "users": [
+                        {"user_name": "Ann", "type": "user_reference"},
+                        {"user_name": "Bob", "type": "user_reference"},
+                    ],
+                    "restrictions": [
+                        {
+                            "type": "daily_restriction",
+                            "start_time_of_day": "09:00:00",
+                            "duration_seconds": 28800,
+                            "start_day_of_week": 1,
+                        }
+                    ],
+                    "everyday": True,
+                }
+            ],
+        }
+    )
+
+
+@pytest.fixture
+def install_llm(monkeypatch, tmp_path):
+    def install(output: str, mode: str = "on") -> ResponseCache:
+        model = FakeListChatModel(responses=[output])
+        monkeypatch.setattr(llm_chain, "get_llm", lambda: model)
+        cache = ResponseCache(str(tmp_path / "cache.sqlite3"), mode=mode)
+        monkeypatch.setattr(llm_chain, "response_cache", cache)
+        llm_chain.get_chain.cache_clear()
+        return cache
+
+    yield install
+    llm_chain.get_chain.cache_clear()
+
+
+def cache_key() -> str:
+    return llm_chain.response_cache.key(
+        llm_chain.LLM_MODEL, [SYSTEM, HumanMessage(content=USER_INPUT)]
+    )
+
+
+def test_cache_hit_matches_the_live_response(install_llm):
+    install_llm(model_output())
+
+    live = llm_chain.invoke_llm(USER_INPUT, [SYSTEM])
+    # The raw model output is stored, not the validated response
+    assert llm_chain.response_cache.get(cache_key()) == model_output()
+    cached = llm_chain.cached_response(cache_key())
+
+    assert cached is not None
+    assert [u.user_name for u in cached.schedule_layers[0].users] == ["Ann", "Bob"]
+    assert cached.json() == live.json()
+
+
+def test_streamed_output_is_cached_raw(install_llm):
+    install_llm(model_output())
+    messages = []
+
+    response = asyncio.run(
+        llm_chain.ainvoke_llm(USER_INPUT, [SYSTEM], on_message=messages.append)
+    )
+    assert messages[-1] == response.message
+    assert llm_chain.response_cache.get(cache_key()) == model_output()
+
+
+def test_every_chunk_reaches_on_message(install_llm):
+    install_llm(model_output())
+    messages = []
+
+    response = asyncio.run(
+        llm_chain.ainvoke_llm(USER_INPUT, [SYSTEM], on_message=messages.append)
+    )
+    # The fake model streams one character at a time, plus the final message
+    assert len(messages) == len(model_output()) + 1
+    assert messages.count(response.message) > len("schedule_layers")
+
+
+class Resubmitted(Exception):
+    pass
+
+
+def test_on_message_can_stop_the_stream_after_the_message(install_llm):
+    install_llm(model_output())
+    seen = []
+
+    def on_message(message: str):
+        seen.append(message)
+        # Like Streamlit stopping the run once the layers start arriving
+        if message == "Success! Here are the layers." and len(seen) > 60:
+            raise Resubmitted
+
+    with pytest.raises(Resubmitted):
+        asyncio.run(llm_chain.ainvoke_llm(USER_INPUT, [SYSTEM], on_message=on_message))
+    assert len(seen) < len(model_output())
+    assert llm_chain.response_cache.get(cache_key()) is None
+
+
+def test_key_includes_schema_version(monkeypatch):
+    cache = ResponseCache(":memory:", mode="off")
+    key = cache.key("model", [SYSTEM])
+    monkeypatch.setattr(llm_cache, "CACHE_SCHEMA_VERSION", 0)
+    assert cache.key("model", [SYSTEM]) != key
+
+
+def test_invalid_cached_output_is_discarded(install_llm):
+    cache = install_llm(model_output())
+    cache.put(cache_key(), model_output(start="2020-01-06T09:00:00+09:00"))
+
+    assert llm_chain.cached_response(cache_key()) is None
+    assert cache.get(cache_key()) is None
+
+
+def test_invalid_cached_output_is_a_miss_in_replay_mode(install_llm, tmp_path):
+    ResponseCache(str(tmp_path / "cache.sqlite3")).put(
+        cache_key(), model_output(start="2020-01-06T09:00:00+09:00")
+    )
+    install_llm(model_output(), mode="replay")
+
+    with pytest.raises(CacheMissError):
+        llm_chain.invoke_llm(USER_INPUT, [SYSTEM])
+
+
+def test_replay_hit_needs_no_api_key(monkeypatch, tmp_path):
+    # The real client, which can't be built without a key
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    llm_chain.get_llm.cache_clear()
+    llm_chain.get_chain.cache_clear()
+    path = str(tmp_path / "cache.sqlite3")
+    ResponseCache(path).put(cache_key(), model_output())
+    monkeypatch.setattr(llm_chain, "response_cache", ResponseCache(path, mode="replay"))
+
+    response = llm_chain.invoke_llm(USER_INPUT, [SYSTEM])
+    assert [u.user_name for u in response.schedule_layers[0].users] == ["Ann", "Bob"]
+    assert llm_chain.get_llm.cache_info().currsize == 0
@@ -0,0 +1,368 @@
+import asyncio
+import json
+from datetime import datetime as dt
+from datetime import timedelta
+
+import httpx
+import pytest
+
+import pagerduty
+import pd_timezones
+import schedules_ai as sai
+from shifts import expand_layer
+
+
+class FakePagerDuty:
+    # In-memory /schedules endpoint. `script` lists what each POST for a
+    # schedule name does in turn; once it runs out, POSTs succeed.
+    def __init__(self, script=None, schedules=None):
+        self.script = {name: list(actions) for name, actions in (script or {}).items()}
+        self.schedules = list(schedules or [])
+        self.posts = []
+
+    def create(self, body: dict) -> dict:
+        schedule = {**body["schedule"], "id": f"P{len(self.schedules) + 1:05d}"}
+        self.schedules.append(schedule)
+        return schedule
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        if request.method == "GET":
+            query = request.url.params["query"]
+            matches = [s for s in self.schedules if query in s["name"]]
+            return httpx.Response(200, json={"schedules": matches})
+
+        body = json.loads(request.content)
+        self.posts.append(body)
+        actions = self.script.get(body["schedule"]["name"])
+        action = actions.pop(0) if actions else "create"
+        if action == "create":
+            return httpx.Response(201, json={"schedule": self.create(body)})
+        if isinstance(action, int):
+            return httpx.Response(action, headers={"Retry-After": "0"}, text="busy")
+        if action == "timeout after create":
+            self.create(body)
+            raise httpx.ReadTimeout("timed out", request=request)
+        if action == "malformed after create":
+            self.create(body)
+            return httpx.Response(201, text="<html>created</html>")
+        if action == "read error":
+            raise httpx.ReadError("connection reset", request=request)
+        if action == "crash":
+            raise RuntimeError("unexpected")
+        raise AssertionError(action)
+
+
+def payload(name: str) -> dict:
+    return {"schedule": {"type": "schedule", "name": name, "time_zone": "UTC"}}
+
+
+def submit(server: FakePagerDuty, payloads, **options):
+    async def run():
+        client = pagerduty.PagerDutyClient(
+            api_key="test",
+            base_url="https://pagerduty.test",
+            transport=httpx.MockTransport(server.handler),
+            backoff_seconds=0,
+            **options,
+        )
+        async with client:
+            return await client.submit_many(payloads)
+
+    return asyncio.run(run())
+
+
+def test_created():
+    server = FakePagerDuty()
+    [result] = submit(server, [payload("Ops")])
+
+    assert result.ok and result.status == "created"
+    assert result.schedule_id == server.schedules[0]["id"]
+    assert len(server.posts) == 1
+
+
+def test_rate_limit_and_server_errors_are_retried():
+    server = FakePagerDuty(script={"Ops": [429, 503, 502]})
+    [result] = submit(server, [payload("Ops")])
+
+    assert result.ok and result.status == "created"
+    assert result.attempts == 4
+    assert len(server.schedules) == 1
+
+
+def test_retries_exhausted():
+    server = FakePagerDuty(script={"Ops": [503] * 3})
+    [result] = submit(server, [payload("Ops")], retries=2)
+
+    assert not result.ok and result.status == "failed"
+    assert "HTTP 503" in result.error
+
+
+def test_client_error_is_not_retried():
+    server = FakePagerDuty(script={"Ops": [400]})
+    [result] = submit(server, [payload("Ops")])
+
+    assert result.status == "rejected"
+    assert len(server.posts) == 1
+
+
+def test_ambiguous_timeout_finds_the_created_schedule():
+    server = FakePagerDuty(script={"Ops": ["timeout after create"]})
+    [result] = submit(server, [payload("Ops")])
+
+    assert result.ok and result.status == "exists"
+    assert result.schedule_id == server.schedules[0]["id"]
+    # Found by the lookup rather than posted again
+    assert len(server.posts) == 1
+    assert len(server.schedules) == 1
+
+
+def test_unrelated_schedule_with_the_same_name_is_not_a_match():
+    existing = {"id": "POLD", "name": "Ops", "description": "Someone else's"}
+    server = FakePagerDuty(script={"Ops": ["read error"]}, schedules=[existing])
+    [result] = submit(server, [payload("Ops")])
+
+    assert result.ok and result.status == "created"
+    assert result.schedule_id != "POLD"
+    assert len(server.posts) == 2
+
+
+def test_malformed_success_body():
+    server = FakePagerDuty(script={"Ops": ["malformed after create"]})
+    [result] = submit(server, [payload("Ops")])
+
+    assert result.ok and result.schedule_id == server.schedules[0]["id"]
+
+
+def test_partial_bulk_failure_keeps_other_results(tmp_path):
+    journal = tmp_path / "journal.jsonl"
+    server = FakePagerDuty(script={"Bad": [400], "Crash": ["crash"]})
+    names = ["A", "Bad", "Crash", "B"]
+    results = submit(
+        server, [payload(name) for name in names], journal_path=str(journal)
+    )
+
+    assert [r.name for r in results] == names
+    assert [r.status for r in results] == ["created", "rejected", "failed", "created"]
+    assert "RuntimeError" in results[2].error
+    journaled = [json.loads(line)["name"] for line in journal.read_text().splitlines()]
+    assert sorted(journaled) == ["A", "B"]
+
+    # A rerun skips what was already created
+    server.script = {}
+    rerun = submit(
+        server, [payload(name) for name in names], journal_path=str(journal)
+    )
+    assert [r.status for r in rerun] == ["skipped", "created", "created", "skipped"]
+
+
+TZ = "Africa/Nairobi"
+USER_IDS = {name: f"P{name.upper()}" for name in ("Ann", "Bob", "Cat", "Dan")}
+NAMES_BY_ID = {user_id: name for name, user_id in USER_IDS.items()}
+
+
+def rotation(
+    days,
+    kind="daily_restriction",
+    users=("Ann", "Bob", "Cat"),
+    num_shifts=1,
+    time_of_day="09:00:00",
+    duration_seconds=3 * 3600,
+    first_day=dt(2030, 1, 1),
+):
+    tz = pd_timezones.get_tz(TZ)
+    hour, minute, second = (int(p) for p in time_of_day.split(":"))
+    start = tz.localize(first_day.replace(hour=hour, minute=minute, second=second))
+    return sai.ScheduleLayers(
+        timezone=TZ,
+        num_shifts=num_shifts,
+        start=start.isoformat(),
+        rotation_virtual_start=start.isoformat(),
+        rotation_turn_length_seconds=86400,
+        users=[{"user_name": name, "type": "user_reference"} for name in users],
+        restrictions=[
+            {
+                "type": kind,
+                "start_time_of_day": time_of_day,
+                "duration_seconds": duration_seconds,
+                "start_day_of_week": day,
+            }
+            for day in days
+        ],
+        everyday=len(days) == 7,
+    )
+
+
+def pagerduty_shifts(layer_payload: dict, until: dt) -> set:
+    # Who PagerDuty puts on call for one layer: the turn is counted in
+    # calendar time from rotation_virtual_start
+    tz = pd_timezones.get_tz(TZ)
+    start = dt.fromisoformat(layer_payload["start"])
+    virtual_start = dt.fromisoformat(layer_payload["rotation_virtual_start"])
+    turn_length = layer_payload["rotation_turn_length_seconds"]
+    users = [NAMES_BY_ID[u["user"]["id"]] for u in layer_payload["users"]]
+
+    shifts = set()
+    date = start.astimezone(tz).replace(tzinfo=None, hour=0, minute=0, second=0)
+    while tz.localize(date) < until:
+        for r in layer_payload["restrictions"]:
+            if r["type"] == "weekly_restriction":
+                if date.isoweekday() != r["start_day_of_week"]:
+                    continue
+            hour, minute, second = (int(p) for p in r["start_time_of_day"].split(":"))
+            shift_start = tz.localize(date.replace(hour=hour, minute=minute))
+            if shift_start < start or shift_start >= until:
+                continue
+            shift_end = shift_start + timedelta(seconds=r["duration_seconds"])
+            turn = (shift_start - virtual_start).total_seconds() // turn_length
+            # No handover in the middle of a shift
+            last = (shift_end - virtual_start).total_seconds() - 1
+            assert last // turn_length == turn
+            user = users[int(turn) % len(users)]
+            shifts.add(
+                (int(shift_start.timestamp()), int(shift_end.timestamp()), user)
+            )
+        date += timedelta(days=1)
+    return shifts
+
+
+def preview_shifts(layer: sai.ScheduleLayers, until: dt) -> set:
+    columns = expand_layer(layer, weeks=9)
+    return {
+        (int(start), int(end), columns.user_names[code])
+        for start, end, code in zip(columns.start, columns.end, columns.user_codes)
+        if start < until.timestamp()
+    }
+
+
+@pytest.mark.parametrize(
+    "layer",
+    [
+        # example_1: on call Thu and Fri, rotating each day
+        pytest.param(
+            rotation([4, 5], users=("Ann", "Bob", "Bob", "Ann", "Cat", "Cat")),
+            id="daily-some-days",
+        ),
+        pytest.param(rotation([1, 6, 7], num_shifts=2), id="daily-every-2-shifts"),
+        pytest.param(rotation(range(1, 8), num_shifts=2), id="everyday"),
+        pytest.param(rotation([4, 5], "weekly_restriction"), id="weekly"),
+        pytest.param(
+            rotation([1, 2, 3], "weekly_restriction", num_shifts=2),
+            id="weekly-starting-midweek",
+        ),
+        pytest.param(
+            rotation(
+                [6, 7],
+                "weekly_restriction",
+                time_of_day="22:00:00",
+                duration_seconds=6 * 3600,
+            ),
+            id="weekly-across-sunday-midnight",
+        ),
+        pytest.param(rotation([2, 4], users=("Dan",)), id="single-user"),
+    ],
+)
+def test_payload_pages_the_same_people_as_the_preview(layer):
+    config = sai.Config(name="Ops", timezone=TZ)
+    payload = pagerduty.build_schedule_payload(config, [layer], USER_IDS)
+    until = layer.start + timedelta(weeks=8)
+
+    paged = set()
+    for layer_payload in payload["schedule"]["schedule_layers"]:
+        paged |= pagerduty_shifts(layer_payload, until)
+    assert paged == preview_shifts(layer, until)
+    assert len({start for start, _, _ in paged}) == len(paged)
+
+
+def test_everyday_layer_payload():
+    layer = rotation(range(1, 8), users=("Ann", "Bob"), num_shifts=2)
+    config = sai.Config(name="Ops", description="Primary", timezone=TZ)
+    payload = pagerduty.build_schedule_payload(config, [layer], USER_IDS)
+
+    assert payload == {
+        "schedule": {
+            "type": "schedule",
+            "name": "Ops",
+            "time_zone": TZ,
+            "description": "Primary",
+            "schedule_layers": [
+                {
+                    "name": "Layer 1",
+                    "start": layer.start.isoformat(),
+                    "rotation_virtual_start": layer.start.isoformat(),
+                    "rotation_turn_length_seconds": 2 * 86400,
+                    "users": [
+                        {"user": {"id": "PANN", "type": "user_reference"}},
+                        {"user": {"id": "PBOB", "type": "user_reference"}},
+                    ],
+                    "restrictions": [
+                        {
+                            "type": "daily_restriction",
+                            "start_time_of_day": "09:00:00",
+                            "duration_seconds": 3 * 3600,
+                        }
+                    ],
+                }
+            ],
+        }
+    }
+
+
+def test_user_names_are_not_sent_as_ids():
+    config = sai.Config(name="Ops", timezone=TZ)
+    with pytest.raises(ValueError, match="Bob, Cat"):
+        pagerduty.build_schedule_payload(config, [rotation([1])], {"Ann": "PANN"})
+
+
+def users_handler(request: httpx.Request) -> httpx.Response:
+    directory = [
+        {"id": "PANN", "name": "Ann", "email": "ann@example.com"},
+        {"id": "PANNA", "name": "Anna", "email": "anna@example.com"},
+        {"id": "PBOB1", "name": "Bob", "email": "bob@example.com"},
+        {"id": "PBOB2", "name": "Bob", "email": "bob2@example.com"},
+    ]
+    query = request.url.params["query"].lower()
+    matches = [u for u in directory if query in u["name"].lower() + u["email"]]
+    return httpx.Response(200, json={"users": matches})
+
+
+def resolve(names):
+    async def run():
+        client = pagerduty.PagerDutyClient(
+            api_key="test",
+            base_url="https://pagerduty.test",
+            transport=httpx.MockTransport(users_handler),
+        )
+        async with client:
+            return await client.resolve_user_ids(names)
+
+    return asyncio.run(run())
+
+
+def test_resolve_user_ids():
+    assert resolve(["Ann", "anna@example.com"]) == {
+        "Ann": "PANN",
+        "anna@example.com": "PANNA",
+    }
+
+
+def test_unknown_and_ambiguous_users_are_reported():
+    with pytest.raises(pagerduty.UserLookupError) as error:
+        resolve(["Ann", "Bob", "Zed"])
+    assert "No PagerDuty user matches Zed" in str(error.value)
+    assert "several PagerDuty users match Bob" in str(error.value)
+
+
+def test_read_schedules_needs_ids_or_a_lookup(tmp_path):
+    layer = json.loads(rotation([1], users=("Ann", "Bob")).json())
+    record = {"name": "Ops", "timezone": TZ, "schedule_layers": [layer]}
+    path = tmp_path / "schedules.jsonl"
+    path.write_text(json.dumps({**record, "user_ids": {"Ann": "PANN"}}) + "\n")
+    records = list(pagerduty.read_schedules(str(path)))
+
+    with pytest.raises(pagerduty.UserLookupError, match="Bob"):
+        asyncio.run(pagerduty.build_payloads(records))
+
+    records[0].user_ids["Bob"] = "PBOB"
+    [payload] = asyncio.run(pagerduty.build_payloads(records))
+    users = payload["schedule"]["schedule_layers"][0]["users"]
+    assert [u["user"]["id"] for u in users] == ["PANN", "PBOB"]
@@ -0,0 +1,165 @@
+import json
+
+import pytest
+from langchain_core.exceptions import OutputParserException
+
+import llm_chain
+import response_repair
+from response_repair import coerce_layer, normalize_time, repair_json
+
+START = "2030-01-07T09:00:00+09:00"
+
+
+def layer_json(**overrides) -> dict:
+    layer = {
+        "timezone": "Asia/Tokyo",
+        "num_shifts": 1,
+        "start": START,
+        "rotation_virtual_start": START,
+        "rotation_turn_length_seconds": 86400,
+        "users": [
+            {"user_name": "Ann", "type": "user_reference"},
+            {"user_name": "Bob", "type": "user_reference"},
+        ],
+        "restrictions": [
+            {
+                "type": "daily_restriction",
+                "start_time_of_day": "09:00:00",
+                "duration_seconds": 28800,
+                "start_day_of_week": 1,
+            }
+        ],
+        "everyday": True,
+    }
+    layer.update(overrides)
+    return layer
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ('{"a": 1}', {"a": 1}),
+        ('```json\n{"a": 1}\n```', {"a": 1}),
+        ('Here you go: {"a": [1, 2,]}', {"a": [1, 2]}),
+        ('{"a": 1} and some trailing words', {"a": 1}),
+        ('{"a": "cut sho', {"a": "cut sho"}),
+        ('{"a": 1, "b": [1, {"c": 2', {"a": 1, "b": [1, {"c": 2}]}),
+        ('{"a": 1, "b":', {"a": 1}),
+        ('{"a": 1, "b"', {"a": 1}),
+        ('{"a": 1, ', {"a": 1}),
+        ('{"a": "quote \\" and {brace"', {"a": 'quote " and {brace'}),
+    ],
+)
+def test_repair_json(text, expected):
+    assert json.loads(repair_json(text)) == expected
+
+
+def test_repair_json_needs_an_object():
+    with pytest.raises(ValueError):
+        repair_json("Sorry, I can't help with that.")
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("9:00", "09:00:00"),
+        ("09:00:00", "09:00:00"),
+        ("9", "09:00:00"),
+        ("9:5", "09:05:00"),
+        ("9pm", "21:00:00"),
+        ("9:30 p.m.", "21:30:00"),
+        ("12am", "00:00:00"),
+        ("12 PM", "12:00:00"),
+        (9, "09:00:00"),
+        ("noon", "noon"),
+    ],
+)
+def test_normalize_time(value, expected):
+    assert normalize_time(value) == expected
+
+
+def test_coerce_layer_numeric_strings():
+    layer = layer_json(
+        num_shifts="2",
+        rotation_turn_length_seconds="86400.0",
+        everyday="true",
+    )
+    layer["restrictions"][0].update(duration_seconds="28800", start_day_of_week="1")
+    coerced = coerce_layer(layer)
+
+    assert coerced["num_shifts"] == 2
+    assert coerced["rotation_turn_length_seconds"] == 86400
+    assert coerced["everyday"] is True
+    assert coerced["restrictions"][0]["duration_seconds"] == 28800
+    assert coerced["restrictions"][0]["start_day_of_week"] == 1
+    # Anything that isn't a whole number is left for validation to reject
+    assert coerce_layer(layer_json(num_shifts="two"))["num_shifts"] == "two"
+    assert coerce_layer(layer_json(num_shifts=1.5))["num_shifts"] == 1.5
+
+
+def test_coerce_layer_users():
+    layer = layer_json(
+        users=["Ann", {"user_name": "Bob"}, {"user": {"id": "P1", "type": "user"}}]
+    )
+
+    assert coerce_layer(layer)["users"] == [
+        {"user_name": "Ann", "type": "user_reference"},
+        {"user_name": "Bob", "type": "user_reference"},
+        {"user_name": "P1", "type": "user_reference"},
+    ]
+
+
+@pytest.mark.parametrize(
+    "turn_length, expected",
+    [(86400, "daily_restriction"), (604800, "weekly_restriction")],
+)
+def test_coerce_layer_restriction_type(turn_length, expected):
+    layer = layer_json(rotation_turn_length_seconds=turn_length)
+    del layer["restrictions"][0]["type"]
+    layer["restrictions"][0]["start_time_of_day"] = "9:00"
+    restriction = coerce_layer(layer)["restrictions"][0]
+
+    assert restriction["type"] == expected
+    assert restriction["start_time_of_day"] == "09:00:00"
+
+
+def test_coerce_layer_keeps_given_restriction_type():
+    layer = layer_json(rotation_turn_length_seconds=604800)
+
+    assert coerce_layer(layer)["restrictions"][0]["type"] == "daily_restriction"
+
+
+@pytest.fixture
+def repair_stats(monkeypatch):
+    stats = response_repair.RepairStats()
+    monkeypatch.setattr(response_repair, "stats", stats)
+    return stats
+
+
+def test_parser_repairs_truncated_output(repair_stats):
+    layer = layer_json(num_shifts="1", users=["Ann", "Bob"])
+    del layer["restrictions"][0]["type"]
+    text = json.dumps({"message": "Success!", "schedule_layers": [layer]})
+    # Cut off inside the closing brackets
+    response = llm_chain.get_parser().parse_locally(text[:-3])
+
+    assert response.message == "Success!"
+    assert [u.user_name for u in response.schedule_layers[0].users] == ["Ann", "Bob"]
+    assert response.schedule_layers[0].restrictions[0].type == "daily_restriction"
+    assert repair_stats.as_dict() == {"parsed": 0, "repaired": 1, "llm_fixes": 0}
+
+
+def test_parser_counts_clean_parses(repair_stats):
+    text = json.dumps({"message": "Success!", "schedule_layers": [layer_json()]})
+    llm_chain.get_parser().parse(text)
+
+    assert repair_stats.as_dict() == {"parsed": 1, "repaired": 0, "llm_fixes": 0}
+
+
+def test_parser_without_fix_parser_raises(repair_stats):
+    parser = llm_chain.get_parser()
+
+    assert parser.parse_locally("no JSON here") is None
+    with pytest.raises(OutputParserException):
+        parser.parse("no JSON here")
+    assert repair_stats.llm_fixes == 0
@@ -0,0 +1,31 @@
+from datetime import datetime as dt
+
+import schedules_ai as sai
+
+
+def test_weekday_table_follows_reassigned_restrictions(make_layer):
+    layer = make_layer("Asia/Tokyo", dt(2030, 1, 7), "09:00:00")
+    assert layer.weekday_table.first(1).start_offset == 9 * 3600
+
+    layer.restrictions = [
+        sai.Restriction(
+            type="weekly_restriction",
+            start_time_of_day="18:30:00",
+            duration_seconds=3600,
+            start_day_of_week=2,
+        )
+    ]
+    table = layer.weekday_table
+    assert not table.matches(1)
+    assert table.first(2).start_offset == 18 * 3600 + 30 * 60
+    assert table.weekly
+    assert layer.weekday_table is table
+
+
+def test_start_times_are_parsed_once(make_layer):
+    sai.parse_time_of_day.cache_clear()
+    make_layer("Asia/Tokyo", dt(2030, 1, 7), "07:15:00")
+
+    info = sai.parse_time_of_day.cache_info()
+    assert info.misses == 1
+    assert info.hits > 0
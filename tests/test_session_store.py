@@ -0,0 +1,77 @@
+import os
+import time
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from session_store import FileSessionBackend, SessionStore, SQLiteSessionBackend
+
+
+@pytest.fixture(params=["sqlite", "files"])
+def backend(request, tmp_path):
+    if request.param == "files":
+        return FileSessionBackend(str(tmp_path / "sessions"), ttl_seconds=60)
+    return SQLiteSessionBackend(str(tmp_path / "sessions.sqlite3"), ttl_seconds=60)
+
+
+def state(text: str = "hello") -> dict:
+    return {"messages": [HumanMessage(content=text)], "schedule_layers": []}
+
+
+def test_load_returns_a_copy(backend):
+    store = SessionStore(backend)
+    store.save("s1", state())
+
+    loaded = store.load("s1")
+    loaded["messages"].append(HumanMessage(content="unsaved"))
+    loaded["schedule_layers"] = ["changed"]
+
+    assert store.load("s1") == state()
+
+
+def test_unchanged_session_is_not_rewritten(backend, monkeypatch):
+    store = SessionStore(backend)
+    store.save("s1", state())
+    writes = []
+    monkeypatch.setattr(backend, "put", lambda *args: writes.append(args))
+
+    store.save("s1", store.load("s1"))
+    assert writes == []
+    store.save("s1", state("changed"))
+    assert len(writes) == 1
+
+
+def test_hot_session_expires(backend, monkeypatch):
+    store = SessionStore(backend)
+    store.save("s1", state())
+    assert store.load("s1") == state()
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert store.load("s1") is None
+
+
+def test_file_sweep_removes_expired_and_oldest_sessions(tmp_path):
+    directory = tmp_path / "sessions"
+    backend = FileSessionBackend(str(directory), ttl_seconds=60, max_sessions=2)
+    now = time.time()
+    for age, session_id in enumerate(["a", "b", "c", "d"]):
+        backend.put(session_id, b"payload")
+        os.utime(backend._path(session_id), (now - age, now - age))
+    expired = backend._path("old")
+    backend.put("old", b"payload")
+    os.utime(expired, (now - 120, now - 120))
+
+    backend.sweep(force=True)
+    assert sorted(os.listdir(directory)) == ["a.session", "b.session"]
+
+
+def test_file_sweep_runs_on_put(tmp_path):
+    backend = FileSessionBackend(str(tmp_path), ttl_seconds=60)
+    backend.put("old", b"payload")
+    old = time.time() - 120
+    os.utime(backend._path("old"), (old, old))
+
+    backend._last_sweep = 0.0
+    backend.put("new", b"payload")
+    assert os.listdir(tmp_path) == ["new.session"]
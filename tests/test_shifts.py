@@ -0,0 +1,277 @@
+import random
+from datetime import datetime as dt
+from datetime import timedelta, timezone
+
+import numpy as np
+import pytest
+
+import schedules_ai as sai
+from shifts import (
+    ShiftColumns,
+    expand_layer,
+    expand_layers,
+    final_on_call,
+    flatten_columns,
+    on_call_index,
+)
+
+USERS = ["Ann", "Bob", "Cid", "Dee"]
+WEEKDAYS_9_TO_5 = [("daily_restriction", d, "09:00:00", 8 * 3600) for d in range(1, 6)]
+LAYERS = {
+    "everyday": [("daily_restriction", 1, "09:00:00", 8 * 3600)],
+    "weekdays": WEEKDAYS_9_TO_5,
+    "two-per-day": WEEKDAYS_9_TO_5 + [("daily_restriction", 3, "17:00:00", 3600)],
+    "weekly": [("weekly_restriction", d, "18:00:00", 14 * 3600) for d in (1, 3, 5)],
+    "weekend": [("weekly_restriction", d, "08:00:00", 30 * 3600) for d in (6, 7)],
+}
+
+
+def random_columns(rng: random.Random, count: int, num_layers: int) -> ShiftColumns:
+    start = np.array([rng.randrange(0, 100) for _ in range(count)], dtype=np.int64)
+    end = start + np.array([rng.randrange(1, 30) for _ in range(count)])
+    return ShiftColumns(
+        start=start,
+        end=end,
+        user_codes=np.array(
+            [rng.randrange(len(USERS)) for _ in range(count)], dtype=np.int32
+        ),
+        user_names=USERS,
+        layer=np.array([rng.randrange(num_layers) for _ in range(count)], np.int32),
+    )
+
+
+def brute_force_on_call(columns: ShiftColumns, t: int):
+    # Every shift covering t, ranked by layer, then start, like PagerDuty
+    covering = [
+        i for i in range(len(columns.start)) if columns.start[i] <= t < columns.end[i]
+    ]
+    if not covering:
+        return None
+    i = min(
+        covering,
+        key=lambda i: (-columns.layer[i], -columns.start[i], columns.end[i], i),
+    )
+    return columns.user_codes[i], columns.layer[i]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_flatten_matches_brute_force(seed):
+    rng = random.Random(seed)
+    columns = random_columns(rng, count=rng.randrange(1, 25), num_layers=3)
+    timeline = flatten_columns(columns)
+
+    # Sorted, non-overlapping, and adjacent pieces are never the same shift
+    assert (timeline.end > timeline.start).all()
+    assert (timeline.start[1:] >= timeline.end[:-1]).all()
+    touching = timeline.start[1:] == timeline.end[:-1]
+    assert not (
+        touching
+        & (timeline.user_codes[1:] == timeline.user_codes[:-1])
+        & (timeline.layer[1:] == timeline.layer[:-1])
+    ).any()
+
+    for t in range(-1, 131):
+        i = on_call_index(timeline, dt.fromtimestamp(t, timezone.utc))
+        found = None if i is None else (timeline.user_codes[i], timeline.layer[i])
+        assert found == brute_force_on_call(columns, t), t
+
+
+def test_flatten_without_layers_keeps_latest_start():
+    columns = ShiftColumns(
+        start=np.array([0, 10], dtype=np.int64),
+        end=np.array([30, 20], dtype=np.int64),
+        user_codes=np.array([0, 1], dtype=np.int32),
+        user_names=USERS[:2],
+    )
+    timeline = flatten_columns(columns)
+
+    assert timeline.start.tolist() == [0, 10, 20]
+    assert timeline.end.tolist() == [10, 20, 30]
+    assert [USERS[c] for c in timeline.user_codes] == ["Ann", "Bob", "Ann"]
+
+
+def test_on_call_index_between_shifts():
+    timeline = ShiftColumns(
+        start=np.array([0, 20], dtype=np.int64),
+        end=np.array([10, 30], dtype=np.int64),
+        user_codes=np.array([0, 1], dtype=np.int32),
+        user_names=USERS[:2],
+        layer=np.array([0, 0], dtype=np.int32),
+    )
+
+    def at(t):
+        return on_call_index(timeline, dt.fromtimestamp(t, timezone.utc))
+
+    assert [at(t) for t in (-1, 0, 9, 10, 19, 20, 29, 30)] == [
+        None,
+        0,
+        0,
+        None,
+        None,
+        1,
+        1,
+        None,
+    ]
+
+
+def brute_force_final_on_call(layers, when: dt):
+    # The latest layer with a shift at `when` wins
+    for layer in reversed(layers):
+        shift = layer.on_call_at(when)
+        if shift is not None:
+            return shift.user_name
+    return None
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_final_on_call_matches_layers(seed, make_layer):
+    rng = random.Random(seed)
+    first_day = dt(2030, 4, 1)
+    layers = []
+    for _ in range(3):
+        layer = make_layer(
+            "America/New_York",
+            first_day + timedelta(days=rng.randrange(3)),
+            f"{rng.randrange(24):02d}:{rng.choice([0, 30]):02d}:00",
+            duration_seconds=rng.randrange(1, 40) * 3600,
+            users=rng.sample(USERS, rng.randrange(1, 4)),
+        )
+        if rng.random() < 0.5:
+            # Cut the layer off part way through a shift
+            end = layer.start + timedelta(days=rng.randrange(2, 8), hours=5)
+            layer = layer.copy(update={"end": end})
+        layers.append(layer)
+
+    start = layers[0].start - timedelta(days=1)
+    for _ in range(200):
+        when = start + timedelta(seconds=rng.randrange(14 * 86400))
+        assert final_on_call(layers, when, weeks=3) == brute_force_final_on_call(
+            layers, when
+        ), when
+
+
+def test_final_on_call_stops_at_layer_end(make_layer):
+    base = make_layer("UTC", dt(2030, 4, 1), "09:00:00", users=("Ann",))
+    ending = make_layer("UTC", dt(2030, 4, 1), "09:00:00", users=("Bob",))
+    ending = ending.copy(update={"end": ending.start + timedelta(days=2, hours=3)})
+    layers = [base, ending]
+
+    def who(day: int, hour: int):
+        return final_on_call(layers, dt(2030, 4, day, hour, tzinfo=timezone.utc))
+
+    assert who(1, 10) == "Bob"
+    assert who(3, 11) == "Bob"
+    # Bob's last shift is cut short at noon, and none start after it
+    assert who(3, 13) == "Ann"
+    assert who(4, 10) == "Ann"
+    assert who(4, 8) is None
+
+
+def test_expand_layers_tags_each_layer(make_layer):
+    layers = [
+        make_layer("UTC", dt(2030, 4, 1), "09:00:00"),
+        make_layer("UTC", dt(2030, 4, 1), "21:00:00", users=("Cid", "Ann")),
+    ]
+    columns = expand_layers(layers, weeks=1)
+
+    assert columns.user_names == ["Ann", "Bob", "Cid"]
+    assert sorted(set(columns.layer.tolist())) == [0, 1]
+    assert [columns.user_names[c] for c in columns.user_codes[columns.layer == 1]][
+        :3
+    ] == ["Cid", "Ann", "Cid"]
+
+
+def layer_with(restrictions, timezone, num_shifts=1, users=("Ann", "Bob", "Cid")):
+    kind, _, time_of_day, _ = restrictions[0]
+    hour, minute, _ = (int(p) for p in time_of_day.split(":"))
+    start = dt(2030, 4, 2, hour, minute).isoformat()
+    return sai.ScheduleLayers(
+        timezone=timezone,
+        num_shifts=num_shifts,
+        start=start,
+        rotation_virtual_start=start,
+        rotation_turn_length_seconds=86400 if kind == "daily_restriction" else 604800,
+        users=[{"user_name": name, "type": "user_reference"} for name in users],
+        restrictions=[
+            {
+                "type": kind,
+                "start_day_of_week": day,
+                "start_time_of_day": time_of_day,
+                "duration_seconds": duration,
+            }
+            for kind, day, time_of_day, duration in restrictions
+        ],
+        everyday=len(restrictions) == 1 and kind == "daily_restriction",
+    )
+
+
+def reference_rows(layer, weeks: int) -> list:
+    # The day-by-day loop expand_layer replaced. It stepped 24 hours at a time
+    # and ignored num_shifts, so it only agrees in zones without DST.
+    user_sequence = [user.user_name for user in layer.users]
+    rows = []
+    current_date = layer.start
+    end_date = current_date + timedelta(weeks=weeks)
+    user_index = 0
+    while current_date <= end_date:
+        for restriction in layer.restrictions:
+            if current_date.isoweekday() == restriction.start_day_of_week:
+                shift_end = current_date + timedelta(
+                    seconds=restriction.duration_seconds
+                )
+                rows.append((user_sequence[user_index], current_date, shift_end))
+                if restriction.type == "daily_restriction":
+                    user_index = (user_index + 1) % len(user_sequence)
+        if restriction.type == "weekly_restriction" and current_date.weekday() == 6:
+            user_index = (user_index + 1) % len(user_sequence)
+        current_date += timedelta(days=1)
+    return [
+        (name, int(start.timestamp()), int(end.timestamp()))
+        for name, start, end in rows
+    ]
+
+
+def expanded_rows(layer, weeks: int) -> list:
+    columns = expand_layer(layer, weeks)
+    return list(
+        zip(
+            [columns.user_names[c] for c in columns.user_codes],
+            columns.start.tolist(),
+            columns.end.tolist(),
+        )
+    )
+
+
+@pytest.mark.parametrize("timezone", ["Africa/Nairobi", "Asia/Kolkata"])
+@pytest.mark.parametrize("name", LAYERS)
+def test_expand_layer_matches_reference_loop(name, timezone):
+    layer = layer_with(LAYERS[name], timezone)
+
+    assert expanded_rows(layer, weeks=52) == reference_rows(layer, weeks=52)
+
+
+@pytest.mark.parametrize("zone", ["America/New_York", "Australia/Sydney"])
+@pytest.mark.parametrize("num_shifts", [1, 3])
+@pytest.mark.parametrize("name", LAYERS)
+def test_expand_layer_matches_iter_shifts(name, num_shifts, zone):
+    layer = layer_with(LAYERS[name], zone, num_shifts=num_shifts)
+    layer = layer.copy(update={"end": layer.start + timedelta(weeks=30, hours=3)})
+    weeks = 52
+    after_last_day = layer.day_start_seconds(np.array([weeks * 7 + 1]))[0]
+    shifts = layer.iter_shifts(
+        layer.start, dt.fromtimestamp(int(after_last_day), timezone.utc)
+    )
+
+    assert expanded_rows(layer, weeks) == [
+        (shift.user_name, int(shift.start.timestamp()), int(shift.end.timestamp()))
+        for shift in shifts
+    ]
+
+
+def test_expand_layer_truncates_to_whole_seconds(make_layer):
+    layer = make_layer("Africa/Nairobi", dt(2030, 4, 2), "09:00:00")
+    layer = layer.copy(update={"start": layer.start.replace(microsecond=500000)})
+    columns = expand_layer(layer, weeks=1)
+
+    assert columns.start[0] == int(layer.start.timestamp())
+    assert (columns.start % 60 == 0).all()